@@ -0,0 +1,31 @@
+from django.contrib import admin, messages
+
+from .models import Invoice
+from .purge import purge_invoices
+
+
+@admin.register(Invoice)
+class InvoiceAdmin(admin.ModelAdmin):
+    list_display = ("INVOICEID", "CUSTNAME", "CUSTEMAIL", "NETAMT", "EMAILSENT", "PRCSDATE")
+    list_filter = ("EMAILSENT",)
+    search_fields = ("CUSTNAME", "CUSTEMAIL")
+    date_hierarchy = "PRCSDATE"
+    actions = ["purge_selected", "purge_selected_restore_stock"]
+
+    def _purge(self, request, queryset, restore):
+        # Batched raw deletes; the stock "Delete selected" action collects and
+        # cascades every item row first.
+        totals = purge_invoices(queryset, restore=restore)
+        self.message_user(
+            request,
+            f"Purged {totals['invoices']} invoices and {totals['items']} items.",
+            messages.SUCCESS,
+        )
+
+    @admin.action(description="Purge selected invoices", permissions=["delete"])
+    def purge_selected(self, request, queryset):
+        self._purge(request, queryset, restore=False)
+
+    @admin.action(description="Purge selected invoices and restore stock", permissions=["delete"])
+    def purge_selected_restore_stock(self, request, queryset):
+        self._purge(request, queryset, restore=True)
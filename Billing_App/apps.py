@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class BillingAppConfig(AppConfig):
     name = "Billing_App"
+
+    def ready(self):
+        from . import signals
+
+        post_migrate.connect(signals.ensure_search_index, sender=self)
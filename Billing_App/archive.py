@@ -0,0 +1,178 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q, Value
+from django.http import Http404
+from django.utils import timezone
+
+from .filters import filter_invoices, local_day_start, parse_date
+from .models import (
+    ArchivedInvoice,
+    ArchivedInvoiceItem,
+    EmailOutbox,
+    IdempotencyKey,
+    Invoice,
+    InvoiceItem,
+)
+
+# Hot/cold split: settled invoices older than the cutoff move, with their items,
+# to TRANSACTION_MASTER_ARCHIVE / TRANSACTION_DETAILS_ARCHIVE. The daily sales
+# summaries keep their history; reads fall through to the archive by ID or when
+# a date filter reaches back past the newest archived invoice.
+
+INVOICE_FIELDS = (
+    "INVOICEID",
+    "CUSTNAME",
+    "CUSTEMAIL",
+    "GROSSAMT",
+    "TAXAMT",
+    "NETAMT",
+    "ROUNDEDPAYABLE",
+    "PAIDAMT",
+    "BALANCEAMT",
+    "RECEIVED_DENOMS",
+    "CHANGE_DENOMS",
+    "EMAILSENT",
+    "EMAILFAILCOUNT",
+    "EMAILLASTERROR",
+    "RECEIPTVERSION",
+    "PRCSDATE",
+)
+ITEM_FIELDS = (
+    "INVOICEITEMID",
+    "INVOICE_id",
+    "PRODUCT_id",
+    "UNITPRICE",
+    "TAXPERCENT",
+    "QTY",
+    "LINESUBTOTAL",
+    "LINETAX",
+    "LINETOTAL",
+    "PRCSDATE",
+)
+LIST_FIELDS = (
+    "INVOICEID",
+    "CUSTNAME",
+    "CUSTEMAIL",
+    "NETAMT",
+    "PAIDAMT",
+    "BALANCEAMT",
+    "PRCSDATE",
+)
+
+
+def archive_cutoff(days=None):
+    # Start of the local day `days` ago: whole days are archived, so a summary
+    # day is either entirely live or entirely archived.
+    days = settings.BILLING_ARCHIVE_AFTER_DAYS if days is None else days
+    return local_day_start(timezone.localdate() - timedelta(days=days))
+
+
+def archivable_invoices(cutoff):
+    # Settled invoices only: a pending outbox row or an email that may still be
+    # retried keeps the invoice live, where the mailer looks for it.
+    pending_email = Q(EMAILSENT=False, EMAILFAILCOUNT__lt=settings.BILLING_EMAIL_MAX_FAILURES)
+    return (
+        Invoice.objects.filter(PRCSDATE__lt=cutoff)
+        .exclude(pending_email)
+        .exclude(email_outbox__STATUS=0)
+        .order_by("INVOICEID")
+    )
+
+
+def archive_batch(cutoff, batch_size):
+    # One short transaction per batch, so checkouts only ever wait for a
+    # single batch. Returns (invoices moved, items moved).
+    with transaction.atomic():
+        invoice_rows = list(archivable_invoices(cutoff).values(*INVOICE_FIELDS)[:batch_size])
+        if not invoice_rows:
+            return 0, 0
+        invoice_ids = [row["INVOICEID"] for row in invoice_rows]
+        item_rows = list(
+            InvoiceItem.objects.filter(INVOICE_id__in=invoice_ids)
+            .order_by()
+            .values(*ITEM_FIELDS)
+        )
+
+        ArchivedInvoice.objects.bulk_create([ArchivedInvoice(**row) for row in invoice_rows])
+        ArchivedInvoiceItem.objects.bulk_create(
+            [ArchivedInvoiceItem(**row) for row in item_rows]
+        )
+
+        # Children first, so deleting the invoices finds nothing left to cascade.
+        EmailOutbox.objects.filter(INVOICE_id__in=invoice_ids).delete()
+        IdempotencyKey.objects.filter(INVOICE_id__in=invoice_ids).delete()
+        InvoiceItem.objects.filter(INVOICE_id__in=invoice_ids).delete()
+        Invoice.objects.filter(INVOICEID__in=invoice_ids).delete()
+    return len(invoice_rows), len(item_rows)
+
+
+def archive_invoices(cutoff, batch_size=None, max_batches=None, pause=0.0, progress=None):
+    batch_size = batch_size or settings.BILLING_ARCHIVE_BATCH_SIZE
+    totals = {"invoices": 0, "items": 0, "batches": 0}
+    while max_batches is None or totals["batches"] < max_batches:
+        invoices, items = archive_batch(cutoff, batch_size)
+        if not invoices:
+            break
+        totals["invoices"] += invoices
+        totals["items"] += items
+        totals["batches"] += 1
+        if progress:
+            progress(totals)
+        if pause:
+            # Leaves the write lock free for checkouts between batches.
+            time.sleep(pause)
+    return totals
+
+
+def archive_boundary():
+    # Creation time of the newest archived invoice; None when nothing is archived.
+    return ArchivedInvoice.objects.aggregate(newest=Max("PRCSDATE"))["newest"]
+
+
+async def aarchive_boundary():
+    return (await ArchivedInvoice.objects.aaggregate(newest=Max("PRCSDATE")))["newest"]
+
+
+def reaches_archive(filters, boundary):
+    if boundary is None:
+        return False
+    from_date = parse_date(filters.get("from_date", ""))
+    return from_date is not None and local_day_start(from_date) <= boundary
+
+
+def invoice_list_queryset(filters, boundary):
+    # The live invoices, or live plus archived rows (as dicts the list template
+    # reads the same way) when the date filter reaches into the archive.
+    live = filter_invoices(Invoice.objects.all(), filters)
+    if not reaches_archive(filters, boundary):
+        return live, False
+    archived = filter_invoices(ArchivedInvoice.objects.all(), filters)
+    combined = (
+        live.order_by()
+        .values(*LIST_FIELDS, archived=Value(False))
+        .union(archived.order_by().values(*LIST_FIELDS, archived=Value(True)), all=True)
+        .order_by("-PRCSDATE", "-INVOICEID")
+    )
+    return combined, True
+
+
+def get_invoice(pk):
+    # Live invoice, or its archived copy; both have `items` with PRODUCT.
+    invoice = Invoice.objects.filter(pk=pk).first()
+    if invoice is None:
+        invoice = ArchivedInvoice.objects.filter(pk=pk).first()
+    if invoice is None:
+        raise Http404("No Invoice matches the given query.")
+    return invoice
+
+
+async def aget_invoice(pk):
+    invoice = await Invoice.objects.filter(pk=pk).afirst()
+    if invoice is None:
+        invoice = await ArchivedInvoice.objects.filter(pk=pk).afirst()
+    if invoice is None:
+        raise Http404("No Invoice matches the given query.")
+    return invoice
@@ -0,0 +1,99 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.shortcuts import render
+from django.utils.safestring import mark_safe
+
+from .archive import aarchive_boundary, aget_invoice, invoice_list_queryset
+from .conditional import add_validators, detail_context, not_modified, receipt_fragment_key
+from .filters import invoice_filter_params
+from .models import Customer, Product
+from .pagination import ainvoice_total_count, akeyset_invoice_page
+from .receipts import get_receipt
+from .search import search_customers
+from .views import _get_per_page
+
+# Async twins of the read-only list/detail views, enabled by
+# BILLING_ASYNC_VIEWS under ASGI. Everything the template touches is loaded
+# here with the async ORM: a lazy queryset reaching the template would raise
+# SynchronousOnlyOperation.
+
+
+async def _apage(queryset, per_page, number):
+    # Paginator is sync-only; give it the count up front and materialise the
+    # page slice asynchronously.
+    paginator = Paginator(queryset, per_page)
+    paginator.count = await queryset.acount()
+    page = paginator.get_page(number)
+    page.object_list = [obj async for obj in page.object_list]
+    return page
+
+
+async def invoice_index(request):
+    filters = invoice_filter_params(request.GET)
+    per_page = _get_per_page(request)
+    boundary = await aarchive_boundary() if filters["from_date"] else None
+    # Building the queryset may probe the search index once per process.
+    invoice_qs, with_archive = await sync_to_async(invoice_list_queryset)(filters, boundary)
+
+    context = dict(filters, per_page=per_page)
+    cursor = request.GET.get("cursor", "").strip()
+    if not with_archive and (cursor or settings.BILLING_INVOICE_PAGINATION == "cursor"):
+        page_obj = await akeyset_invoice_page(invoice_qs, cursor, per_page)
+        page_obj.total_count, page_obj.approximate = await ainvoice_total_count(
+            invoice_qs, filters
+        )
+        context["keyset"] = True
+    else:
+        page_obj = await _apage(invoice_qs, per_page, request.GET.get("page"))
+    context["invoices"] = page_obj
+    return render(request, "Invoice/Invoice_Index.html", context)
+
+
+async def invoice_detail(request, pk):
+    invoice = await aget_invoice(pk)
+    response = not_modified(request, invoice)
+    if response is not None:
+        return response
+
+    # The {% cache %} tag can't run async queries on a miss, so the fragment is
+    # read here and passed in as the receipt: if it expires before the tag looks
+    # again, the tag re-caches the same HTML instead of an empty receipt.
+    receipt = await cache.aget(receipt_fragment_key(invoice))
+    if receipt is None:
+        items = invoice.items.select_related("PRODUCT")
+        receipt = await sync_to_async(get_receipt)(invoice, items)
+    else:
+        receipt = mark_safe(receipt.strip())
+    response = render(request, "Invoice/Invoice_Detail.html", detail_context(invoice, receipt))
+    return add_validators(response, invoice)
+
+
+async def product_index(request):
+    search_query = request.GET.get("search", "").strip()
+    per_page = _get_per_page(request)
+    product_qs = Product.objects.all()
+
+    if search_query:
+        product_qs = product_qs.filter(
+            Q(PRODNAME__icontains=search_query) | Q(PRODCODE__icontains=search_query)
+        )
+
+    page_obj = await _apage(product_qs, per_page, request.GET.get("page"))
+    context = {"products": page_obj, "search_query": search_query, "per_page": per_page}
+    return render(request, "ProductMaster/Product_Index.html", context)
+
+
+async def customer_index(request):
+    search_query = request.GET.get("search", "").strip()
+    per_page = _get_per_page(request)
+    customer_qs = Customer.objects.all()
+
+    if search_query:
+        customer_qs = await sync_to_async(search_customers)(customer_qs, search_query)
+
+    page_obj = await _apage(customer_qs, per_page, request.GET.get("page"))
+    context = {"customers": page_obj, "search_query": search_query, "per_page": per_page}
+    return render(request, "CustomerMaster/Customer_Index.html", context)
@@ -0,0 +1,198 @@
+from decimal import ROUND_DOWN, ROUND_HALF_EVEN, Context, Decimal
+
+# Built once at import so the hot loops never construct Decimal("0.00") again.
+CENTS = Decimal("0.00")
+ZERO = Decimal("0.00")
+HUNDRED = Decimal("100")
+MONEY_CONTEXT = Context(prec=28, rounding=ROUND_HALF_EVEN)
+
+_quantize = Decimal.quantize
+
+
+def to_money(value):
+    return _quantize(value, CENTS, context=MONEY_CONTEXT)
+
+
+def price_line(unit_price, tax_percent, qty):
+    unit_price = _quantize(unit_price, CENTS, context=MONEY_CONTEXT)
+    tax_percent = _quantize(tax_percent, CENTS, context=MONEY_CONTEXT)
+    line_subtotal = _quantize(unit_price * qty, CENTS, context=MONEY_CONTEXT)
+    line_tax = _quantize(line_subtotal * tax_percent / HUNDRED, CENTS, context=MONEY_CONTEXT)
+    line_total = _quantize(line_subtotal + line_tax, CENTS, context=MONEY_CONTEXT)
+    return unit_price, tax_percent, line_subtotal, line_tax, line_total
+
+
+def price_cart(lines):
+    # lines: iterable of (product, qty); product only needs PRODPRI and PRODTAXPRE.
+    gross_amount = ZERO
+    tax_amount = ZERO
+    items = []
+    for product, qty in lines:
+        unit_price, tax_percent, line_subtotal, line_tax, line_total = price_line(
+            product.PRODPRI, product.PRODTAXPRE, qty
+        )
+        gross_amount += line_subtotal
+        tax_amount += line_tax
+        items.append(
+            {
+                "product": product,
+                "qty": qty,
+                "unit_price": unit_price,
+                "tax_percent": tax_percent,
+                "line_subtotal": line_subtotal,
+                "line_tax": line_tax,
+                "line_total": line_total,
+            }
+        )
+
+    gross_amount = _quantize(gross_amount, CENTS, context=MONEY_CONTEXT)
+    tax_amount = _quantize(tax_amount, CENTS, context=MONEY_CONTEXT)
+    net_amount = _quantize(gross_amount + tax_amount, CENTS, context=MONEY_CONTEXT)
+    return {
+        "items": items,
+        "gross_amount": gross_amount,
+        "tax_amount": tax_amount,
+        "net_amount": net_amount,
+        "rounded_payable": round_payable(net_amount),
+    }
+
+
+def price_carts(carts):
+    return [price_cart(lines) for lines in carts]
+
+
+def round_payable(net_amount):
+    return _quantize(
+        net_amount.to_integral_value(rounding=ROUND_DOWN), CENTS, context=MONEY_CONTEXT
+    )
+
+
+def tendered_amount(denomination_counts):
+    # denomination_counts: mapping of note value -> count. Notes are whole
+    # numbers, so the sum is done in ints and converted once.
+    total = 0
+    for value, count in denomination_counts.items():
+        total += int(value) * count
+    return _quantize(Decimal(total), CENTS, context=MONEY_CONTEXT)
+
+
+def balance_due(paid_amount, rounded_payable):
+    return _quantize(paid_amount - rounded_payable, CENTS, context=MONEY_CONTEXT)
+
+
+def greedy_change(amount, denomination_values):
+    change_denoms = {}
+    remaining = int(amount)
+    for value in sorted(denomination_values, reverse=True):
+        value = int(value)
+        if value <= 0:
+            continue
+        count = remaining // value
+        if count > 0:
+            change_denoms[str(value)] = count
+            remaining -= count * value
+
+    if remaining > 0:
+        change_denoms["remaining"] = remaining
+    return change_denoms
+
+
+class ChangeTable:
+    # Minimal-note change for one denomination set. Canonical sets (greedy is
+    # provably optimal) skip the table; other sets get a DP table covering every
+    # amount an optimal answer can pay with notes below the largest one, so each
+    # lookup is O(notes) regardless of the amount.
+
+    def __init__(self, denomination_values):
+        self.values = tuple(sorted({int(value) for value in denomination_values if int(value) > 0}))
+        self.largest = self.values[-1] if self.values else 0
+        second = self.values[-2] if len(self.values) > 1 else 1
+        self.limit = max((self.largest - 1) * second, self.largest - 1)
+        self.canonical = self._is_canonical()
+        self.counts = None
+        self.last_note = None
+        if not self.canonical:
+            self.counts, self.last_note = _build_change_table(self.values, self.limit)
+
+    def _is_canonical(self):
+        if not self.values:
+            return True
+        if self.values[0] != 1:
+            return False
+        if len(self.values) < 3:
+            return True
+        # Kozen & Zaks: the smallest counterexample to greedy, if any, is below
+        # the sum of the two largest notes.
+        bound = self.values[-1] + self.values[-2]
+        counts, _ = _build_change_table(self.values, bound)
+        for amount in range(1, bound + 1):
+            if _greedy_note_count(amount, self.values) != counts[amount]:
+                return False
+        return True
+
+    def make_change(self, amount):
+        amount = int(amount)
+        if amount <= 0:
+            return {}
+        if not self.values:
+            return {"remaining": amount}
+        if self.canonical:
+            return greedy_change(amount, self.values)
+
+        payable = amount
+        while payable > 0 and self._note_count(payable) is None:
+            payable -= 1
+
+        change_denoms = {}
+        if payable > 0:
+            notes = {}
+            bulk = 0
+            if payable > self.limit:
+                bulk = (payable - self.limit + self.largest - 1) // self.largest
+            if bulk:
+                notes[self.largest] = bulk
+            rest = payable - bulk * self.largest
+            last_note = self.last_note
+            while rest > 0:
+                value = last_note[rest]
+                notes[value] = notes.get(value, 0) + 1
+                rest -= value
+            for value in sorted(notes, reverse=True):
+                change_denoms[str(value)] = notes[value]
+
+        if amount > payable:
+            change_denoms["remaining"] = amount - payable
+        return change_denoms
+
+    def _note_count(self, amount):
+        bulk = 0
+        if amount > self.limit:
+            bulk = (amount - self.limit + self.largest - 1) // self.largest
+        count = self.counts[amount - bulk * self.largest]
+        if count == _UNREACHABLE:
+            return None
+        return count + bulk
+
+
+_UNREACHABLE = 1 << 62
+
+
+def _build_change_table(values, limit):
+    counts = [_UNREACHABLE] * (limit + 1)
+    last_note = [0] * (limit + 1)
+    counts[0] = 0
+    for value in values:
+        for amount in range(value, limit + 1):
+            candidate = counts[amount - value] + 1
+            if candidate < counts[amount]:
+                counts[amount] = candidate
+                last_note[amount] = value
+    return counts, last_note
+
+
+def _greedy_note_count(amount, ascending_values):
+    count = 0
+    for value in reversed(ascending_values):
+        count += amount // value
+        amount %= value
+    return count
@@ -0,0 +1,21 @@
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # A fresh time-based seed keeps an evicted counter from restarting at a
+        # value some process still holds derived data for.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+        return cache.get(key)
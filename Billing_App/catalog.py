@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache_versions import bump_version, get_version
+from .models import Customer, Denomination, Product
+
+CATALOG_VERSION_KEY = "billing:catalog-version"
+CATALOG_KEY_PREFIX = "billing:catalog:"
+LOCAL_CATALOG_SIZE = 4
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+_stats = {"local_hits": 0, "shared_hits": 0, "misses": 0}
+
+
+def get_catalog_version():
+    return get_version(CATALOG_VERSION_KEY)
+
+
+def bump_catalog_version():
+    return bump_version(CATALOG_VERSION_KEY)
+
+
+def _load_catalog():
+    return {
+        "customers": list(Customer.objects.filter(DISPSTATUS=0).order_by("CUSTNAME")),
+        "products": list(Product.objects.filter(DISPSTATUS=0).order_by("PRODNAME")),
+        "denominations": list(
+            Denomination.objects.filter(DISPSTATUS=0).order_by("-DENOMVALUE")
+        ),
+    }
+
+
+def get_catalog():
+    # Active customers, products and denominations for invoice entry. Stock shown
+    # from here is a hint only; checkout re-checks it against the database.
+    version = get_catalog_version()
+    timeout = settings.BILLING_CATALOG_CACHE_TIMEOUT
+    now = time.monotonic()
+
+    with _local_lock:
+        entry = _local.get(version)
+        if entry is not None and entry[0] > now:
+            _local.move_to_end(version)
+            _stats["local_hits"] += 1
+            return entry[1]
+
+    shared_key = f"{CATALOG_KEY_PREFIX}{version}"
+    catalog = cache.get(shared_key)
+    if catalog is not None:
+        _stats["shared_hits"] += 1
+    else:
+        _stats["misses"] += 1
+        catalog = _load_catalog()
+        cache.set(shared_key, catalog, timeout)
+
+    with _local_lock:
+        _local[version] = (now + timeout, catalog)
+        _local.move_to_end(version)
+        while len(_local) > LOCAL_CATALOG_SIZE:
+            _local.popitem(last=False)
+    return catalog
+
+
+def catalog_stats():
+    stats = dict(_stats)
+    lookups = stats["local_hits"] + stats["shared_hits"] + stats["misses"]
+    stats["hit_ratio"] = (
+        (stats["local_hits"] + stats["shared_hits"]) / lookups if lookups else 0.0
+    )
+    stats["local_entries"] = len(_local)
+    return stats
+
+
+def clear_local_catalog():
+    with _local_lock:
+        _local.clear()
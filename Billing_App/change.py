@@ -0,0 +1,50 @@
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+
+from .billing import ChangeTable
+from .cache_versions import bump_version, get_version
+from .models import Denomination
+
+DENOMINATION_VERSION_KEY = "billing:denomination-version"
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_denomination_version():
+    return get_version(DENOMINATION_VERSION_KEY)
+
+
+def bump_denomination_version():
+    return bump_version(DENOMINATION_VERSION_KEY)
+
+
+@lru_cache(maxsize=8)
+def _table_for_values(values):
+    return ChangeTable(values)
+
+
+def get_change_table():
+    # The version bump only reaches other processes through a shared cache; the
+    # timeout bounds how long a process without one keeps a retired table.
+    version = get_denomination_version()
+    now = time.monotonic()
+    entry = _tables.get(version)
+    if entry is not None and now - entry[0] < settings.BILLING_CHANGE_TABLE_TIMEOUT:
+        return entry[1]
+
+    values = tuple(
+        sorted(Denomination.objects.filter(DISPSTATUS=0).values_list("DENOMVALUE", flat=True))
+    )
+    table = _table_for_values(values)
+    with _tables_lock:
+        _tables.clear()
+        _tables[version] = (now, table)
+    return table
+
+
+def make_change(amount):
+    return get_change_table().make_change(amount)
@@ -0,0 +1,262 @@
+import hashlib
+import json
+
+from django.db import IntegrityError, transaction
+
+from . import metrics
+from .billing import balance_due, price_cart, tendered_amount
+from .change import make_change
+from .models import Customer, IdempotencyKey, Invoice, InvoiceItem, Product
+from .outbox import enqueue_invoice_email
+from .reports import record_invoice
+from .stock import InsufficientStockError, decrement_stock, find_stock_shortfalls
+
+
+class CheckoutError(Exception):
+    # status is the HTTP status the JSON API answers with.
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class IdempotencyConflict(CheckoutError):
+    def __init__(self, message):
+        super().__init__(message, status=422)
+
+
+def build_product_qty_map(line_inputs):
+    # line_inputs: (product_id, quantity) pairs as submitted. Blank pairs are
+    # skipped; repeated products are merged.
+    product_qty_map = {}
+    for product_id, quantity in line_inputs:
+        product_id = str(product_id).strip()
+        quantity = str(quantity).strip()
+        if not product_id and not quantity:
+            continue
+        if not product_id or not quantity:
+            raise CheckoutError("Each bill row needs product and quantity.")
+        try:
+            pid = int(product_id)
+            qty = int(quantity)
+        except ValueError:
+            raise CheckoutError("Invalid product or quantity value.")
+        if qty <= 0:
+            raise CheckoutError("Quantity must be greater than zero.")
+        product_qty_map[pid] = product_qty_map.get(pid, 0) + qty
+
+    if not product_qty_map:
+        raise CheckoutError("Add at least one product line.")
+    return product_qty_map
+
+
+def load_products(product_qty_map):
+    product_map = {
+        item.PRODID: item for item in Product.objects.filter(PRODID__in=product_qty_map.keys())
+    }
+    if len(product_map) != len(product_qty_map):
+        raise CheckoutError("One or more selected products do not exist.")
+
+    for pid, qty in product_qty_map.items():
+        product = product_map[pid]
+        if product.DISPSTATUS != 0:
+            raise CheckoutError(f"{product.PRODNAME} is disabled.")
+        if qty > product.PROAVASTOCK:
+            raise CheckoutError(
+                f"Insufficient stock for {product.PRODNAME}. "
+                f"Available stock is {product.PROAVASTOCK}.",
+                status=409,
+            )
+    return product_map
+
+
+def build_received_denoms(denominations, raw_counts):
+    # raw_counts maps an active denomination value (as a string) to the count
+    # submitted for it; missing values count as zero.
+    active = {str(denom.DENOMVALUE) for denom in denominations}
+    unknown = sorted(set(raw_counts) - active)
+    if unknown:
+        raise CheckoutError(f"Unknown denomination {unknown[0]}.")
+
+    received_denoms = {}
+    for denom in denominations:
+        value = str(denom.DENOMVALUE)
+        raw_count = str(raw_counts.get(value, "0")).strip() or "0"
+        try:
+            count = int(raw_count)
+        except ValueError:
+            raise CheckoutError(f"Invalid denomination count for {denom.DENOMVALUE}.")
+        if count < 0:
+            raise CheckoutError("Denomination count cannot be negative.")
+        received_denoms[value] = count
+    return received_denoms
+
+
+def request_hash(customer_name, customer_email, product_qty_map, received_denoms):
+    canonical = json.dumps(
+        [
+            customer_name,
+            customer_email,
+            sorted(product_qty_map.items()),
+            sorted((value, count) for value, count in received_denoms.items() if count),
+        ]
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _replay(idempotency_key, fingerprint):
+    existing = (
+        IdempotencyKey.objects.select_related("INVOICE").filter(KEY=idempotency_key).first()
+    )
+    if existing is None:
+        return None
+    if existing.REQUESTHASH != fingerprint:
+        raise IdempotencyConflict("Idempotency key was already used for a different request.")
+    return existing.INVOICE
+
+
+def place_order(
+    customer_name,
+    customer_email,
+    line_inputs,
+    denominations,
+    raw_denom_counts,
+    idempotency_key=None,
+):
+    # Shared by the invoice form and the JSON API. Returns (invoice, items,
+    # replayed). With an idempotency key, a repeat of an earlier request
+    # returns that request's invoice instead of billing again.
+    if not customer_name:
+        raise CheckoutError("Customer name is required.")
+    if not customer_email:
+        raise CheckoutError("Customer email is required.")
+
+    product_qty_map = build_product_qty_map(line_inputs)
+    received_denoms = build_received_denoms(denominations, raw_denom_counts)
+
+    fingerprint = ""
+    if idempotency_key:
+        fingerprint = request_hash(customer_name, customer_email, product_qty_map, received_denoms)
+        invoice = _replay(idempotency_key, fingerprint)
+        if invoice is not None:
+            return invoice, list(invoice.items.select_related("PRODUCT")), True
+
+    product_map = load_products(product_qty_map)
+    paid_amount = tendered_amount(received_denoms)
+    cart = price_cart((product_map[pid], qty) for pid, qty in product_qty_map.items())
+    balance_amount = balance_due(paid_amount, cart["rounded_payable"])
+    if balance_amount < 0:
+        raise CheckoutError("Cash paid by customer is less than rounded payable amount.")
+    change_denoms = make_change(balance_amount)
+
+    try:
+        with transaction.atomic():
+            key = None
+            if idempotency_key:
+                # Claimed before touching stock: a concurrent retry with the same
+                # key waits on the unique index and then fails here, rolling
+                # back without decrementing anything.
+                key = IdempotencyKey.objects.create(KEY=idempotency_key, REQUESTHASH=fingerprint)
+
+            decrement_stock(product_qty_map)
+
+            # Queryset writes send no post_save, so walk-in sales don't bump the
+            # catalog version; the entry page lists new names once its cached
+            # catalog times out. A returning customer under the same name costs
+            # one read and no write.
+            customers = Customer.objects.filter(CUSTEMAIL=customer_email)
+            current_name = customers.values_list("CUSTNAME", flat=True).first()
+            if current_name is None:
+                Customer.objects.bulk_create(
+                    [Customer(CUSTNAME=customer_name, CUSTEMAIL=customer_email, DISPSTATUS=0)],
+                    ignore_conflicts=True,
+                )
+            elif current_name != customer_name:
+                customers.update(CUSTNAME=customer_name)
+
+            invoice = Invoice.objects.create(
+                CUSTNAME=customer_name,
+                CUSTEMAIL=customer_email,
+                GROSSAMT=cart["gross_amount"],
+                TAXAMT=cart["tax_amount"],
+                NETAMT=cart["net_amount"],
+                ROUNDEDPAYABLE=cart["rounded_payable"],
+                PAIDAMT=paid_amount,
+                BALANCEAMT=balance_amount,
+                RECEIVED_DENOMS=received_denoms,
+                CHANGE_DENOMS=change_denoms,
+                EMAILSENT=False,
+            )
+
+            items = []
+            for row in cart["items"]:
+                items.append(
+                    InvoiceItem(
+                        INVOICE=invoice,
+                        PRODUCT=row["product"],
+                        UNITPRICE=row["unit_price"],
+                        TAXPERCENT=row["tax_percent"],
+                        QTY=row["qty"],
+                        LINESUBTOTAL=row["line_subtotal"],
+                        LINETAX=row["line_tax"],
+                        LINETOTAL=row["line_total"],
+                    )
+                )
+            InvoiceItem.objects.bulk_create(items)
+            record_invoice(invoice, items)
+            if key is not None:
+                key.INVOICE = invoice
+                key.save(update_fields=["INVOICE"])
+
+            enqueue_invoice_email(invoice)
+            transaction.on_commit(lambda: metrics.inc("billing_invoices_created_total"))
+    except InsufficientStockError as exc:
+        shortfalls = find_stock_shortfalls(exc.product_qty_map)
+        if shortfalls:
+            product = shortfalls[0]
+            raise CheckoutError(
+                f"Insufficient stock for {product.PRODNAME}. "
+                f"Available stock is {product.PROAVASTOCK}.",
+                status=409,
+            )
+        raise CheckoutError("Stock changed while billing. Please try again.", status=409)
+    except IntegrityError:
+        if not idempotency_key:
+            raise
+        invoice = _replay(idempotency_key, fingerprint)
+        if invoice is None:
+            raise
+        return invoice, list(invoice.items.select_related("PRODUCT")), True
+
+    return invoice, items, False
+
+
+def invoice_payload(invoice, items, replayed=False):
+    return {
+        "invoice_id": invoice.INVOICEID,
+        "customer_name": invoice.CUSTNAME,
+        "customer_email": invoice.CUSTEMAIL,
+        "items": [
+            {
+                "product_id": item.PRODUCT.PRODID,
+                "product_code": item.PRODUCT.PRODCODE,
+                "product_name": item.PRODUCT.PRODNAME,
+                "qty": item.QTY,
+                "unit_price": str(item.UNITPRICE),
+                "tax_percent": str(item.TAXPERCENT),
+                "line_subtotal": str(item.LINESUBTOTAL),
+                "line_tax": str(item.LINETAX),
+                "line_total": str(item.LINETOTAL),
+            }
+            for item in items
+        ],
+        "gross_amount": str(invoice.GROSSAMT),
+        "tax_amount": str(invoice.TAXAMT),
+        "net_amount": str(invoice.NETAMT),
+        "rounded_payable": str(invoice.ROUNDEDPAYABLE),
+        "paid_amount": str(invoice.PAIDAMT),
+        "balance_amount": str(invoice.BALANCEAMT),
+        "received_denoms": invoice.RECEIVED_DENOMS,
+        "change_denoms": invoice.CHANGE_DENOMS,
+        "created": invoice.PRCSDATE.isoformat(),
+        "replayed": replayed,
+    }
@@ -0,0 +1,76 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache.utils import make_template_fragment_key
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .receipts import RECEIPT_TEMPLATE, template_digest
+
+# Invoices are immutable apart from the email status fields, so the detail page
+# can be validated (ETag / Last-Modified) and its receipt fragment cached from
+# those fields alone. The version also hashes the page's template sources (the
+# receipt body included) and BILLING_DEPLOY_VERSION, so a deploy that changes
+# the page drops old copies without a manual bump.
+DETAIL_TEMPLATES = ("Invoice/Invoice_Detail.html", "base.html", RECEIPT_TEMPLATE)
+RECEIPT_FRAGMENT = "invoice_receipt"
+VERSION_FIELDS = (
+    "INVOICEID",
+    "PRCSDATE",
+    "RECEIPTVERSION",
+    "EMAILSENT",
+    "EMAILFAILCOUNT",
+    "EMAILLASTERROR",
+)
+
+
+def invoice_version(invoice):
+    raw = "|".join(str(getattr(invoice, field)) for field in VERSION_FIELDS)
+    deploy = f"{template_digest(*DETAIL_TEMPLATES)}|{settings.BILLING_DEPLOY_VERSION}"
+    return hashlib.sha1(f"{deploy}|{raw}".encode("utf-8")).hexdigest()[:16]
+
+
+def _validators(invoice):
+    etag = f'"{invoice_version(invoice)}"'
+    # Once the email is sent nothing about the invoice changes again, so its
+    # creation time is a safe Last-Modified. Before that only the ETag is used.
+    last_modified = int(invoice.PRCSDATE.timestamp()) if invoice.EMAILSENT else None
+    return etag, last_modified
+
+
+def not_modified(request, invoice):
+    # The 304 (or 412) response when the client's copy is current, else None.
+    etag, last_modified = _validators(invoice)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        add_validators(response, invoice)
+    return response
+
+
+def add_validators(response, invoice):
+    etag, last_modified = _validators(invoice)
+    response.headers.setdefault("ETag", etag)
+    if last_modified:
+        response.headers.setdefault("Last-Modified", http_date(last_modified))
+    # Validators are only worth something if the browser revalidates instead of
+    # reusing a stale page; private, because invoices carry customer details.
+    response.headers.setdefault("Cache-Control", "private, no-cache")
+    return response
+
+
+def receipt_fragment_key(invoice):
+    return make_template_fragment_key(
+        RECEIPT_FRAGMENT, [invoice.INVOICEID, invoice_version(invoice)]
+    )
+
+
+def detail_context(invoice, receipt):
+    # receipt may be a callable: the {% cache %} block only calls it on a miss.
+    # Either way it must be the receipt itself, never a placeholder that relies
+    # on the block finding a cached copy.
+    return {
+        "invoice": invoice,
+        "receipt": receipt,
+        "invoice_version": invoice_version(invoice),
+        "fragment_timeout": settings.BILLING_INVOICE_FRAGMENT_TIMEOUT,
+    }
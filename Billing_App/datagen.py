@@ -0,0 +1,250 @@
+import json
+import math
+import random
+from collections import namedtuple
+from datetime import datetime, time, timedelta, timezone
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+
+from .billing import ChangeTable, balance_due, price_cart, tendered_amount
+
+# Row generation for `manage.py generate_data`. Nothing here touches the ORM or
+# the database, so spawned worker processes can run it without Django set up;
+# rows come back as plain tuples and the command writes them. For SQLite the
+# values are already in the form Django stores (text for decimals, UTC
+# datetimes and JSON), which keeps that work out of the single writer process.
+
+# Relative invoice volume per local hour: closed overnight, a lunch peak and a
+# bigger evening peak.
+DEFAULT_HOUR_WEIGHTS = (0, 0, 0, 0, 0, 0, 0, 1, 3, 5, 6, 7, 9, 8, 5, 4, 5, 7, 10, 10, 8, 5, 2, 0)
+# Relative volume per weekday, Monday first.
+WEEKDAY_WEIGHTS = (1.0, 0.95, 0.95, 1.0, 1.15, 1.4, 1.25)
+QTY_WEIGHTS = (60, 20, 10, 6, 4)
+TAX_RATES = ("0.00", "5.00", "12.00", "18.00")
+
+FIRST_NAMES = (
+    "Aarav Aditi Arjun Divya Farhan Isha Kabir Meera Nikhil Priya Rahul Riya Rohan "
+    "Sana Tanvi Varun Vikram Zoya Anil Lakshmi"
+).split()
+LAST_NAMES = "Sharma Iyer Khan Patel Reddy Nair Gupta Das Mehta Rao Singh Joshi Menon Bose".split()
+PRODUCT_KINDS = (
+    "Rice Atta Sugar Salt Tea Coffee Milk Bread Butter Paneer Soap Shampoo Biscuits "
+    "Oil Dal Noodles Juice Detergent Eggs Curd"
+).split()
+PRODUCT_SIZES = ("100g", "250g", "500g", "1kg", "2kg", "5kg", "200ml", "500ml", "1L", "Pack")
+
+# Order of the values in the generated invoice and item rows.
+INVOICE_FIELDS = (
+    "INVOICEID",
+    "CUSTNAME",
+    "CUSTEMAIL",
+    "GROSSAMT",
+    "TAXAMT",
+    "NETAMT",
+    "ROUNDEDPAYABLE",
+    "PAIDAMT",
+    "BALANCEAMT",
+    "RECEIVED_DENOMS",
+    "CHANGE_DENOMS",
+    "PRCSDATE",
+)
+ITEM_FIELDS = (
+    "INVOICE_id",
+    "PRODUCT_id",
+    "UNITPRICE",
+    "TAXPERCENT",
+    "QTY",
+    "LINESUBTOTAL",
+    "LINETAX",
+    "LINETOTAL",
+    "PRCSDATE",
+)
+
+CatalogProduct = namedtuple("CatalogProduct", "PRODID PRODPRI PRODTAXPRE")
+
+
+def sqlite_datetime(value):
+    # What Django's SQLite backend stores for an aware datetime.
+    return str(value.astimezone(timezone.utc).replace(tzinfo=None))
+
+
+def _unchanged(value):
+    return value
+
+
+def zipf_cum_weights(count, exponent):
+    # Cumulative 1/rank**exponent weights for random.choices(cum_weights=...);
+    # exponent 0 is uniform.
+    total = 0.0
+    cum_weights = []
+    for rank in range(1, count + 1):
+        total += rank**-exponent
+        cum_weights.append(total)
+    return cum_weights
+
+
+def _cum(weights):
+    total = 0.0
+    cum_weights = []
+    for weight in weights:
+        total += weight
+        cum_weights.append(total)
+    return cum_weights
+
+
+def customer_rows(first_id, count, seed):
+    rng = random.Random(seed)
+    return [
+        (
+            cust_id,
+            f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            f"customer{cust_id}@example.com",
+        )
+        for cust_id in range(first_id, first_id + count)
+    ]
+
+
+def product_rows(first_id, count, seed):
+    rng = random.Random(seed)
+    rows = []
+    for prod_id in range(first_id, first_id + count):
+        rows.append(
+            (
+                prod_id,
+                f"{rng.choice(PRODUCT_KINDS)} {rng.choice(PRODUCT_SIZES)} #{prod_id}",
+                f"GEN{prod_id:07d}",
+                Decimal(rng.randint(500, 250000)) / 100,
+                Decimal(rng.choice(TAX_RATES)),
+            )
+        )
+    return rows
+
+
+def day_counts(invoices, first_day, days):
+    # Invoices per day, weighted by weekday, summing exactly to `invoices`.
+    weights = [WEEKDAY_WEIGHTS[(first_day + timedelta(days=n)).weekday()] for n in range(days)]
+    total = sum(weights)
+    counts = [int(invoices * weight / total) for weight in weights]
+    for n in range(invoices - sum(counts)):
+        counts[n % days] += 1
+    return counts
+
+
+def tender(payable, values, rng):
+    # Notes a customer hands over: the exact amount about a third of the time,
+    # otherwise the smallest single note that covers it, or a pile of the
+    # largest note.
+    amount = int(payable)
+    counts = dict.fromkeys(values, 0)
+    if rng.random() < 0.3:
+        for value in values:
+            counts[value], amount = divmod(amount, value)
+        if amount:
+            counts[values[-1]] += 1
+    else:
+        covering = [value for value in values if value >= amount]
+        if covering:
+            counts[covering[-1]] = 1
+        else:
+            counts[values[0]] = math.ceil(amount / values[0])
+    return {str(value): count for value, count in counts.items()}
+
+
+class InvoiceGenerator:
+    # Holds the catalog and the precomputed distributions; one per process.
+
+    def __init__(self, config):
+        self.config = config
+        self.products = [
+            CatalogProduct(prod_id, Decimal(price), Decimal(tax))
+            for prod_id, price, tax in config["products"]
+        ]
+        self.customers = config["customers"]
+        self.denominations = tuple(sorted(config["denominations"], reverse=True))
+        self.change_table = ChangeTable(self.denominations)
+        self.tzinfo = ZoneInfo(config["time_zone"])
+        self.product_weights = zipf_cum_weights(len(self.products), config["product_zipf"])
+        self.customer_weights = zipf_cum_weights(len(self.customers), config["customer_zipf"])
+        self.hour_weights = _cum(config["hour_weights"])
+        self.line_weights = _cum(0.6**n for n in range(config["max_lines"]))
+        self.qty_weights = _cum(QTY_WEIGHTS)
+        if config["sqlite"]:
+            self.money, self.stamp, self.json = str, sqlite_datetime, json.dumps
+        else:
+            self.money = self.stamp = self.json = _unchanged
+
+    def _times(self, day, count, rng):
+        hours = rng.choices(range(24), cum_weights=self.hour_weights, k=count)
+        start = datetime.combine(day, time.min, tzinfo=self.tzinfo)
+        return sorted(start + timedelta(hours=hour, seconds=rng.randrange(3600)) for hour in hours)
+
+    def _lines(self, rng):
+        line_count = rng.choices(range(1, len(self.line_weights) + 1), self.line_weights)[0]
+        picks = rng.choices(self.products, cum_weights=self.product_weights, k=line_count)
+        quantities = rng.choices(range(1, 6), cum_weights=self.qty_weights, k=line_count)
+        lines = {}
+        for product, qty in zip(picks, quantities):
+            # A popular product drawn twice is one line, as checkout merges them.
+            lines[product] = lines.get(product, 0) + qty
+        return lines.items()
+
+    def day(self, day, first_id, count, seed):
+        # Returns (invoice rows, item rows) for one local day, IDs in time order.
+        rng = random.Random(seed)
+        invoices = []
+        items = []
+        customers = rng.choices(self.customers, cum_weights=self.customer_weights, k=count)
+        for offset, (created, (name, email)) in enumerate(
+            zip(self._times(day, count, rng), customers)
+        ):
+            invoice_id = first_id + offset
+            created = self.stamp(created)
+            cart = price_cart(self._lines(rng))
+            received = tender(cart["rounded_payable"], self.denominations, rng)
+            paid = tendered_amount(received)
+            balance = balance_due(paid, cart["rounded_payable"])
+            money = self.money
+            invoices.append(
+                (
+                    invoice_id,
+                    name,
+                    email,
+                    money(cart["gross_amount"]),
+                    money(cart["tax_amount"]),
+                    money(cart["net_amount"]),
+                    money(cart["rounded_payable"]),
+                    money(paid),
+                    money(balance),
+                    self.json(received),
+                    self.json(self.change_table.make_change(balance)),
+                    created,
+                )
+            )
+            for row in cart["items"]:
+                items.append(
+                    (
+                        invoice_id,
+                        row["product"].PRODID,
+                        money(row["unit_price"]),
+                        money(row["tax_percent"]),
+                        row["qty"],
+                        money(row["line_subtotal"]),
+                        money(row["line_tax"]),
+                        money(row["line_total"]),
+                        created,
+                    )
+                )
+        return invoices, items
+
+
+_generator = None
+
+
+def init_worker(config):
+    global _generator
+    _generator = InvoiceGenerator(config)
+
+
+def generate_day(task):
+    # Pool entry point; task is (day, first_id, count, seed).
+    return _generator.day(*task)
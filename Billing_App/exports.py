@@ -0,0 +1,113 @@
+import csv
+import json
+from itertools import groupby
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .filters import filter_invoices
+from .models import Invoice, InvoiceItem
+
+EXPORT_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+INVOICE_EXPORT_FIELDS = (
+    "INVOICEID",
+    "PRCSDATE",
+    "CUSTNAME",
+    "CUSTEMAIL",
+    "GROSSAMT",
+    "TAXAMT",
+    "NETAMT",
+    "ROUNDEDPAYABLE",
+    "PAIDAMT",
+    "BALANCEAMT",
+)
+ITEM_EXPORT_FIELDS = (
+    "PRODUCT__PRODCODE",
+    "PRODUCT__PRODNAME",
+    "QTY",
+    "UNITPRICE",
+    "TAXPERCENT",
+    "LINESUBTOTAL",
+    "LINETAX",
+    "LINETOTAL",
+)
+CSV_HEADER = INVOICE_EXPORT_FIELDS + ("PRODCODE", "PRODNAME") + ITEM_EXPORT_FIELDS[2:]
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _export_value(value):
+    if hasattr(value, "tzinfo"):
+        return timezone.localtime(value).isoformat()
+    return value
+
+
+def iter_invoice_chunks(filters, chunk_size=None, using=None):
+    # Yields (invoice row, item rows) tuples. Invoices stream through one
+    # chunked cursor as plain tuples; items are fetched with one query per
+    # chunk, so memory is bounded by chunk_size whatever the export range.
+    # `using` is fixed up front because a streamed response is consumed after
+    # the request's database routing has ended.
+    chunk_size = chunk_size or settings.BILLING_EXPORT_CHUNK_SIZE
+    invoices = (
+        filter_invoices(Invoice.objects.using(using), filters)
+        .order_by("PRCSDATE", "INVOICEID")
+        .values_list(*INVOICE_EXPORT_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    chunk = []
+    for invoice in invoices:
+        chunk.append(invoice)
+        if len(chunk) == chunk_size:
+            yield from _with_items(chunk, using)
+            chunk = []
+    if chunk:
+        yield from _with_items(chunk, using)
+
+
+def _with_items(chunk, using):
+    rows = (
+        InvoiceItem.objects.using(using)
+        .filter(INVOICE_id__in=[invoice[0] for invoice in chunk])
+        .order_by("INVOICE_id", "INVOICEITEMID")
+        .values_list("INVOICE_id", *ITEM_EXPORT_FIELDS)
+    )
+    items = {
+        invoice_id: [row[1:] for row in group]
+        for invoice_id, group in groupby(rows, key=lambda row: row[0])
+    }
+    for invoice in chunk:
+        yield invoice, items.get(invoice[0], [])
+
+
+def iter_csv(filters, chunk_size=None, using=None):
+    # One line per invoice item; invoices without items get a single line with
+    # empty item columns.
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    blank_item = ("",) * len(ITEM_EXPORT_FIELDS)
+    for invoice, items in iter_invoice_chunks(filters, chunk_size, using):
+        invoice = [_export_value(value) for value in invoice]
+        for item in items or [blank_item]:
+            yield writer.writerow(invoice + list(item))
+
+
+def iter_jsonl(filters, chunk_size=None, using=None):
+    # One JSON object per invoice with its items nested.
+    item_keys = ("PRODCODE", "PRODNAME") + ITEM_EXPORT_FIELDS[2:]
+    for invoice, items in iter_invoice_chunks(filters, chunk_size, using):
+        row = {
+            field: _export_value(value) for field, value in zip(INVOICE_EXPORT_FIELDS, invoice)
+        }
+        row["ITEMS"] = [dict(zip(item_keys, item)) for item in items]
+        yield json.dumps(row, cls=DjangoJSONEncoder) + "\n"
+
+
+def iter_export(filters, export_format, chunk_size=None, using=None):
+    if export_format == "jsonl":
+        return iter_jsonl(filters, chunk_size, using)
+    return iter_csv(filters, chunk_size, using)
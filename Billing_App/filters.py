@@ -0,0 +1,49 @@
+from datetime import date, datetime, time, timedelta
+
+from django.utils import timezone
+
+from .search import search_invoices
+
+INVOICE_FILTER_FIELDS = ("customer_name", "customer_email", "from_date", "to_date")
+
+
+def invoice_filter_params(query):
+    return {field: query.get(field, "").strip() for field in INVOICE_FILTER_FIELDS}
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def local_day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def is_full_email(value):
+    local, _, domain = value.partition("@")
+    return bool(local) and "." in domain and not domain.endswith(".")
+
+
+def filter_invoices(queryset, filters):
+    # Dates are local calendar days turned into a half-open [start, next day)
+    # range on PRCSDATE itself, so the (PRCSDATE, INVOICEID) index can be used
+    # instead of casting every row with __date.
+    customer_name = filters.get("customer_name", "")
+    customer_email = filters.get("customer_email", "")
+    from_date = parse_date(filters.get("from_date", ""))
+    to_date = parse_date(filters.get("to_date", ""))
+
+    if customer_email and is_full_email(customer_email):
+        # Invoice emails are stored lower-cased, so a full address is an
+        # equality lookup on the (CUSTEMAIL, PRCSDATE) index.
+        queryset = queryset.filter(CUSTEMAIL=customer_email.lower())
+        customer_email = ""
+    queryset = search_invoices(queryset, customer_name, customer_email)
+    if from_date:
+        queryset = queryset.filter(PRCSDATE__gte=local_day_start(from_date))
+    if to_date:
+        queryset = queryset.filter(PRCSDATE__lt=local_day_start(to_date + timedelta(days=1)))
+    return queryset
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Billing_App.archive import archivable_invoices, archive_cutoff, archive_invoices
+
+
+class Command(BaseCommand):
+    help = "Move settled invoices older than the cutoff, with their items, to the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=None, help="Defaults to BILLING_ARCHIVE_AFTER_DAYS."
+        )
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument("--max-batches", type=int, default=None)
+        parser.add_argument(
+            "--pause", type=float, default=0.05, help="Seconds to sleep between batches."
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["days"] is not None and options["days"] < 0:
+            raise CommandError("--days cannot be negative.")
+        cutoff = archive_cutoff(options["days"])
+
+        if options["dry_run"]:
+            count = archivable_invoices(cutoff).count()
+            self.stdout.write(f"{count} invoices created before {cutoff:%Y-%m-%d} can be archived.")
+            return
+
+        started = time.perf_counter()
+
+        def progress(totals):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  batch {totals['batches']}: {totals['invoices']} invoices, "
+                f"{totals['items']} items ({totals['invoices'] / elapsed:.0f} invoices/s)"
+            )
+
+        totals = archive_invoices(
+            cutoff,
+            batch_size=options["batch_size"],
+            max_batches=options["max_batches"],
+            pause=options["pause"],
+            progress=progress if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Archived {totals['invoices']} invoices and {totals['items']} items "
+                f"created before {cutoff:%Y-%m-%d} in {totals['batches']} batches "
+                f"({time.perf_counter() - started:.2f}s)."
+            )
+        )
@@ -0,0 +1,113 @@
+import random
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+
+from Billing_App.benchmarking import summarize_timings, time_calls, write_report
+from Billing_App.billing import (
+    ChangeTable,
+    balance_due,
+    greedy_change,
+    price_cart,
+    price_carts,
+    tendered_amount,
+)
+
+DEFAULT_DENOMINATIONS = [500, 200, 100, 50, 20, 10, 5, 2, 1]
+
+
+def _fake_catalog(size, rng):
+    return [
+        SimpleNamespace(
+            PRODID=index,
+            PRODPRI=Decimal(rng.randint(100, 500000)) / 100,
+            PRODTAXPRE=Decimal(rng.choice([0, 500, 1200, 1800, 2800])) / 100,
+        )
+        for index in range(1, size + 1)
+    ]
+
+
+def _fake_carts(catalog, count, lines, rng):
+    return [[(rng.choice(catalog), rng.randint(1, 10)) for _ in range(lines)] for _ in range(count)]
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmarks for the billing engine (pricing, tender and change)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--carts", type=int, default=1000)
+        parser.add_argument("--lines", type=int, default=8)
+        parser.add_argument("--catalog", type=int, default=500)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--json", dest="json_path", default="")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        catalog = _fake_catalog(options["catalog"], rng)
+        carts = _fake_carts(catalog, options["carts"], options["lines"], rng)
+        tenders = [
+            {str(value): rng.randint(0, 3) for value in DEFAULT_DENOMINATIONS}
+            for _ in range(options["carts"])
+        ]
+        repeat = options["repeat"]
+
+        def single_cart_loop():
+            for lines in carts:
+                price_cart(lines)
+
+        def batch():
+            price_carts(carts)
+
+        def tender_loop():
+            for counts in tenders:
+                tendered_amount(counts)
+
+        priced = price_carts(carts)
+        balances = [
+            balance_due(tendered_amount(counts), cart["rounded_payable"]).copy_abs()
+            for counts, cart in zip(tenders, priced)
+        ]
+
+        def greedy_loop():
+            for balance in balances:
+                greedy_change(balance, DEFAULT_DENOMINATIONS)
+
+        non_canonical = ChangeTable([1000, 30, 20, 1])
+
+        def table_build():
+            ChangeTable([1000, 30, 20, 1])
+
+        def table_loop():
+            for balance in balances:
+                non_canonical.make_change(balance)
+
+        cases = {
+            "price_cart_loop": single_cart_loop,
+            "price_carts_batch": batch,
+            "tendered_amount": tender_loop,
+            "greedy_change": greedy_loop,
+            "change_table_build": table_build,
+            "change_table_lookup": table_loop,
+        }
+        results = {}
+        for name, func in cases.items():
+            summary = summarize_timings(time_calls(func, repeat))
+            summary["per_cart_us"] = summary["mean_ms"] * 1000 / max(len(carts), 1)
+            results[name] = summary
+            self.stdout.write(
+                f"{name:<20} mean {summary['mean_ms']:9.3f} ms  "
+                f"p95 {summary['p95_ms']:9.3f} ms  per cart {summary['per_cart_us']:8.2f} us"
+            )
+
+        if options["json_path"]:
+            settings_used = {
+                key: options[key] for key in ("carts", "lines", "catalog", "repeat", "seed")
+            }
+            path = write_report(
+                options["json_path"],
+                "billing_engine",
+                {"options": settings_used, "cases": results},
+            )
+            self.stdout.write(self.style.SUCCESS(f"Results written to {path}"))
@@ -0,0 +1,113 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import AsyncRequestFactory, RequestFactory
+
+from Billing_App import async_views, views
+from Billing_App.benchmarking import summarize_timings, write_report
+from Billing_App.models import Invoice
+
+READ_VIEWS = ("invoice_index", "invoice_detail", "product_index", "customer_index")
+
+
+def _targets(names):
+    invoice_id = (
+        Invoice.objects.order_by("-INVOICEID").values_list("INVOICEID", flat=True).first()
+    )
+    targets = []
+    for name in names:
+        if name == "invoice_detail":
+            if invoice_id is None:
+                continue
+            targets.append((name, f"/invoice/{invoice_id}/", {"pk": invoice_id}))
+        else:
+            targets.append((name, "/", {}))
+    return targets
+
+
+def _run_wsgi(name, path, kwargs, requests, concurrency):
+    # A thread per in-flight request, as a threaded WSGI server would use.
+    view = getattr(views, name)
+    factory = RequestFactory()
+
+    def one_request(_):
+        started = time.perf_counter()
+        try:
+            view(factory.get(path), **kwargs)
+        finally:
+            close_old_connections()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        timings = list(executor.map(one_request, range(requests)))
+    return timings, time.perf_counter() - started
+
+
+def _run_asgi(name, path, kwargs, requests, concurrency):
+    # One event loop with up to `concurrency` requests in flight; async ORM
+    # queries still run on Django's sync thread.
+    view = getattr(async_views, name)
+    factory = AsyncRequestFactory()
+
+    async def run():
+        limit = asyncio.Semaphore(concurrency)
+
+        async def one_request():
+            async with limit:
+                started = time.perf_counter()
+                await view(factory.get(path), **kwargs)
+                return time.perf_counter() - started
+
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(one_request() for _ in range(requests)))
+        return list(timings), time.perf_counter() - started
+
+    return async_to_sync(run)()
+
+
+class Command(BaseCommand):
+    help = "Compare concurrent throughput of the sync (WSGI) and async (ASGI) read views."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--mode", choices=("both", "wsgi", "asgi"), default="both")
+        parser.add_argument("--view", action="append", choices=READ_VIEWS, default=[])
+        parser.add_argument("--json", dest="json_path", default="")
+
+    def handle(self, *args, **options):
+        if options["requests"] <= 0 or options["concurrency"] <= 0:
+            raise CommandError("--requests and --concurrency must be positive.")
+        modes = ("wsgi", "asgi") if options["mode"] == "both" else (options["mode"],)
+        runners = {"wsgi": _run_wsgi, "asgi": _run_asgi}
+
+        results = {}
+        for name, path, kwargs in _targets(options["view"] or READ_VIEWS):
+            for mode in modes:
+                timings, elapsed = runners[mode](
+                    name, path, kwargs, options["requests"], options["concurrency"]
+                )
+                summary = summarize_timings(timings)
+                summary["requests_per_s"] = len(timings) / elapsed if elapsed else 0.0
+                results[f"{name}:{mode}"] = summary
+                self.stdout.write(
+                    f"{name:<16} {mode:<5} {summary['requests_per_s']:9.1f} req/s  "
+                    f"p50 {summary['p50_ms']:8.2f} ms  p95 {summary['p95_ms']:8.2f} ms"
+                )
+
+        if options["json_path"]:
+            path = write_report(
+                options["json_path"],
+                "read_views",
+                {
+                    "requests": options["requests"],
+                    "concurrency": options["concurrency"],
+                    "cases": results,
+                },
+            )
+            self.stdout.write(f"Report written to {path}")
@@ -0,0 +1,201 @@
+import multiprocessing
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Billing_App.benchmarking import summarize_timings, write_report
+
+PROFILES = ("default", "production")
+PRODUCT_COUNT = 200
+
+# A cut-down copy of the checkout tables. The workers use plain sqlite3 so
+# each process opens its own connection exactly as a gunicorn worker would.
+SCHEMA = (
+    "CREATE TABLE product (id INTEGER PRIMARY KEY, stock INTEGER NOT NULL)",
+    "CREATE TABLE invoice (id INTEGER PRIMARY KEY, amount REAL NOT NULL, created REAL NOT NULL)",
+    "CREATE TABLE invoice_item (id INTEGER PRIMARY KEY, invoice_id INTEGER NOT NULL, "
+    "product_id INTEGER NOT NULL, qty INTEGER NOT NULL)",
+    "CREATE INDEX invoice_item_invoice ON invoice_item (invoice_id)",
+    "CREATE TABLE daily_summary (day INTEGER PRIMARY KEY, invoices INTEGER NOT NULL)",
+)
+
+
+def _profile_config(profile):
+    # Mirrors what Django does for each profile: the stock sqlite3 backend
+    # opens with a 5s timeout and deferred transactions; the production
+    # profile adds the init pragmas, BEGIN IMMEDIATE and a kept connection.
+    if profile == "default":
+        return {"pragmas": [], "begin": "BEGIN", "timeout": 5, "persistent": False}
+    options = settings.SQLITE_PRODUCTION_OPTIONS
+    pragmas = [stmt.strip() for stmt in options["init_command"].split(";") if stmt.strip()]
+    return {
+        "pragmas": pragmas,
+        "begin": f"BEGIN {options['transaction_mode']}",
+        "timeout": options["timeout"],
+        "persistent": True,
+    }
+
+
+def _prepare(path, config):
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        for pragma in config["pragmas"]:
+            conn.execute(pragma)
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.executemany(
+            "INSERT INTO product (id, stock) VALUES (?, ?)",
+            [(pid, 10**9) for pid in range(1, PRODUCT_COUNT + 1)],
+        )
+        conn.execute("INSERT INTO daily_summary (day, invoices) VALUES (0, 0)")
+    finally:
+        conn.close()
+
+
+def _connect(path, config):
+    conn = sqlite3.connect(path, timeout=config["timeout"], isolation_level=None)
+    for pragma in config["pragmas"]:
+        conn.execute(pragma)
+    return conn
+
+
+def _checkout(conn, config, rng):
+    lines = [(rng.randint(1, PRODUCT_COUNT), rng.randint(1, 3)) for _ in range(3)]
+    conn.execute(config["begin"])
+    try:
+        # Read first, then write: the pattern that makes a deferred
+        # transaction upgrade its lock mid-way.
+        conn.execute(
+            "SELECT id, stock FROM product WHERE id IN (?, ?, ?)", [pid for pid, _ in lines]
+        ).fetchall()
+        for pid, qty in lines:
+            conn.execute("UPDATE product SET stock = stock - ? WHERE id = ?", (qty, pid))
+        invoice_id = conn.execute(
+            "INSERT INTO invoice (amount, created) VALUES (?, ?)",
+            (rng.uniform(10, 500), time.time()),
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO invoice_item (invoice_id, product_id, qty) VALUES (?, ?, ?)",
+            [(invoice_id, pid, qty) for pid, qty in lines],
+        )
+        conn.execute("UPDATE daily_summary SET invoices = invoices + 1 WHERE day = 0")
+        conn.execute("COMMIT")
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+def _list_page(conn):
+    conn.execute("SELECT id, amount, created FROM invoice ORDER BY id DESC LIMIT 25").fetchall()
+    conn.execute("SELECT COUNT(*) FROM invoice").fetchone()
+
+
+def _worker(path, config, operations, write_ratio, seed, results):
+    rng = random.Random(seed)
+    conn = _connect(path, config) if config["persistent"] else None
+    timings = []
+    errors = 0
+    try:
+        for _ in range(operations):
+            started = time.perf_counter()
+            op_conn = conn or _connect(path, config)
+            try:
+                if rng.random() < write_ratio:
+                    _checkout(op_conn, config, rng)
+                else:
+                    _list_page(op_conn)
+            except sqlite3.OperationalError:
+                # "database is locked": the request would have failed.
+                errors += 1
+                continue
+            finally:
+                if conn is None:
+                    op_conn.close()
+            timings.append(time.perf_counter() - started)
+    finally:
+        if conn is not None:
+            conn.close()
+    results.put((timings, errors))
+
+
+def run_profile(profile, workers, operations, write_ratio, directory):
+    config = _profile_config(profile)
+    path = str(Path(directory) / f"{profile}.sqlite3")
+    _prepare(path, config)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker, args=(path, config, operations, write_ratio, seed, results))
+        for seed in range(workers)
+    ]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    elapsed = time.perf_counter() - started
+    for process in processes:
+        process.join()
+
+    timings = [value for worker_timings, _ in collected for value in worker_timings]
+    summary = summarize_timings(timings)
+    summary["errors"] = sum(errors for _, errors in collected)
+    summary["ops_per_s"] = len(timings) / elapsed if elapsed else 0.0
+    return summary
+
+
+class Command(BaseCommand):
+    help = "Compare SQLite throughput under concurrent writers: stock settings vs production."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--operations", type=int, default=500, help="Per worker.")
+        parser.add_argument("--write-ratio", type=float, default=0.3)
+        parser.add_argument("--profile", action="append", choices=PROFILES, default=[])
+        parser.add_argument("--json", dest="json_path", default="")
+
+    def handle(self, *args, **options):
+        if options["workers"] <= 0 or options["operations"] <= 0:
+            raise CommandError("--workers and --operations must be positive.")
+        if not 0 <= options["write_ratio"] <= 1:
+            raise CommandError("--write-ratio must be between 0 and 1.")
+
+        results = {}
+        with tempfile.TemporaryDirectory(prefix="billing-sqlite-bench-") as directory:
+            for profile in options["profile"] or PROFILES:
+                summary = run_profile(
+                    profile,
+                    options["workers"],
+                    options["operations"],
+                    options["write_ratio"],
+                    directory,
+                )
+                results[profile] = summary
+                self.stdout.write(
+                    f"{profile:<10} {summary['ops_per_s']:9.1f} ops/s  "
+                    f"errors {summary['errors']:5d}  "
+                    f"p50 {summary['p50_ms']:8.2f} ms  p95 {summary['p95_ms']:8.2f} ms"
+                )
+
+        if "default" in results and "production" in results and results["default"]["ops_per_s"]:
+            gain = results["production"]["ops_per_s"] / results["default"]["ops_per_s"]
+            self.stdout.write(f"Production profile: {gain:.2f}x the default throughput.")
+
+        if options["json_path"]:
+            path = write_report(
+                options["json_path"],
+                "sqlite_concurrency",
+                {
+                    "workers": options["workers"],
+                    "operations": options["operations"],
+                    "write_ratio": options["write_ratio"],
+                    "profiles": results,
+                },
+            )
+            self.stdout.write(f"Report written to {path}")
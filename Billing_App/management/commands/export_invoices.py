@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Billing_App.exports import EXPORT_FORMATS, iter_export
+from Billing_App.filters import INVOICE_FILTER_FIELDS
+from Billing_App.routers import current_read_alias, replica_reads
+
+
+class Command(BaseCommand):
+    help = "Stream invoices and their line items as CSV or JSONL (same filters as the invoice list)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="csv")
+        parser.add_argument("--output", default="-", help="File path, or - for stdout.")
+        parser.add_argument("--chunk-size", type=int, default=None)
+        for field in INVOICE_FILTER_FIELDS:
+            parser.add_argument(f"--{field.replace('_', '-')}", dest=field, default="")
+
+    def handle(self, *args, **options):
+        filters = {field: options[field].strip() for field in INVOICE_FILTER_FIELDS}
+        with replica_reads():
+            using = current_read_alias()
+        rows = iter_export(filters, options["format"], options["chunk_size"], using=using)
+        if options["output"] == "-":
+            for row in rows:
+                self.stdout.write(row, ending="")
+            return
+        try:
+            with open(options["output"], "w", encoding="utf-8", newline="") as handle:
+                handle.writelines(rows)
+        except OSError as exc:
+            raise CommandError(str(exc))
+        self.stderr.write(self.style.SUCCESS(f"Exported invoices to {options['output']}."))
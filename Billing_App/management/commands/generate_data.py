@@ -0,0 +1,335 @@
+import multiprocessing
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from Billing_App.catalog import bump_catalog_version
+from Billing_App.datagen import (
+    DEFAULT_HOUR_WEIGHTS,
+    INVOICE_FIELDS,
+    ITEM_FIELDS,
+    customer_rows,
+    day_counts,
+    generate_day,
+    init_worker,
+    product_rows,
+)
+from Billing_App.models import Customer, Denomination, Invoice, InvoiceItem, Product
+from Billing_App.reports import rebuild_sales_summaries
+from Billing_App.search import install_search, uninstall_search
+
+
+@contextmanager
+def historical_dates(*models):
+    # bulk_create would stamp auto_now_add fields with the current time; the
+    # generated rows carry their own PRCSDATE.
+    fields = [model._meta.get_field("PRCSDATE") for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+@contextmanager
+def fast_sqlite():
+    # For this connection only: no fsync per commit and a 256MB page cache. An
+    # OS crash mid-run can corrupt the file, so generate into a scratch database.
+    # SQLite refuses to change synchronous inside a transaction (e.g. in tests).
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        synchronous = cursor.execute("PRAGMA synchronous").fetchone()[0]
+        cache_size = cursor.execute("PRAGMA cache_size").fetchone()[0]
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA cache_size=-262144")
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA synchronous={int(synchronous)}")
+            cursor.execute(f"PRAGMA cache_size={int(cache_size)}")
+
+
+@contextmanager
+def search_index_paused(enabled):
+    # The FTS triggers (trigram indexes on PostgreSQL) cost more per invoice
+    # than the insert itself; one rebuild at the end is far cheaper. Search is
+    # broken until then, so only with --pause-search on a scratch database.
+    if not enabled:
+        yield
+        return
+    uninstall_search(connection)
+    try:
+        yield
+    finally:
+        install_search(connection)
+
+
+def insert_rows(model, fields, rows, batch_size, constants=None):
+    # On SQLite the rows arrive in stored form (see datagen) and go through one
+    # prepared INSERT with executemany. bulk_create spends most of its time
+    # preparing every value through the field API and splits statements at the
+    # parameter limit; other databases still use it.
+    constants = constants or {}
+    if connection.vendor != "sqlite":
+        model.objects.bulk_create(
+            [model(**constants, **dict(zip(fields, row))) for row in rows], batch_size=batch_size
+        )
+        return
+    opts = model._meta
+    constant_values = tuple(
+        opts.get_field(name).get_db_prep_save(value, connection)
+        for name, value in constants.items()
+    )
+    names = [*constants, *fields]
+    columns = ", ".join(connection.ops.quote_name(opts.get_field(name).column) for name in names)
+    sql = (
+        f"INSERT INTO {connection.ops.quote_name(opts.db_table)} ({columns}) "
+        f"VALUES ({', '.join(['%s'] * len(names))})"
+    )
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(
+                sql, [constant_values + row for row in rows[start : start + batch_size]]
+            )
+
+
+def bounded_imap(pool, func, tasks, window):
+    # Like pool.imap, but with at most `window` results submitted and not yet
+    # consumed, so workers cannot run ahead of the single writer and pile whole
+    # days up in memory.
+    pending = deque()
+    for task in tasks:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(func, (task,)))
+    while pending:
+        yield pending.popleft().get()
+
+
+def _next_id(model):
+    return (model.objects.aggregate(last=Max(model._meta.pk.name))["last"] or 0) + 1
+
+
+def _hour_weights(value):
+    try:
+        weights = [float(weight) for weight in value.split(",")]
+    except ValueError:
+        weights = []
+    if len(weights) != 24 or min(weights) < 0 or not sum(weights):
+        raise CommandError("--hour-weights needs 24 non-negative numbers, not all zero.")
+    return weights
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic customers, products and invoices "
+        "(Zipfian product popularity, busy hours) for testing at scale."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customers", type=int, default=10000)
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--invoices", type=int, default=100000)
+        parser.add_argument("--days", type=int, default=365, help="Spread over the last N days.")
+        parser.add_argument("--max-lines", type=int, default=6, help="Most lines per invoice.")
+        parser.add_argument(
+            "--product-zipf",
+            type=float,
+            default=1.1,
+            help="Zipf exponent of product popularity (0 = uniform).",
+        )
+        parser.add_argument(
+            "--customer-zipf",
+            type=float,
+            default=0.8,
+            help="Zipf exponent of repeat customers (0 = uniform).",
+        )
+        parser.add_argument(
+            "--hour-weights",
+            default=",".join(str(weight) for weight in DEFAULT_HOUR_WEIGHTS),
+            help="24 comma-separated relative weights, local hours 0-23.",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=0, help="Generator processes (0 = in this process)."
+        )
+        parser.add_argument(
+            "--pause-search",
+            action="store_true",
+            help=(
+                "Drop the search index during the load and rebuild it at the end. "
+                "Search is unavailable meanwhile: use it on a scratch database only."
+            ),
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument(
+            "--skip-summaries",
+            action="store_true",
+            help="Do not rebuild the daily sales summaries afterwards.",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        for option in ("customers", "products", "invoices", "workers"):
+            if options[option] < 0:
+                raise CommandError(f"--{option} cannot be negative.")
+        for option in ("days", "max_lines", "batch_size"):
+            if options[option] < 1:
+                raise CommandError(f"--{option.replace('_', '-')} must be at least 1.")
+        hour_weights = _hour_weights(options["hour_weights"])
+        denominations = list(
+            Denomination.objects.filter(DISPSTATUS=0).values_list("DENOMVALUE", flat=True)
+        )
+        if not denominations:
+            raise CommandError("No active denominations; run migrate first.")
+
+        started = time.perf_counter()
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+        with fast_sqlite():
+            self._create_catalog(options, rng, batch_size)
+            bump_catalog_version()
+
+            customers = list(
+                Customer.objects.filter(DISPSTATUS=0).values_list("CUSTNAME", "CUSTEMAIL")
+            )
+            products = list(
+                Product.objects.filter(DISPSTATUS=0).values_list("PRODID", "PRODPRI", "PRODTAXPRE")
+            )
+            if options["invoices"] and not (customers and products):
+                raise CommandError("Invoices need at least one active customer and product.")
+            # Popularity follows list position; shuffle so it is not tied to ID.
+            rng.shuffle(customers)
+            rng.shuffle(products)
+            config = {
+                "customers": customers,
+                "products": products,
+                "denominations": denominations,
+                "time_zone": settings.TIME_ZONE,
+                "product_zipf": options["product_zipf"],
+                "customer_zipf": options["customer_zipf"],
+                "hour_weights": hour_weights,
+                "max_lines": options["max_lines"],
+                "sqlite": connection.vendor == "sqlite",
+            }
+
+            last_day = timezone.localdate()
+            first_day = last_day - timedelta(days=options["days"] - 1)
+            first_id = _next_id(Invoice)
+            tasks = []
+            for offset, count in enumerate(
+                day_counts(options["invoices"], first_day, options["days"])
+            ):
+                if count:
+                    tasks.append(
+                        (first_day + timedelta(days=offset), first_id, count, rng.getrandbits(32))
+                    )
+                    first_id += count
+
+            totals = self._create_invoices(
+                config, tasks, options["workers"], options["pause_search"], batch_size, started
+            )
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [Customer, Product, Invoice]
+                ):
+                    cursor.execute(sql)
+
+        if totals["invoices"] and not options["skip_summaries"]:
+            rebuild_sales_summaries(first_day, last_day)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {options['customers']} customers, {options['products']} products, "
+                f"{totals['invoices']} invoices and {totals['items']} items in {elapsed:.1f}s "
+                f"({totals['items'] / elapsed:.0f} items/s)."
+            )
+        )
+
+    def _create_catalog(self, options, rng, batch_size):
+        with transaction.atomic():
+            rows = customer_rows(_next_id(Customer), options["customers"], rng.getrandbits(32))
+            Customer.objects.bulk_create(
+                [
+                    Customer(CUSTID=cid, CUSTNAME=name, CUSTEMAIL=email, DISPSTATUS=0)
+                    for cid, name, email in rows
+                ],
+                batch_size=batch_size,
+            )
+            rows = product_rows(_next_id(Product), options["products"], rng.getrandbits(32))
+            Product.objects.bulk_create(
+                [
+                    Product(
+                        PRODID=pid,
+                        PRODNAME=name,
+                        PRODCODE=code,
+                        PRODPRI=price,
+                        PRODTAXPRE=tax,
+                        # Generated sales do not draw stock down.
+                        PROAVASTOCK=1000000,
+                        DISPSTATUS=0,
+                    )
+                    for pid, name, code, price, tax in rows
+                ],
+                batch_size=batch_size,
+            )
+
+    def _create_invoices(self, config, tasks, workers, pause_search, batch_size, started):
+        totals = {"invoices": 0, "items": 0}
+        if workers:
+            # spawn, as on Windows: datagen imports nothing that needs the ORM.
+            pool = multiprocessing.get_context("spawn").Pool(
+                workers, initializer=init_worker, initargs=(config,)
+            )
+            # Two days per worker: one being generated, one waiting to be written.
+            results = bounded_imap(pool, generate_day, tasks, 2 * workers)
+        else:
+            pool = None
+            init_worker(config)
+            results = map(generate_day, tasks)
+
+        try:
+            with historical_dates(Invoice, InvoiceItem), search_index_paused(pause_search):
+                for (day, _, _, _), (invoices, items) in zip(tasks, results):
+                    with transaction.atomic():
+                        # Already sent, so the mailer never picks them up.
+                        insert_rows(
+                            Invoice,
+                            INVOICE_FIELDS,
+                            invoices,
+                            batch_size,
+                            {
+                                "EMAILSENT": True,
+                                "EMAILFAILCOUNT": 0,
+                                "EMAILLASTERROR": "",
+                                "RECEIPTVERSION": 1,
+                            },
+                        )
+                        insert_rows(InvoiceItem, ITEM_FIELDS, items, batch_size)
+                    totals["invoices"] += len(invoices)
+                    totals["items"] += len(items)
+                    if self.verbosity > 1:
+                        elapsed = time.perf_counter() - started
+                        self.stdout.write(
+                            f"  {day}: {totals['invoices']} invoices, {totals['items']} items "
+                            f"({totals['items'] / elapsed:.0f} items/s)"
+                        )
+        finally:
+            if pool is not None:
+                pool.terminate()
+        return totals
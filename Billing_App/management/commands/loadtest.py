@@ -0,0 +1,263 @@
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Sum
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from Billing_App.benchmarking import summarize_timings, write_report
+from Billing_App.catalog import clear_local_catalog
+from Billing_App.models import Denomination, InvoiceItem, Product
+
+ACTIONS = ("checkout", "invoice_index", "invoice_detail")
+# Enough 500s to cover the largest cart seed_catalog can produce.
+TENDER_NOTES = 8
+
+
+def seed_catalog(products, stock, rng):
+    Product.objects.bulk_create(
+        [
+            Product(
+                PRODNAME=f"Load test product {index}",
+                PRODCODE=f"LT{index:06d}",
+                PRODPRI=Decimal(rng.randint(1000, 20000)) / 100,
+                PROAVASTOCK=stock,
+                PRODTAXPRE=rng.choice([0, 5, 12, 18]),
+                DISPSTATUS=0,
+            )
+            for index in range(1, products + 1)
+        ]
+    )
+    return dict(
+        Product.objects.filter(PRODCODE__startswith="LT").values_list("PRODID", "PROAVASTOCK")
+    )
+
+
+def check_stock(initial_stock):
+    # Every unit on an invoice must have come out of stock exactly once.
+    sold = dict(
+        InvoiceItem.objects.filter(PRODUCT_id__in=initial_stock.keys())
+        .values_list("PRODUCT_id")
+        .annotate(total=Sum("QTY"))
+    )
+    current = dict(
+        Product.objects.filter(PRODID__in=initial_stock.keys()).values_list(
+            "PRODID", "PROAVASTOCK"
+        )
+    )
+    oversold_units = 0
+    mismatches = 0
+    for pid, initial in initial_stock.items():
+        sold_qty = sold.get(pid, 0)
+        oversold_units += max(0, sold_qty - initial)
+        if initial - sold_qty != current[pid]:
+            mismatches += 1
+    return {"oversold_units": oversold_units, "stock_mismatches": mismatches}
+
+
+class LoadClient:
+    # One simulated cashier: its own test client (full middleware and URL
+    # stack) and, because connections are per thread, its own DB connection.
+
+    def __init__(self, product_ids, denom_field, invoice_ids, lock, seed):
+        self.client = Client()
+        self.rng = random.Random(seed)
+        self.product_ids = product_ids
+        self.denom_field = denom_field
+        self.invoice_ids = invoice_ids
+        self.lock = lock
+
+    def _checkout(self):
+        lines = self.rng.sample(self.product_ids, min(3, len(self.product_ids)))
+        data = {
+            "customer_name": "Load Test",
+            "customer_email": f"load{self.rng.randint(1, 50)}@example.com",
+            "product_id[]": [str(pid) for pid in lines],
+            "quantity[]": [str(self.rng.randint(1, 3)) for _ in lines],
+            self.denom_field: str(TENDER_NOTES),
+        }
+        response = self.client.post(reverse("invoice_add"), data)
+        if response.status_code == 302:
+            invoice_id = resolve(response["Location"]).kwargs["pk"]
+            with self.lock:
+                self.invoice_ids.append(invoice_id)
+            return "ok"
+        if b"Insufficient stock" in response.content or b"Stock changed" in response.content:
+            return "out_of_stock"
+        return "rejected"
+
+    def _get(self, action):
+        if action == "invoice_index":
+            response = self.client.get(reverse("invoice_index"))
+        else:
+            with self.lock:
+                invoice_id = self.rng.choice(self.invoice_ids) if self.invoice_ids else None
+            if invoice_id is None:
+                return None
+            response = self.client.get(reverse("invoice_detail", args=[invoice_id]))
+        return "ok" if response.status_code == 200 else "rejected"
+
+    def request(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            try:
+                outcome = self._checkout() if action == "checkout" else self._get(action)
+            except Exception:
+                # Raised through the test client, e.g. "database is locked".
+                outcome = "error"
+            elapsed = time.perf_counter() - started
+        return outcome, elapsed, len(queries)
+
+
+def run_load(clients, requests, mix, products=50, stock=100, seed=7):
+    # Drives `clients` threads, each issuing `requests` requests picked from
+    # `mix` ({action: weight}), against whatever database is current.
+    rng = random.Random(seed)
+    initial_stock = seed_catalog(products, stock, rng)
+    product_ids = sorted(initial_stock)
+    tender = Denomination.objects.filter(DISPSTATUS=0).order_by("-DENOMVALUE").first()
+    if tender is None:
+        raise CommandError("No active denomination to pay with.")
+    denom_field = f"denom_{tender.DENOMID}"
+
+    actions = [action for action in ACTIONS if mix.get(action)]
+    weights = [mix[action] for action in actions]
+    invoice_ids = []
+    lock = threading.Lock()
+
+    def one_client(index):
+        client = LoadClient(product_ids, denom_field, invoice_ids, lock, seed + index)
+        client_rng = random.Random(seed * 1000 + index)
+        samples = []
+        try:
+            for action in client_rng.choices(actions, weights, k=requests):
+                outcome, elapsed, queries = client.request(action)
+                if outcome is not None:
+                    samples.append((action, outcome, elapsed, queries))
+        finally:
+            connections.close_all()
+        return samples
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        samples = [sample for batch in executor.map(one_client, range(clients)) for sample in batch]
+    elapsed = time.perf_counter() - started
+
+    views = {}
+    for action in actions:
+        rows = [row for row in samples if row[0] == action]
+        summary = summarize_timings([row[2] for row in rows if row[1] != "error"])
+        query_counts = [row[3] for row in rows]
+        summary["queries_per_request"] = (
+            sum(query_counts) / len(query_counts) if query_counts else 0.0
+        )
+        summary["max_queries"] = max(query_counts, default=0)
+        summary["outcomes"] = {
+            outcome: sum(1 for row in rows if row[1] == outcome)
+            for outcome in ("ok", "out_of_stock", "rejected", "error")
+        }
+        views[action] = summary
+
+    invoices = views.get("checkout", {}).get("outcomes", {}).get("ok", 0)
+    return {
+        "clients": clients,
+        "requests_per_client": requests,
+        "elapsed_s": elapsed,
+        "requests_per_s": len(samples) / elapsed if elapsed else 0.0,
+        "invoices_per_s": invoices / elapsed if elapsed else 0.0,
+        "views": views,
+        "stock": check_stock(initial_stock),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test checkout and the invoice list/detail pages with concurrent clients "
+        "against a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=8)
+        parser.add_argument("--requests", type=int, default=100, help="Per client.")
+        parser.add_argument("--products", type=int, default=50)
+        parser.add_argument("--stock", type=int, default=100, help="Starting stock per product.")
+        parser.add_argument("--checkout-weight", type=int, default=3)
+        parser.add_argument("--list-weight", type=int, default=1)
+        parser.add_argument("--detail-weight", type=int, default=2)
+        parser.add_argument("--seed", type=int, default=7)
+        parser.add_argument("--json", dest="json_path", default="")
+
+    def handle(self, *args, **options):
+        if options["clients"] <= 0 or options["requests"] <= 0 or options["products"] <= 0:
+            raise CommandError("--clients, --requests and --products must be positive.")
+        mix = {
+            "checkout": options["checkout_weight"],
+            "invoice_index": options["list_weight"],
+            "invoice_detail": options["detail_weight"],
+        }
+        if not any(weight > 0 for weight in mix.values()):
+            raise CommandError("At least one request weight must be positive.")
+
+        with tempfile.TemporaryDirectory(prefix="billing-loadtest-") as directory:
+            results = self._run_on_scratch_db(Path(directory), mix, options)
+
+        for action, summary in results["views"].items():
+            outcomes = summary["outcomes"]
+            self.stdout.write(
+                f"{action:<15} p50 {summary['p50_ms']:8.2f} ms  p95 {summary['p95_ms']:8.2f} ms  "
+                f"p99 {summary['p99_ms']:8.2f} ms  {summary['queries_per_request']:5.1f} q/req  "
+                f"ok {outcomes['ok']}  out of stock {outcomes['out_of_stock']}  "
+                f"rejected {outcomes['rejected']}  errors {outcomes['error']}"
+            )
+        stock = results["stock"]
+        self.stdout.write(
+            f"{results['invoices_per_s']:.1f} invoices/s, {results['requests_per_s']:.1f} req/s; "
+            f"oversold units {stock['oversold_units']}, "
+            f"stock mismatches {stock['stock_mismatches']}"
+        )
+
+        if options["json_path"]:
+            path = write_report(options["json_path"], "loadtest", results)
+            self.stdout.write(f"Report written to {path}")
+
+    def _run_on_scratch_db(self, directory, mix, options):
+        # The same migrations as the real database, in a throwaway file, so the
+        # run never touches real invoices or stock. The cache, receipts and the
+        # replica are kept out of the way too.
+        creation = connections[DEFAULT_DB_ALIAS].creation
+        settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+        if settings_dict["ENGINE"] == "django.db.backends.sqlite3":
+            settings_dict["TEST"]["NAME"] = str(directory / "loadtest.sqlite3")
+        old_name = creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(
+                ALLOWED_HOSTS=["testserver"],
+                CACHES={
+                    "default": {
+                        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+                        "LOCATION": "billing-loadtest",
+                    }
+                },
+                BILLING_RECEIPT_DIR=str(directory / "receipts"),
+                BILLING_REPLICA_DATABASE="",
+            ):
+                clear_local_catalog()
+                return run_load(
+                    options["clients"],
+                    options["requests"],
+                    mix,
+                    products=options["products"],
+                    stock=options["stock"],
+                    seed=options["seed"],
+                )
+        finally:
+            clear_local_catalog()
+            creation.destroy_test_db(old_name, verbosity=0)
@@ -0,0 +1,87 @@
+import io
+import json
+import pstats
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = ("cumulative", "tottime", "ncalls")
+
+
+def load_summaries(directory, view=""):
+    summaries = []
+    for path in sorted(Path(directory).glob("*.json")):
+        summary = json.loads(path.read_text(encoding="utf-8"))
+        if view and summary.get("view") != view:
+            continue
+        summary["name"] = path.stem
+        summaries.append(summary)
+    return summaries
+
+
+def merge_collapsed(directory, names):
+    stacks = Counter()
+    for name in names:
+        path = Path(directory) / f"{name}.collapsed"
+        if not path.exists():
+            continue
+        for line in path.read_text(encoding="utf-8").splitlines():
+            stack, _, count = line.rpartition(" ")
+            if stack:
+                stacks[stack] += int(count)
+    return stacks
+
+
+class Command(BaseCommand):
+    help = "Summarise the request profiles in BILLING_PROFILE_DIR: hot functions and time split."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default="")
+        parser.add_argument("--view", default="", help="Only profiles of this URL name.")
+        parser.add_argument("--top", type=int, default=25)
+        parser.add_argument("--sort", choices=SORT_KEYS, default="tottime")
+        parser.add_argument(
+            "--flamegraph", default="", help="Write the merged collapsed stacks to this file."
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options["dir"] or settings.BILLING_PROFILE_DIR)
+        summaries = load_summaries(directory, options["view"])
+        profiles = [directory / f"{s['name']}.prof" for s in summaries]
+        profiles = [path for path in profiles if path.exists()]
+        if not profiles:
+            raise CommandError(f"No profiles found in {directory}.")
+
+        count = len(summaries)
+        totals = {
+            key: sum(summary[key] for summary in summaries) / count
+            for key in ("wall_ms", "sql_ms", "template_ms", "python_ms", "sql_queries")
+        }
+        self.stdout.write(
+            f"{count} profiled requests: mean wall {totals['wall_ms']:.1f} ms = "
+            f"SQL {totals['sql_ms']:.1f} ms ({totals['sql_queries']:.1f} queries) + "
+            f"templates {totals['template_ms']:.1f} ms + Python {totals['python_ms']:.1f} ms"
+        )
+        slowest = sorted(summaries, key=lambda summary: summary["wall_ms"], reverse=True)[:5]
+        for summary in slowest:
+            self.stdout.write(
+                f"  {summary['wall_ms']:8.1f} ms  {summary['method']} {summary['path']}  "
+                f"({summary['name']})"
+            )
+
+        buffer = io.StringIO()
+        stats = pstats.Stats(*[str(path) for path in profiles], stream=buffer)
+        stats.strip_dirs().sort_stats(options["sort"]).print_stats(options["top"])
+        self.stdout.write(buffer.getvalue())
+
+        if options["flamegraph"]:
+            stacks = merge_collapsed(directory, [summary["name"] for summary in summaries])
+            output = Path(options["flamegraph"])
+            output.parent.mkdir(parents=True, exist_ok=True)
+            output.write_text(
+                "".join(f"{stack} {count}\n" for stack, count in stacks.most_common()),
+                encoding="utf-8",
+            )
+            self.stdout.write(f"Collapsed stacks written to {output}")
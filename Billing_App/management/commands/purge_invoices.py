@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Billing_App.filters import INVOICE_FILTER_FIELDS, filter_invoices, parse_date
+from Billing_App.models import Invoice
+from Billing_App.purge import purge_invoices
+
+
+class Command(BaseCommand):
+    help = "Delete the invoices matching the filters, with their items, in fixed-size batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customer-name", default="")
+        parser.add_argument("--customer-email", default="")
+        parser.add_argument("--from-date", default="", help="YYYY-MM-DD, inclusive.")
+        parser.add_argument("--to-date", default="", help="YYYY-MM-DD, inclusive.")
+        parser.add_argument("--all", action="store_true", help="Purge every invoice.")
+        parser.add_argument(
+            "--batch-size", type=int, default=None, help="Defaults to BILLING_PURGE_BATCH_SIZE."
+        )
+        parser.add_argument("--max-batches", type=int, default=None)
+        parser.add_argument(
+            "--pause", type=float, default=0.0, help="Seconds to sleep between batches."
+        )
+        parser.add_argument(
+            "--restore-stock",
+            action="store_true",
+            help="Add the purged quantities back to PROAVASTOCK.",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        filters = {field: options[field].strip() for field in INVOICE_FILTER_FIELDS}
+        for field in ("from_date", "to_date"):
+            if filters[field] and parse_date(filters[field]) is None:
+                raise CommandError(f"Invalid date: {filters[field]}")
+        if not any(filters.values()) and not options["all"]:
+            raise CommandError("Give at least one filter, or --all to purge every invoice.")
+        if options["batch_size"] is not None and options["batch_size"] < 1:
+            raise CommandError("--batch-size must be at least 1.")
+        queryset = filter_invoices(Invoice.objects.all(), filters)
+
+        if options["dry_run"]:
+            self.stdout.write(f"{queryset.count()} invoices match.")
+            return
+
+        started = time.perf_counter()
+
+        def progress(totals):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"  batch {totals['batches']}: {totals['invoices']} invoices, "
+                f"{totals['items']} items ({totals['invoices'] / elapsed:.0f} invoices/s)"
+            )
+
+        totals = purge_invoices(
+            queryset,
+            batch_size=options["batch_size"],
+            max_batches=options["max_batches"],
+            restore=options["restore_stock"],
+            pause=options["pause"],
+            progress=progress if options["verbosity"] > 1 else None,
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Purged {totals['invoices']} invoices and {totals['items']} items "
+                f"in {totals['batches']} batches ({elapsed:.2f}s, "
+                f"{totals['invoices'] / elapsed if elapsed else 0:.0f} invoices/s)."
+            )
+        )
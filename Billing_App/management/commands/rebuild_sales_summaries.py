@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Billing_App.filters import parse_date
+from Billing_App.reports import rebuild_sales_summaries
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales summary tables from invoices (all days or a date range)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--from-date", default="", help="First day to rebuild (YYYY-MM-DD).")
+        parser.add_argument("--to-date", default="", help="Last day to rebuild (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for option in ("from_date", "to_date"):
+            value = options[option]
+            dates[option] = parse_date(value) if value else None
+            if value and dates[option] is None:
+                raise CommandError(f"Invalid date: {value}")
+
+        started = time.perf_counter()
+        days, product_rows = rebuild_sales_summaries(**dates)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rebuilt {days} daily summaries and {product_rows} product rows "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
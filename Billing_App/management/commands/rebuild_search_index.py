@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from Billing_App.search import install_search, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the customer/invoice search index objects and re-index every row."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        started = time.perf_counter()
+        if not install_search(connection):
+            rebuild_search_index(connection)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Search index rebuilt on {connection.vendor} "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
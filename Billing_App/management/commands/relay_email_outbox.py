@@ -0,0 +1,62 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Billing_App.outbox import relay_outbox, replay_outbox
+
+
+def _parse_datetime(value):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date/time: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Relay pending invoice emails from the outbox to Celery or directly to the mailer."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--direct",
+            action="store_true",
+            help="Send through the mailer in this process instead of queueing Celery tasks.",
+        )
+        parser.add_argument("--loop", action="store_true", help="Keep relaying until stopped.")
+        parser.add_argument("--interval", type=float, default=5.0)
+        parser.add_argument(
+            "--replay-since", default="", help="Re-queue rows created since this date/time."
+        )
+        parser.add_argument("--replay-until", default="")
+        parser.add_argument("--replay-invoice", type=int, action="append", default=[])
+        parser.add_argument(
+            "--include-sent",
+            action="store_true",
+            help="Also replay invoices whose email was already sent.",
+        )
+
+    def handle(self, *args, **options):
+        if options["replay_since"] or options["replay_until"] or options["replay_invoice"]:
+            count = replay_outbox(
+                since=_parse_datetime(options["replay_since"]) if options["replay_since"] else None,
+                until=_parse_datetime(options["replay_until"]) if options["replay_until"] else None,
+                invoice_ids=options["replay_invoice"],
+                include_sent=options["include_sent"],
+            )
+            self.stdout.write(f"{count} outbox rows reset to pending.")
+
+        while True:
+            started = time.perf_counter()
+            relayed = relay_outbox(options["batch_size"], direct=options["direct"])
+            if relayed or not options["loop"]:
+                self.stdout.write(
+                    f"Relayed {relayed} outbox rows in {time.perf_counter() - started:.2f}s."
+                )
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Billing_App.routers import replica_reads
+from Billing_App.snapshots import InvalidWatermark, write_snapshot
+
+
+class Command(BaseCommand):
+    help = "Append invoices newer than the last watermark to month-partitioned Parquet files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Snapshot directory.")
+        parser.add_argument("--chunk-size", type=int, default=None)
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Discard existing snapshot files and export every invoice again.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            with replica_reads():
+                totals = write_snapshot(
+                    options["output"], chunk_size=options["chunk_size"], full=options["full"]
+                )
+        except ImportError:
+            raise CommandError("pyarrow is required for Parquet snapshots: pip install pyarrow")
+        except InvalidWatermark as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Wrote {totals['invoices']} invoices, {totals['items']} items and "
+                f"{totals['denominations']} denomination rows "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def copy_sqlite_database(source_path, target_path):
+    # sqlite3's online backup gives a consistent copy even while the primary
+    # is being written to.
+    source = sqlite3.connect(str(source_path))
+    target = sqlite3.connect(str(target_path))
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+class Command(BaseCommand):
+    help = "Refresh a local SQLite read replica from the primary database file."
+
+    def handle(self, *args, **options):
+        alias = settings.BILLING_REPLICA_DATABASE
+        if not alias:
+            raise CommandError("No replica configured; set DATABASE_REPLICA_NAME.")
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replica = connections[alias].settings_dict
+        sqlite = "django.db.backends.sqlite3"
+        if primary["ENGINE"] != sqlite or replica["ENGINE"] != sqlite:
+            raise CommandError("sync_replica only copies SQLite files; use real replication.")
+
+        connections[alias].close()
+        started = time.perf_counter()
+        copy_sqlite_database(primary["NAME"], replica["NAME"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Copied {primary['NAME']} to {replica['NAME']} "
+                f"in {time.perf_counter() - started:.2f}s."
+            )
+        )
@@ -0,0 +1,226 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+# In-process metrics in the Prometheus text format, without a client library.
+# Each process keeps cumulative values in memory. With BILLING_METRICS_DIR set,
+# every process (gunicorn worker, Celery worker) also writes its totals to its
+# own JSON file there, and a scrape sums all the files. That way /metrics shows
+# the whole deployment, whichever worker answers it. Files of processes that
+# have exited are still counted, so empty the directory when the whole service
+# is restarted.
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+EMAIL_LAG_BUCKETS = (1, 5, 15, 30, 60, 300, 900, 1800, 3600, 14400, 86400)
+
+# name: (type, help, buckets)
+METRICS = {
+    "billing_view_latency_seconds": (
+        "histogram",
+        "Request latency by URL name.",
+        LATENCY_BUCKETS,
+    ),
+    "billing_invoices_created_total": ("counter", "Invoices committed by checkout.", None),
+    "billing_email_send_seconds": (
+        "histogram",
+        "send_invoice_email_task run time.",
+        LATENCY_BUCKETS,
+    ),
+    "billing_email_task_retries_total": (
+        "counter",
+        "send_invoice_email_task retries scheduled.",
+        None,
+    ),
+    "billing_email_lag_seconds": (
+        "histogram",
+        "Seconds from invoice creation to EMAILSENT=True.",
+        EMAIL_LAG_BUCKETS,
+    ),
+    "billing_email_backlog": ("gauge", "Invoices with EMAILSENT=False.", None),
+}
+
+_lock = threading.Lock()
+# Held while writing this process's file: one writer at a time, and the
+# _last_flush check-and-set cannot race.
+_flush_lock = threading.Lock()
+_values = {}
+# A new token per process start, so a restarted worker with a reused pid does
+# not overwrite the totals of the process it replaced.
+_process_token = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+_last_flush = 0.0
+TMP_FILE_MAX_AGE = 60
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    with _lock:
+        key = _key(name, labels)
+        _values[key] = _values.get(key, 0) + amount
+    flush()
+
+
+def observe(name, value, **labels):
+    buckets = METRICS[name][2]
+    with _lock:
+        key = _key(name, labels)
+        series = _values.get(key)
+        if series is None:
+            series = _values[key] = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+        # Buckets are stored cumulatively, as they are exposed.
+        for index, bound in enumerate(buckets):
+            if value <= bound:
+                series["buckets"][index] += 1
+        series["sum"] += value
+        series["count"] += 1
+    flush()
+
+
+@contextmanager
+def timed(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def _snapshot():
+    with _lock:
+        return [
+            [name, dict(labels), value if not isinstance(value, dict) else dict(value)]
+            for (name, labels), value in _values.items()
+        ]
+
+
+def flush(force=False):
+    # Writes this process's totals at most every BILLING_METRICS_FLUSH_SECONDS;
+    # a scrape always forces its own process's file up to date. Never raises:
+    # a full or unwritable directory must not fail the request being counted.
+    global _last_flush
+    directory = settings.BILLING_METRICS_DIR
+    if not directory:
+        return
+    with _flush_lock:
+        now = time.monotonic()
+        if not force and now - _last_flush < settings.BILLING_METRICS_FLUSH_SECONDS:
+            return
+        _last_flush = now
+        path = Path(directory) / f"{_process_token}.json"
+        tmp_path = path.with_name(f"{_process_token}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(json.dumps(_snapshot()), encoding="utf-8")
+            os.replace(tmp_path, path)
+        except OSError:
+            logger.warning("Could not write metrics file %s", path, exc_info=True)
+            try:
+                tmp_path.unlink(missing_ok=True)
+            except OSError:
+                pass
+
+
+def _remove_orphaned_tmp_files(directory):
+    # Left behind by a process killed mid-write; a live writer renames its temp
+    # file within milliseconds.
+    cutoff = time.time() - TMP_FILE_MAX_AGE
+    for path in Path(directory).glob("*.tmp"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            continue
+
+
+def _merge(total, name, labels, value):
+    key = _key(name, labels)
+    if not isinstance(value, dict):
+        total[key] = total.get(key, 0) + value
+        return
+    series = total.setdefault(
+        key, {"buckets": [0] * len(value["buckets"]), "sum": 0.0, "count": 0}
+    )
+    series["buckets"] = [a + b for a, b in zip(series["buckets"], value["buckets"])]
+    series["sum"] += value["sum"]
+    series["count"] += value["count"]
+
+
+def collect():
+    # {(name, labels): value} summed over every process's file, or this
+    # process's own values when no directory is configured.
+    directory = settings.BILLING_METRICS_DIR
+    if not directory:
+        snapshots = [_snapshot()]
+    else:
+        flush(force=True)
+        _remove_orphaned_tmp_files(directory)
+        snapshots = []
+        for path in Path(directory).glob("*.json"):
+            try:
+                snapshots.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                # Being replaced by its writer right now; counted next scrape.
+                continue
+    total = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot:
+            if name in METRICS:
+                _merge(total, name, labels, value)
+    return total
+
+
+def email_backlog():
+    # Served by the partial TXNMASTER_EMAIL_PENDING_IDX index.
+    from .models import Invoice
+
+    return Invoice.objects.filter(EMAILSENT=False).count()
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def render():
+    values = collect()
+    values[("billing_email_backlog", ())] = email_backlog()
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (series_name, labels), value in sorted(values.items()):
+            if series_name != name:
+                continue
+            if kind != "histogram":
+                lines.append(f"{name}{_label_text(labels)} {value}")
+                continue
+            for bound, count in zip(buckets, value["buckets"]):
+                lines.append(f"{name}_bucket{_label_text(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_label_text(labels, [('le', '+Inf')])} {value['count']}")
+            lines.append(f"{name}_sum{_label_text(labels)} {value['sum']}")
+            lines.append(f"{name}_count{_label_text(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    # Tests only.
+    with _lock:
+        _values.clear()
@@ -0,0 +1,181 @@
+import logging
+import time
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+
+from . import metrics
+from .profiling import profile_request, should_profile
+from .querystats import record_queries
+from .routers import replica_alias, replica_reads
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_PIN_COOKIE = "billing_primary_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def _pinned(request):
+    try:
+        return float(request.COOKIES.get(PRIMARY_PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def use_replica(request):
+    # Only safe requests to the views listed in BILLING_REPLICA_VIEWS, and
+    # only when this client has not written recently.
+    if not replica_alias() or request.method not in SAFE_METHODS or _pinned(request):
+        return False
+    try:
+        match = resolve(request.path_info)
+    except Resolver404:
+        return False
+    return match.url_name in settings.BILLING_REPLICA_VIEWS
+
+
+def _pin_after_write(request, response):
+    # A client that just wrote reads from the primary for a few seconds, so a
+    # cashier sees the invoice they created even if the replica lags.
+    if replica_alias() and request.method not in SAFE_METHODS:
+        pin_seconds = settings.BILLING_REPLICA_PIN_SECONDS
+        response.set_cookie(
+            PRIMARY_PIN_COOKIE,
+            str(time.time() + pin_seconds),
+            max_age=pin_seconds,
+            httponly=True,
+            samesite="Lax",
+        )
+    return response
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replica_reads(use_replica(request)):
+            response = self.get_response(request)
+        return _pin_after_write(request, response)
+
+    async def __acall__(self, request):
+        with replica_reads(use_replica(request)):
+            response = await self.get_response(request)
+        return _pin_after_write(request, response)
+
+
+def _run_in_sync_thread(func, request, get_response):
+    # What Django does for a sync-only middleware, but per request: func runs in
+    # the thread-sensitive thread, where the async views' ORM calls run too.
+    return sync_to_async(func)(request, async_to_sync(get_response))
+
+
+class QueryStatsMiddleware:
+    # Counts the SQL each request runs (BILLING_QUERY_STATS). The totals go out
+    # as X-DB-* headers, and requests over BILLING_QUERY_WARN_THRESHOLD are
+    # logged with their most repeated statements. Left out of the stack when
+    # disabled; when enabled, async requests are counted from the thread their
+    # ORM calls run in. Queries a streaming response makes after the view
+    # returns are not counted.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.BILLING_QUERY_STATS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return _run_in_sync_thread(self._record, request, self.get_response)
+        return self._record(request, self.get_response)
+
+    def _record(self, request, get_response):
+        with record_queries() as recorder:
+            response = get_response(request)
+        response["X-DB-Queries"] = str(recorder.count)
+        response["X-DB-Time-Ms"] = f"{recorder.duration * 1000:.1f}"
+        response["X-DB-Duplicates"] = str(sum(times - 1 for _, times in recorder.duplicates()))
+        if recorder.count > settings.BILLING_QUERY_WARN_THRESHOLD:
+            logger.warning("%s %s: %s", request.method, request.path, recorder.summary())
+        return response
+
+
+def _view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.url_name or "unnamed"
+
+
+class MetricsMiddleware:
+    # Per-view latency histogram (billing_view_latency_seconds). The label is
+    # the URL name, so /invoice/1/ and /invoice/2/ share one series.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, started)
+        return response
+
+    def _observe(self, request, started):
+        metrics.observe(
+            "billing_view_latency_seconds",
+            time.perf_counter() - started,
+            view=_view_label(request),
+            method=request.method,
+        )
+
+
+class ProfilingMiddleware:
+    # Profiles requests picked by profiling.should_profile(): the trusted
+    # X-Billing-Profile header or the BILLING_PROFILE_SAMPLE_RATE sample. Left
+    # out of the stack when neither is configured. Only a profiled async request
+    # leaves the event loop, so the profiler and its ORM calls share a thread.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.BILLING_PROFILE_TOKEN and settings.BILLING_PROFILE_SAMPLE_RATE <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if should_profile(request):
+            return profile_request(request, self.get_response)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if should_profile(request):
+            return await _run_in_sync_thread(profile_request, request, self.get_response)
+        return await self.get_response(request)
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-16 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Billing_App", "0006_seed_default_denominations"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(fields=["PRCSDATE", "INVOICEID"], name="TXNMASTER_DATE_ID_IDX"),
+        ),
+    ]
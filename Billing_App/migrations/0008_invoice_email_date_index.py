@@ -0,0 +1,22 @@
+# Generated by Django 6.0.2 on 2026-10-16 20:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Billing_App", "0007_invoice_date_id_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(fields=["CUSTEMAIL", "PRCSDATE"], name="TXNMASTER_EMAIL_DATE_IDX"),
+        ),
+        migrations.AlterField(
+            model_name="invoice",
+            name="CUSTEMAIL",
+            field=models.EmailField(max_length=254),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def install_search(apps, schema_editor):
+    from Billing_App.search import install_search
+
+    install_search(schema_editor.connection)
+
+
+def uninstall_search(apps, schema_editor):
+    from Billing_App.search import uninstall_search
+
+    uninstall_search(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("Billing_App", "0008_invoice_email_date_index"),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.2 on 2026-10-16 21:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Billing_App", "0009_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(
+                condition=models.Q(("EMAILSENT", False)),
+                fields=["INVOICEID"],
+                name="TXNMASTER_EMAIL_PENDING_IDX",
+            ),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.2 on 2026-10-16 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Billing_App", "0010_invoice_email_pending_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EmailOutbox",
+            fields=[
+                ("OUTBOXID", models.AutoField(primary_key=True, serialize=False)),
+                (
+                    "STATUS",
+                    models.IntegerField(
+                        choices=[(0, "Pending"), (1, "Relayed"), (2, "Failed")],
+                        default=0,
+                    ),
+                ),
+                ("ATTEMPTS", models.PositiveIntegerField(default=0)),
+                ("LASTERROR", models.TextField(blank=True, default="")),
+                ("RELAYEDDATE", models.DateTimeField(blank=True, null=True)),
+                ("PRCSDATE", models.DateTimeField(auto_now_add=True)),
+                (
+                    "INVOICE",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="email_outbox",
+                        to="Billing_App.invoice",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "EMAIL_OUTBOX",
+                "ordering": ["OUTBOXID"],
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("STATUS", 0)),
+                        fields=["OUTBOXID"],
+                        name="EMAILOUTBOX_PENDING_IDX",
+                    ),
+                    models.Index(fields=["PRCSDATE"], name="EMAILOUTBOX_DATE_IDX"),
+                ],
+            },
+        ),
+    ]
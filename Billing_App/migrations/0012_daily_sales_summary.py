@@ -0,0 +1,93 @@
+# Generated by Django 6.0.2 on 2026-10-16 11:20
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Billing_App", "0011_emailoutbox"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailySalesSummary",
+            fields=[
+                ("SUMMARYID", models.AutoField(primary_key=True, serialize=False)),
+                ("SALESDATE", models.DateField(unique=True)),
+                ("INVOICECOUNT", models.IntegerField(default=0)),
+                ("QTYSOLD", models.IntegerField(default=0)),
+                (
+                    "GROSSAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=14
+                    ),
+                ),
+                (
+                    "TAXAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=14
+                    ),
+                ),
+                (
+                    "NETAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=14
+                    ),
+                ),
+                ("PRCSDATE", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "db_table": "DAILY_SALES_SUMMARY",
+                "ordering": ["-SALESDATE"],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyProductSales",
+            fields=[
+                ("SUMMARYID", models.AutoField(primary_key=True, serialize=False)),
+                ("SALESDATE", models.DateField()),
+                ("INVOICECOUNT", models.IntegerField(default=0)),
+                ("QTYSOLD", models.IntegerField(default=0)),
+                (
+                    "GROSSAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=14
+                    ),
+                ),
+                (
+                    "TAXAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=14
+                    ),
+                ),
+                (
+                    "NETAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=14
+                    ),
+                ),
+                ("PRCSDATE", models.DateTimeField(auto_now=True)),
+                (
+                    "PRODUCT",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="daily_sales",
+                        to="Billing_App.product",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "DAILY_PRODUCT_SALES",
+                "ordering": ["-SALESDATE", "PRODUCT_id"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("SALESDATE", "PRODUCT"),
+                        name="DAILYPRODSALES_DATE_PROD_UNIQ",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.2 on 2026-10-16 12:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Billing_App", "0012_daily_sales_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                ("KEYID", models.AutoField(primary_key=True, serialize=False)),
+                ("KEY", models.CharField(max_length=100, unique=True)),
+                ("REQUESTHASH", models.CharField(max_length=64)),
+                ("PRCSDATE", models.DateTimeField(auto_now_add=True)),
+                (
+                    "INVOICE",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="idempotency_keys",
+                        to="Billing_App.invoice",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "IDEMPOTENCY_KEY",
+                "ordering": ["-PRCSDATE"],
+            },
+        ),
+    ]
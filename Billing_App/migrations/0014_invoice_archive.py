@@ -0,0 +1,115 @@
+# Generated by Django 6.0.2 on 2026-10-16 15:10
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Billing_App", "0013_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedInvoice",
+            fields=[
+                ("INVOICEID", models.IntegerField(primary_key=True, serialize=False)),
+                ("CUSTNAME", models.CharField(default="", max_length=200)),
+                ("CUSTEMAIL", models.EmailField(max_length=254)),
+                (
+                    "GROSSAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=12
+                    ),
+                ),
+                (
+                    "TAXAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=12
+                    ),
+                ),
+                (
+                    "NETAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=12
+                    ),
+                ),
+                (
+                    "ROUNDEDPAYABLE",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=12
+                    ),
+                ),
+                (
+                    "PAIDAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=12
+                    ),
+                ),
+                (
+                    "BALANCEAMT",
+                    models.DecimalField(
+                        decimal_places=2, default=Decimal("0.00"), max_digits=12
+                    ),
+                ),
+                ("RECEIVED_DENOMS", models.JSONField(blank=True, default=dict)),
+                ("CHANGE_DENOMS", models.JSONField(blank=True, default=dict)),
+                ("EMAILSENT", models.BooleanField(default=False)),
+                ("EMAILFAILCOUNT", models.PositiveIntegerField(default=0)),
+                ("EMAILLASTERROR", models.TextField(blank=True, default="")),
+                ("PRCSDATE", models.DateTimeField()),
+                ("ARCHIVEDDATE", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "db_table": "TRANSACTION_MASTER_ARCHIVE",
+                "ordering": ["-PRCSDATE"],
+                "indexes": [
+                    models.Index(
+                        fields=["PRCSDATE", "INVOICEID"], name="TXNARCHIVE_DATE_ID_IDX"
+                    ),
+                    models.Index(
+                        fields=["CUSTEMAIL", "PRCSDATE"],
+                        name="TXNARCHIVE_EMAIL_DATE_IDX",
+                    ),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedInvoiceItem",
+            fields=[
+                (
+                    "INVOICEITEMID",
+                    models.IntegerField(primary_key=True, serialize=False),
+                ),
+                ("UNITPRICE", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("TAXPERCENT", models.DecimalField(decimal_places=2, max_digits=5)),
+                ("QTY", models.PositiveIntegerField()),
+                ("LINESUBTOTAL", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("LINETAX", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("LINETOTAL", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("PRCSDATE", models.DateTimeField()),
+                (
+                    "INVOICE",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="items",
+                        to="Billing_App.archivedinvoice",
+                    ),
+                ),
+                (
+                    "PRODUCT",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="archived_items",
+                        to="Billing_App.product",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "TRANSACTION_DETAILS_ARCHIVE",
+                "ordering": ["INVOICEITEMID"],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-16 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Billing_App", "0014_invoice_archive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoice",
+            name="EMAILCLAIM",
+            field=models.UUIDField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="EMAILCLAIMEDAT",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-16 22:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Billing_App", "0015_invoice_email_claim"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="archivedinvoice",
+            name="RECEIPTVERSION",
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name="invoice",
+            name="RECEIPTVERSION",
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -94,7 +94,7 @@ class Invoice(models.Model):
     # Customer Name
     CUSTNAME = models.CharField(max_length=200, default="")
     # Customer Email (Indexed for faster lookups)
-    CUSTEMAIL = models.EmailField(db_index=True)
+    CUSTEMAIL = models.EmailField()
     
     GROSSAMT = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
     TAXAMT = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
@@ -111,11 +111,30 @@ class Invoice(models.Model):
     EMAILSENT = models.BooleanField(default=False)
     EMAILFAILCOUNT = models.PositiveIntegerField(default=0)
     EMAILLASTERROR = models.TextField(blank=True, default="")
+    # Set while one worker is delivering the invoice email (see tasks._claim)
+    EMAILCLAIM = models.UUIDField(null=True, blank=True)
+    EMAILCLAIMEDAT = models.DateTimeField(null=True, blank=True)
+    # Part of the cached receipt's file name; bump it to render the receipt again
+    RECEIPTVERSION = models.PositiveIntegerField(default=1)
     PRCSDATE = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = "TRANSACTION_MASTER"
         ordering = ["-PRCSDATE"]
+        indexes = [
+            # Keyset pagination seeks on (PRCSDATE, INVOICEID).
+            models.Index(fields=["PRCSDATE", "INVOICEID"], name="TXNMASTER_DATE_ID_IDX"),
+            # Email lookups, alone or with a date range; replaces the old
+            # single-column CUSTEMAIL index.
+            models.Index(fields=["CUSTEMAIL", "PRCSDATE"], name="TXNMASTER_EMAIL_DATE_IDX"),
+            # Only unsent invoices are indexed, so the email backlog scan stays
+            # small however large the table grows.
+            models.Index(
+                fields=["INVOICEID"],
+                condition=models.Q(EMAILSENT=False),
+                name="TXNMASTER_EMAIL_PENDING_IDX",
+            ),
+        ]
 
     def __str__(self):
         return f"Invoice {self.INVOICEID} - {self.CUSTEMAIL}"
@@ -146,5 +165,181 @@ class InvoiceItem(models.Model):
         return f"InvoiceItem {self.INVOICEITEMID} - Invoice {self.INVOICE_ID}"
 
 
+class EmailOutbox(models.Model):
+    # Primary Key
+    OUTBOXID = models.AutoField(primary_key=True)
+    # Invoice whose email is waiting to be relayed
+    INVOICE = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name="email_outbox")
+    # Relay Status
+    # 0 = Pending
+    # 1 = Relayed
+    # 2 = Failed (gave up after BILLING_OUTBOX_MAX_ATTEMPTS)
+    STATUS = models.IntegerField(
+        choices=(
+            (0, "Pending"),
+            (1, "Relayed"),
+            (2, "Failed"),
+        ),
+        default=0,
+    )
+    ATTEMPTS = models.PositiveIntegerField(default=0)
+    LASTERROR = models.TextField(blank=True, default="")
+    RELAYEDDATE = models.DateTimeField(null=True, blank=True)
+    # Created Date
+    PRCSDATE = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "EMAIL_OUTBOX"
+        ordering = ["OUTBOXID"]
+        indexes = [
+            # The relay only ever scans pending rows, oldest first.
+            models.Index(
+                fields=["OUTBOXID"],
+                condition=models.Q(STATUS=0),
+                name="EMAILOUTBOX_PENDING_IDX",
+            ),
+            # Replays select by creation time.
+            models.Index(fields=["PRCSDATE"], name="EMAILOUTBOX_DATE_IDX"),
+        ]
+
+    def __str__(self):
+        return f"EmailOutbox {self.OUTBOXID} - Invoice {self.INVOICE_ID}"
+
+
+class DailySalesSummary(models.Model):
+    # Primary Key
+    SUMMARYID = models.AutoField(primary_key=True)
+    # Local (TIME_ZONE) calendar day of the invoices
+    SALESDATE = models.DateField(unique=True)
+    INVOICECOUNT = models.IntegerField(default=0)
+    QTYSOLD = models.IntegerField(default=0)
+    GROSSAMT = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    TAXAMT = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    NETAMT = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    # Last Updated Date
+    PRCSDATE = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "DAILY_SALES_SUMMARY"
+        ordering = ["-SALESDATE"]
+
+    def __str__(self):
+        return f"DailySalesSummary {self.SALESDATE}"
+
+
+class DailyProductSales(models.Model):
+    # Primary Key
+    SUMMARYID = models.AutoField(primary_key=True)
+    # Local (TIME_ZONE) calendar day of the invoices
+    SALESDATE = models.DateField()
+    PRODUCT = models.ForeignKey("Product", on_delete=models.PROTECT, related_name="daily_sales")
+    # Invoices that contain the product on this day
+    INVOICECOUNT = models.IntegerField(default=0)
+    QTYSOLD = models.IntegerField(default=0)
+    GROSSAMT = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    TAXAMT = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    NETAMT = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    # Last Updated Date
+    PRCSDATE = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = "DAILY_PRODUCT_SALES"
+        ordering = ["-SALESDATE", "PRODUCT_id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["SALESDATE", "PRODUCT"], name="DAILYPRODSALES_DATE_PROD_UNIQ"
+            ),
+        ]
+
+    def __str__(self):
+        return f"DailyProductSales {self.SALESDATE} - Product {self.PRODUCT_id}"
+
+
+class IdempotencyKey(models.Model):
+    # Primary Key
+    KEYID = models.AutoField(primary_key=True)
+    # Client supplied key (Idempotency-Key header); the unique index is what
+    # serialises concurrent retries of the same sale.
+    KEY = models.CharField(max_length=100, unique=True)
+    # SHA-256 of the normalised request, to reject a key reused for another sale
+    REQUESTHASH = models.CharField(max_length=64)
+    INVOICE = models.ForeignKey(
+        Invoice,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name="idempotency_keys",
+    )
+    # Created Date
+    PRCSDATE = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "IDEMPOTENCY_KEY"
+        ordering = ["-PRCSDATE"]
+
+    def __str__(self):
+        return f"IdempotencyKey {self.KEY} - Invoice {self.INVOICE_id}"
+
+
+class ArchivedInvoice(models.Model):
+    # Cold copy of a TRANSACTION_MASTER row, moved by `manage.py archive_invoices`.
+    # Same columns and INVOICEID as the live row, so views can render either.
+    INVOICEID = models.IntegerField(primary_key=True)
+    CUSTNAME = models.CharField(max_length=200, default="")
+    CUSTEMAIL = models.EmailField()
+
+    GROSSAMT = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    TAXAMT = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    NETAMT = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+
+    ROUNDEDPAYABLE = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    PAIDAMT = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+    BALANCEAMT = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal("0.00"))
+
+    RECEIVED_DENOMS = models.JSONField(default=dict, blank=True)
+    CHANGE_DENOMS = models.JSONField(default=dict, blank=True)
+
+    EMAILSENT = models.BooleanField(default=False)
+    EMAILFAILCOUNT = models.PositiveIntegerField(default=0)
+    EMAILLASTERROR = models.TextField(blank=True, default="")
+    RECEIPTVERSION = models.PositiveIntegerField(default=1)
+    # Original creation date, copied from the live row
+    PRCSDATE = models.DateTimeField()
+    # Archived Date
+    ARCHIVEDDATE = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = "TRANSACTION_MASTER_ARCHIVE"
+        ordering = ["-PRCSDATE"]
+        indexes = [
+            models.Index(fields=["PRCSDATE", "INVOICEID"], name="TXNARCHIVE_DATE_ID_IDX"),
+            models.Index(fields=["CUSTEMAIL", "PRCSDATE"], name="TXNARCHIVE_EMAIL_DATE_IDX"),
+        ]
+
+    def __str__(self):
+        return f"Archived Invoice {self.INVOICEID} - {self.CUSTEMAIL}"
+
+
+class ArchivedInvoiceItem(models.Model):
+    INVOICEITEMID = models.IntegerField(primary_key=True)
+    INVOICE = models.ForeignKey(ArchivedInvoice, on_delete=models.CASCADE, related_name="items")
+    PRODUCT = models.ForeignKey(
+        "Product", on_delete=models.PROTECT, related_name="archived_items"
+    )
+
+    UNITPRICE = models.DecimalField(max_digits=10, decimal_places=2)
+    TAXPERCENT = models.DecimalField(max_digits=5, decimal_places=2)
+    QTY = models.PositiveIntegerField()
+
+    LINESUBTOTAL = models.DecimalField(max_digits=12, decimal_places=2)
+    LINETAX = models.DecimalField(max_digits=12, decimal_places=2)
+    LINETOTAL = models.DecimalField(max_digits=12, decimal_places=2)
 
+    PRCSDATE = models.DateTimeField()
 
+    class Meta:
+        db_table = "TRANSACTION_DETAILS_ARCHIVE"
+        ordering = ["INVOICEITEMID"]
+
+    def __str__(self):
+        return f"ArchivedInvoiceItem {self.INVOICEITEMID} - Invoice {self.INVOICE_id}"
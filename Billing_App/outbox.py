@@ -0,0 +1,127 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EmailOutbox, Invoice
+from .tasks import send_invoice_email_batch_task, send_invoice_emails
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_invoice_email(invoice):
+    # Written inside the checkout transaction: the row commits or rolls back with
+    # the invoice, and checkout never talks to the broker.
+    return EmailOutbox.objects.create(INVOICE=invoice)
+
+
+def _pending_batch(batch_size, after_id):
+    # No row locks are held while relaying, so a slow broker or SMTP server never
+    # holds up checkout writes. Overlapping relays are harmless: delivery skips
+    # invoices that are already sent or claimed by another worker.
+    return list(
+        EmailOutbox.objects.filter(STATUS=0, OUTBOXID__gt=after_id)
+        .order_by("OUTBOXID")
+        .values_list("OUTBOXID", "INVOICE_id")[:batch_size]
+    )
+
+
+def _record_attempt(outbox_ids, error):
+    with transaction.atomic():
+        EmailOutbox.objects.filter(OUTBOXID__in=outbox_ids).update(
+            ATTEMPTS=F("ATTEMPTS") + 1, LASTERROR=error
+        )
+        EmailOutbox.objects.filter(
+            OUTBOXID__in=outbox_ids, ATTEMPTS__gte=settings.BILLING_OUTBOX_MAX_ATTEMPTS
+        ).update(STATUS=2)
+
+
+def _record_queue_failure(outbox_ids, invoice_ids, exc):
+    error = str(exc)[:1000]
+    _record_attempt(outbox_ids, error)
+    Invoice.objects.filter(pk__in=invoice_ids).update(
+        EMAILFAILCOUNT=F("EMAILFAILCOUNT") + 1,
+        EMAILLASTERROR=f"Queue error: {error}",
+        EMAILSENT=False,
+    )
+
+
+def requeue_relayed(invoice_ids, error):
+    # Called when send_invoice_email_batch_task gives up on some invoices: their
+    # relayed rows go back to pending for the next relay pass, counting one
+    # attempt, so they end up failed after BILLING_OUTBOX_MAX_ATTEMPTS like rows
+    # the broker refused.
+    outbox_ids = list(
+        EmailOutbox.objects.filter(
+            STATUS=1, INVOICE_id__in=invoice_ids, INVOICE__EMAILSENT=False
+        ).values_list("OUTBOXID", flat=True)
+    )
+    with transaction.atomic():
+        EmailOutbox.objects.filter(OUTBOXID__in=outbox_ids).update(STATUS=0, RELAYEDDATE=None)
+        _record_attempt(outbox_ids, error[:1000])
+    return len(outbox_ids)
+
+
+def relay_batch(batch_size=None, direct=False, after_id=0):
+    # Moves one batch of pending rows to Celery, or straight to the mailer when
+    # direct=True. Returns (rows relayed, last OUTBOXID seen, broker_ok); rows
+    # that could not be relayed stay pending for the next run.
+    batch_size = batch_size or settings.BILLING_OUTBOX_BATCH_SIZE
+    rows = _pending_batch(batch_size, after_id)
+    if not rows:
+        return 0, after_id, True
+    last_id = rows[-1][0]
+    outbox_ids = [outbox_id for outbox_id, _ in rows]
+    invoice_ids = list(dict.fromkeys(invoice_id for _, invoice_id in rows))
+
+    if direct:
+        result = send_invoice_emails(invoice_ids)
+        failed = set(result["failed"])
+        failed_outbox_ids = [outbox_id for outbox_id, invoice_id in rows if invoice_id in failed]
+        if failed_outbox_ids:
+            _record_attempt(failed_outbox_ids, "Delivery failed")
+            outbox_ids = [
+                outbox_id for outbox_id in outbox_ids if outbox_id not in failed_outbox_ids
+            ]
+    else:
+        try:
+            send_invoice_email_batch_task.delay(invoice_ids)
+        except Exception as exc:
+            logger.exception("Failed to relay %s outbox rows to the broker", len(rows))
+            _record_queue_failure(outbox_ids, invoice_ids, exc)
+            return 0, last_id, False
+
+    EmailOutbox.objects.filter(OUTBOXID__in=outbox_ids).update(
+        STATUS=1, RELAYEDDATE=timezone.now(), LASTERROR=""
+    )
+    return len(outbox_ids), last_id, True
+
+
+def relay_outbox(batch_size=None, direct=False):
+    # One pass over the pending rows; each row is tried at most once per pass.
+    relayed = 0
+    last_id = 0
+    while True:
+        count, next_id, broker_ok = relay_batch(batch_size, direct=direct, after_id=last_id)
+        relayed += count
+        if not broker_ok or next_id == last_id:
+            return relayed
+        last_id = next_id
+
+
+def replay_outbox(since=None, until=None, invoice_ids=None, include_sent=False):
+    # Puts relayed/failed rows back to pending so the relay sends them again.
+    queryset = EmailOutbox.objects.exclude(STATUS=0)
+    if since:
+        queryset = queryset.filter(PRCSDATE__gte=since)
+    if until:
+        queryset = queryset.filter(PRCSDATE__lt=until)
+    if invoice_ids:
+        queryset = queryset.filter(INVOICE_id__in=invoice_ids)
+    if include_sent:
+        Invoice.objects.filter(pk__in=queryset.values("INVOICE_id")).update(EMAILSENT=False)
+    else:
+        queryset = queryset.filter(INVOICE__EMAILSENT=False)
+    return queryset.update(STATUS=0, ATTEMPTS=0, LASTERROR="", RELAYEDDATE=None)
@@ -0,0 +1,143 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+
+INVOICE_COUNT_KEY_PREFIX = "billing:invoice-count:"
+
+
+def encode_cursor(direction, invoice):
+    raw = json.dumps([direction, invoice.PRCSDATE.isoformat(), invoice.INVOICEID])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        direction, prcsdate, invoice_id = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ("next", "prev"):
+            return None
+        return direction, datetime.fromisoformat(prcsdate), int(invoice_id)
+    except (ValueError, TypeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, total_count=None, approximate=False):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.total_count = total_count
+        self.approximate = approximate
+        self.next_cursor = encode_cursor("next", object_list[-1]) if has_next else ""
+        self.previous_cursor = encode_cursor("prev", object_list[0]) if has_previous else ""
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _keyset_query(queryset, token, per_page):
+    # Seeks on (PRCSDATE, INVOICEID) instead of OFFSET, so every page costs one
+    # index range scan of per_page + 1 rows no matter how deep it is.
+    cursor = decode_cursor(token)
+    if cursor is None:
+        return "first", queryset.order_by("-PRCSDATE", "-INVOICEID")[: per_page + 1]
+
+    direction, prcsdate, invoice_id = cursor
+    if direction == "next":
+        return "next", queryset.filter(
+            Q(PRCSDATE__lt=prcsdate) | Q(PRCSDATE=prcsdate, INVOICEID__lt=invoice_id)
+        ).order_by("-PRCSDATE", "-INVOICEID")[: per_page + 1]
+    return "prev", queryset.filter(
+        Q(PRCSDATE__gt=prcsdate) | Q(PRCSDATE=prcsdate, INVOICEID__gt=invoice_id)
+    ).order_by("PRCSDATE", "INVOICEID")[: per_page + 1]
+
+
+def _keyset_page(direction, rows, per_page):
+    if direction == "first":
+        return KeysetPage(rows[:per_page], len(rows) > per_page, False)
+    if direction == "next":
+        return KeysetPage(rows[:per_page], len(rows) > per_page, True)
+
+    has_previous = len(rows) > per_page
+    rows = rows[:per_page]
+    rows.reverse()
+    if not has_previous and len(rows) < per_page:
+        # Walked back past the first page; the caller restarts from the top so
+        # it stays full.
+        return None
+    return KeysetPage(rows, True, has_previous)
+
+
+def keyset_invoice_page(queryset, token, per_page):
+    direction, query = _keyset_query(queryset, token, per_page)
+    page = _keyset_page(direction, list(query), per_page)
+    return page if page is not None else keyset_invoice_page(queryset, "", per_page)
+
+
+async def akeyset_invoice_page(queryset, token, per_page):
+    direction, query = _keyset_query(queryset, token, per_page)
+    page = _keyset_page(direction, [row async for row in query], per_page)
+    return page if page is not None else await akeyset_invoice_page(queryset, "", per_page)
+
+
+def _count_key(filters):
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True).encode("utf-8")).hexdigest()
+    return f"{INVOICE_COUNT_KEY_PREFIX}{digest}"
+
+
+def _estimated_count(queryset, filters):
+    # Exact counts on a very large table are the expensive part of a list page.
+    # Unfiltered PostgreSQL lists use the planner's row estimate instead.
+    connection = connections[queryset.db]
+    if any(filters.values()) or connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row and row[0] > 0 else None
+
+
+def invoice_total_count(queryset, filters):
+    # Exact counts are cached per filter set.
+    estimate = _estimated_count(queryset, filters)
+    if estimate is not None:
+        return estimate, True
+
+    key = _count_key(filters)
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, settings.BILLING_INVOICE_COUNT_CACHE_TIMEOUT)
+        return total, False
+    return total, True
+
+
+async def ainvoice_total_count(queryset, filters):
+    # The raw reltuples query has no async ORM form, so only it runs in a thread.
+    if connections[queryset.db].vendor == "postgresql":
+        estimate = await sync_to_async(_estimated_count)(queryset, filters)
+        if estimate is not None:
+            return estimate, True
+
+    key = _count_key(filters)
+    total = await cache.aget(key)
+    if total is None:
+        total = await queryset.acount()
+        await cache.aset(key, total, settings.BILLING_INVOICE_COUNT_CACHE_TIMEOUT)
+        return total, False
+    return total, True
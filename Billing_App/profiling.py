@@ -0,0 +1,172 @@
+import cProfile
+import json
+import pstats
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.template.backends.django import Template as DjangoTemplate
+from django.utils import timezone
+
+from .querystats import QueryRecorder, record_queries
+
+# Per-request profiles for slow-checkout reports. A profiled request leaves
+# three files in BILLING_PROFILE_DIR, sharing one name:
+#   <name>.prof       cProfile data (pstats / snakeviz)
+#   <name>.collapsed  sampled stacks, "frame;frame;frame count" lines, for
+#                     flamegraph.pl or speedscope
+#   <name>.json       wall, SQL, template and remaining Python time
+
+PROFILE_HEADER = "X-Billing-Profile"
+
+
+def should_profile(request):
+    # A trusted header (matching BILLING_PROFILE_TOKEN) always profiles;
+    # otherwise a random BILLING_PROFILE_SAMPLE_RATE share of requests.
+    token = settings.BILLING_PROFILE_TOKEN
+    if token and request.headers.get(PROFILE_HEADER, "") == token:
+        return True
+    rate = settings.BILLING_PROFILE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    # Samples one thread's Python stack from a helper thread. cProfile has no
+    # call stacks, so this is what the flamegraph is built from.
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            if labels:
+                self.stacks[";".join(reversed(labels))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class ProfileQueryRecorder(QueryRecorder):
+    # Also totals the SQL run while a template renders, e.g. a lazy queryset the
+    # template iterates. That time is inside Template.render's cumulative time
+    # as well, so it is taken out of the template share.
+
+    def __init__(self):
+        super().__init__()
+        self.template_duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        if not _rendering_template():
+            return super().__call__(execute, sql, params, many, context)
+        started = time.perf_counter()
+        try:
+            return super().__call__(execute, sql, params, many, context)
+        finally:
+            self.template_duration += time.perf_counter() - started
+
+
+def _rendering_template():
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code is DjangoTemplate.render.__code__:
+            return True
+        frame = frame.f_back
+    return False
+
+
+def _template_seconds(stats):
+    # render() and render_to_string() go through the backend's Template.render;
+    # {% include %} and {% extends %} do not, so each page is counted once.
+    total = 0.0
+    for (filename, _, name), (_, _, _, cumulative, _) in stats.stats.items():
+        if name == "render" and Path(filename).as_posix().endswith(
+            "django/template/backends/django.py"
+        ):
+            total += cumulative
+    return total
+
+
+def _rotate(directory, keep):
+    summaries = sorted(directory.glob("*.json"))
+    for summary in summaries[: max(0, len(summaries) - keep)]:
+        for suffix in (".json", ".prof", ".collapsed"):
+            summary.with_suffix(suffix).unlink(missing_ok=True)
+
+
+def profile_request(request, get_response):
+    # Returns the response; the profile files are written before returning.
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident(), settings.BILLING_PROFILE_INTERVAL)
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler already owns this thread.
+        return get_response(request)
+
+    started = time.perf_counter()
+    sampler.start()
+    try:
+        with record_queries(recorder=ProfileQueryRecorder()) as queries:
+            response = get_response(request)
+    finally:
+        sampler.stop()
+        profiler.disable()
+    wall = time.perf_counter() - started
+
+    directory = Path(settings.BILLING_PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    match = getattr(request, "resolver_match", None)
+    view = (match.url_name if match else "") or "unmatched"
+    name = f"{timezone.now():%Y%m%dT%H%M%S%f}-{view}-{uuid.uuid4().hex[:6]}"
+
+    profiler.dump_stats(directory / f"{name}.prof")
+    stats = pstats.Stats(profiler)
+    template_sql = queries.template_duration
+    template = max(0.0, _template_seconds(stats) - template_sql)
+    summary = {
+        "path": request.path,
+        "method": request.method,
+        "view": view,
+        "status": response.status_code,
+        "created": timezone.now().isoformat(),
+        "wall_ms": wall * 1000,
+        "sql_ms": queries.duration * 1000,
+        "sql_queries": queries.count,
+        # SQL issued from templates is counted under SQL only; template_sql_ms
+        # says how much of it there was.
+        "template_ms": template * 1000,
+        "template_sql_ms": template_sql * 1000,
+        "python_ms": max(0.0, wall - queries.duration - template) * 1000,
+        "samples": sum(sampler.stacks.values()),
+    }
+    (directory / f"{name}.collapsed").write_text(
+        "".join(f"{stack} {count}\n" for stack, count in sampler.stacks.most_common()),
+        encoding="utf-8",
+    )
+    (directory / f"{name}.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    _rotate(directory, settings.BILLING_PROFILE_KEEP)
+    response["X-Billing-Profile-Id"] = name
+    return response
@@ -0,0 +1,70 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+
+from .catalog import bump_catalog_version
+from .models import EmailOutbox, IdempotencyKey, Invoice, InvoiceItem
+from .reports import remove_invoices
+from .stock import restore_stock
+
+# Bulk removal of invoices for cleanups. invoice.delete() goes through Django's
+# collector, which loads every item (and outbox/idempotency row) to cascade and
+# send signals. Nothing listens for those models' delete signals, so a purge
+# deletes each chunk with plain DELETE ... WHERE INVOICE_id IN (...) statements,
+# children first, and keeps the sales summaries in step itself.
+
+
+def _raw_delete(queryset):
+    # DELETE without collecting rows; only safe for models with no cascades
+    # or delete signals of their own.
+    return queryset._raw_delete(queryset.db)
+
+
+def purge_batch(queryset, batch_size, restore=False):
+    # Deletes the next chunk of `queryset` in one transaction. Returns
+    # (invoices deleted, items deleted).
+    with transaction.atomic():
+        invoice_ids = list(
+            queryset.order_by("INVOICEID").values_list("INVOICEID", flat=True)[:batch_size]
+        )
+        if not invoice_ids:
+            return 0, 0
+
+        remove_invoices(invoice_ids)
+        if restore:
+            sold = (
+                InvoiceItem.objects.filter(INVOICE_id__in=invoice_ids)
+                .values("PRODUCT_id")
+                .annotate(qty=Sum("QTY"))
+                .order_by()
+            )
+            if restore_stock({row["PRODUCT_id"]: row["qty"] for row in sold}):
+                transaction.on_commit(bump_catalog_version)
+
+        _raw_delete(EmailOutbox.objects.filter(INVOICE_id__in=invoice_ids))
+        _raw_delete(IdempotencyKey.objects.filter(INVOICE_id__in=invoice_ids))
+        items = _raw_delete(InvoiceItem.objects.filter(INVOICE_id__in=invoice_ids))
+        invoices = _raw_delete(Invoice.objects.filter(INVOICEID__in=invoice_ids))
+    return invoices, items
+
+
+def purge_invoices(
+    queryset, batch_size=None, max_batches=None, restore=False, pause=0.0, progress=None
+):
+    batch_size = batch_size or settings.BILLING_PURGE_BATCH_SIZE
+    totals = {"invoices": 0, "items": 0, "batches": 0}
+    while max_batches is None or totals["batches"] < max_batches:
+        invoices, items = purge_batch(queryset, batch_size, restore)
+        if not invoices:
+            break
+        totals["invoices"] += invoices
+        totals["items"] += items
+        totals["batches"] += 1
+        if progress:
+            progress(totals)
+        if pause:
+            # Leaves the write lock free for checkouts between batches.
+            time.sleep(pause)
+    return totals
@@ -0,0 +1,46 @@
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+
+class QueryRecorder:
+    # Execute wrapper that counts statements and their time. SQL arrives with
+    # placeholders, so the same statement with different parameters counts as a
+    # repeat: the usual sign of a query inside a loop.
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def duplicates(self):
+        # [(sql, times)] for statements run more than once, most repeated first.
+        return [(sql, times) for sql, times in self.statements.most_common() if times > 1]
+
+    def summary(self, limit=3):
+        lines = [f"{self.count} queries in {self.duration * 1000:.1f} ms"]
+        for sql, times in self.duplicates()[:limit]:
+            lines.append(f"  {times}x {sql[:200]}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def record_queries(aliases=None, recorder=None):
+    # Records statements on every configured database (or the given aliases)
+    # issued from the current thread.
+    recorder = recorder or QueryRecorder()
+    with ExitStack() as stack:
+        for alias in aliases or connections:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
@@ -0,0 +1,115 @@
+import functools
+import hashlib
+import os
+from pathlib import Path
+
+from django.conf import settings
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+# Invoices never change after checkout, so each receipt is rendered once and
+# kept on disk as <BILLING_RECEIPT_DIR>/<id // 1000>/<id>-<key hash>.html. The key
+# is built from the receipt template's source and the invoice row alone (its
+# RECEIPTVERSION and PRCSDATE), so a cache hit needs neither the items nor a
+# payload. Editing the template gives every receipt a new key; bump
+# RECEIPTVERSION to re-render one invoice; PRCSDATE keeps a reused ID off an
+# old file. Writing a new file removes the invoice's older ones. The first
+# render normally happens in the Celery worker that emails the invoice, which
+# attaches the same file.
+RECEIPT_TEMPLATE = "Invoice/Receipt_Body.html"
+PRINT_TEMPLATE = "Invoice/Receipt_Print.html"
+
+
+@functools.cache
+def template_digest(*names):
+    # Hash of the templates' sources, read once per process: templates only
+    # change with a restart.
+    digest = hashlib.sha256()
+    for name in names:
+        digest.update(get_template(name).template.source.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def receipt_payload(invoice, items):
+    # Plain strings only, so rendering never touches the database.
+    return {
+        "invoice": {
+            field: str(getattr(invoice, field))
+            for field in (
+                "INVOICEID",
+                "CUSTNAME",
+                "CUSTEMAIL",
+                "GROSSAMT",
+                "TAXAMT",
+                "NETAMT",
+                "ROUNDEDPAYABLE",
+                "PAIDAMT",
+                "BALANCEAMT",
+            )
+        },
+        "items": [
+            {
+                "PRODCODE": item.PRODUCT.PRODCODE,
+                "PRODNAME": item.PRODUCT.PRODNAME,
+                "UNITPRICE": str(item.UNITPRICE),
+                "QTY": str(item.QTY),
+                "LINESUBTOTAL": str(item.LINESUBTOTAL),
+                "TAXPERCENT": str(item.TAXPERCENT),
+                "LINETAX": str(item.LINETAX),
+                "LINETOTAL": str(item.LINETOTAL),
+            }
+            for item in items
+        ],
+        "change_denoms": [
+            [str(value), str(count)] for value, count in invoice.CHANGE_DENOMS.items()
+        ],
+    }
+
+
+def receipt_path(invoice):
+    template = template_digest(RECEIPT_TEMPLATE)
+    key = f"{template}|{invoice.RECEIPTVERSION}|{invoice.PRCSDATE.isoformat()}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    directory = Path(settings.BILLING_RECEIPT_DIR) / str(invoice.INVOICEID // 1000)
+    return directory / f"{invoice.INVOICEID}-{digest[:16]}.html"
+
+
+def _write(path, html):
+    # Temp file + rename: readers never see a half-written receipt, and two
+    # workers rendering the same invoice just replace each other's identical file.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(html, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _remove_older_versions(path):
+    # Files of the same invoice under an earlier key can never be hit again.
+    invoice_id = path.name.split("-", 1)[0]
+    for old in path.parent.glob(f"{invoice_id}-*.html"):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+
+def render_receipt_file(path, payload):
+    path = Path(path)
+    html = render_to_string(RECEIPT_TEMPLATE, payload)
+    _write(path, html)
+    _remove_older_versions(path)
+    return html
+
+
+def get_receipt(invoice, items):
+    # Served from disk when present, otherwise rendered inline and stored.
+    # items may be a lazy queryset: it is only evaluated on a miss.
+    path = receipt_path(invoice)
+    try:
+        return mark_safe(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return mark_safe(render_receipt_file(path, receipt_payload(invoice, items)))
+
+
+def receipt_document(invoice, items):
+    return render_to_string(
+        PRINT_TEMPLATE, {"invoice_id": invoice.INVOICEID, "receipt": get_receipt(invoice, items)}
+    )
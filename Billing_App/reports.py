@@ -0,0 +1,295 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .archive import archive_boundary
+from .billing import ZERO
+from .filters import local_day_start
+from .models import DailyProductSales, DailySalesSummary, Invoice, InvoiceItem
+
+SUMMARY_FIELDS = ("INVOICECOUNT", "QTYSOLD", "GROSSAMT", "TAXAMT", "NETAMT")
+REBUILD_BATCH_SIZE = 1000
+
+
+def sales_day(invoice):
+    return timezone.localdate(invoice.PRCSDATE)
+
+
+def _deltas(invoice, items, sign):
+    day = {
+        "INVOICECOUNT": sign,
+        "QTYSOLD": 0,
+        "GROSSAMT": sign * invoice.GROSSAMT,
+        "TAXAMT": sign * invoice.TAXAMT,
+        "NETAMT": sign * invoice.NETAMT,
+    }
+    products = {}
+    for item in items:
+        day["QTYSOLD"] += sign * item.QTY
+        row = products.setdefault(
+            item.PRODUCT_id,
+            {"INVOICECOUNT": sign, "QTYSOLD": 0, "GROSSAMT": ZERO, "TAXAMT": ZERO, "NETAMT": ZERO},
+        )
+        row["QTYSOLD"] += sign * item.QTY
+        row["GROSSAMT"] += sign * item.LINESUBTOTAL
+        row["TAXAMT"] += sign * item.LINETAX
+        row["NETAMT"] += sign * item.LINETOTAL
+    return day, products
+
+
+def _increment(model, lookup, deltas):
+    changes = {field: F(field) + value for field, value in deltas.items()}
+    return model.objects.filter(**lookup).update(PRCSDATE=timezone.now(), **changes)
+
+
+def _upsert(model, lookup, deltas):
+    # UPDATE first: after the first sale of the day every checkout takes this
+    # path. The INSERT runs in a savepoint so a concurrent first sale that wins
+    # the unique key just turns this into another increment.
+    if _increment(model, lookup, deltas):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        _increment(model, lookup, deltas)
+
+
+def _increment_products(sales_date, products):
+    # One UPDATE for every product on the invoice, with a CASE per column, so
+    # checkout runs the same number of queries however many lines it has.
+    changes = {}
+    for field in SUMMARY_FIELDS:
+        output_field = DailyProductSales._meta.get_field(field)
+        whens = [
+            When(PRODUCT_id=product_id, then=Value(deltas[field], output_field=output_field))
+            for product_id, deltas in sorted(products.items())
+        ]
+        changes[field] = F(field) + Case(*whens, output_field=output_field)
+    return DailyProductSales.objects.filter(
+        SALESDATE=sales_date, PRODUCT_id__in=products.keys()
+    ).update(PRCSDATE=timezone.now(), **changes)
+
+
+def _upsert_products(sales_date, products):
+    existing = set(
+        DailyProductSales.objects.filter(
+            SALESDATE=sales_date, PRODUCT_id__in=products.keys()
+        ).values_list("PRODUCT_id", flat=True)
+    )
+    if existing:
+        _increment_products(
+            sales_date, {pid: deltas for pid, deltas in products.items() if pid in existing}
+        )
+    missing = {pid: deltas for pid, deltas in products.items() if pid not in existing}
+    if not missing:
+        return
+    try:
+        with transaction.atomic():
+            DailyProductSales.objects.bulk_create(
+                [
+                    DailyProductSales(SALESDATE=sales_date, PRODUCT_id=pid, **deltas)
+                    for pid, deltas in sorted(missing.items())
+                ]
+            )
+    except IntegrityError:
+        # Another checkout created some of these rows since the SELECT.
+        for product_id, deltas in sorted(missing.items()):
+            _upsert(DailyProductSales, {"SALESDATE": sales_date, "PRODUCT_id": product_id}, deltas)
+
+
+def record_invoice(invoice, items):
+    # Called inside the checkout transaction, so the summaries commit or roll
+    # back with the invoice itself.
+    day, products = _deltas(invoice, items, 1)
+    sales_date = sales_day(invoice)
+    _upsert(DailySalesSummary, {"SALESDATE": sales_date}, day)
+    if products:
+        _upsert_products(sales_date, products)
+
+
+def remove_invoice(invoice):
+    # Must run before the invoice (and its cascaded items) is deleted.
+    day, products = _deltas(invoice, list(invoice.items.all()), -1)
+    sales_date = sales_day(invoice)
+    with transaction.atomic():
+        _increment(DailySalesSummary, {"SALESDATE": sales_date}, day)
+        DailySalesSummary.objects.filter(SALESDATE=sales_date, INVOICECOUNT__lte=0).delete()
+        if products:
+            _increment_products(sales_date, products)
+        DailyProductSales.objects.filter(SALESDATE=sales_date, INVOICECOUNT__lte=0).delete()
+
+
+def remove_invoices(invoice_ids):
+    # Bulk form of remove_invoice for purges: the deltas come from two GROUP BY
+    # queries over the batch instead of loading its items. Must run before the
+    # rows are deleted, in the same transaction.
+    tzinfo = timezone.get_current_timezone()
+    invoice_days = (
+        Invoice.objects.filter(INVOICEID__in=invoice_ids)
+        .annotate(day=TruncDate("PRCSDATE", tzinfo=tzinfo))
+        .values("day")
+        .annotate(
+            invoice_count=Count("INVOICEID"),
+            gross=Sum("GROSSAMT"),
+            tax=Sum("TAXAMT"),
+            net=Sum("NETAMT"),
+        )
+        .order_by("day")
+    )
+    product_days = (
+        InvoiceItem.objects.filter(INVOICE_id__in=invoice_ids)
+        .annotate(day=TruncDate("INVOICE__PRCSDATE", tzinfo=tzinfo))
+        .values("day", "PRODUCT_id")
+        .annotate(
+            invoice_count=Count("INVOICE_id", distinct=True),
+            qty=Sum("QTY"),
+            gross=Sum("LINESUBTOTAL"),
+            tax=Sum("LINETAX"),
+            net=Sum("LINETOTAL"),
+        )
+        .order_by("day", "PRODUCT_id")
+    )
+
+    products_by_day = {}
+    for row in product_days:
+        products_by_day.setdefault(row["day"], {})[row["PRODUCT_id"]] = {
+            "INVOICECOUNT": -row["invoice_count"],
+            "QTYSOLD": -row["qty"],
+            "GROSSAMT": -row["gross"],
+            "TAXAMT": -row["tax"],
+            "NETAMT": -row["net"],
+        }
+    days = []
+    for row in invoice_days:
+        products = products_by_day.get(row["day"], {})
+        day = {
+            "INVOICECOUNT": -row["invoice_count"],
+            "QTYSOLD": sum(deltas["QTYSOLD"] for deltas in products.values()),
+            "GROSSAMT": -row["gross"],
+            "TAXAMT": -row["tax"],
+            "NETAMT": -row["net"],
+        }
+        _increment(DailySalesSummary, {"SALESDATE": row["day"]}, day)
+        if products:
+            _increment_products(row["day"], products)
+        days.append(row["day"])
+    DailySalesSummary.objects.filter(SALESDATE__in=days, INVOICECOUNT__lte=0).delete()
+    DailyProductSales.objects.filter(SALESDATE__in=days, INVOICECOUNT__lte=0).delete()
+    return days
+
+
+def _date_range(queryset, field, from_date, to_date):
+    if from_date:
+        queryset = queryset.filter(**{f"{field}__gte": local_day_start(from_date)})
+    if to_date:
+        queryset = queryset.filter(
+            **{f"{field}__lt": local_day_start(to_date + timedelta(days=1))}
+        )
+    return queryset
+
+
+def _summary_range(queryset, from_date, to_date):
+    if from_date:
+        queryset = queryset.filter(SALESDATE__gte=from_date)
+    if to_date:
+        queryset = queryset.filter(SALESDATE__lte=to_date)
+    return queryset
+
+
+def rebuild_sales_summaries(from_date=None, to_date=None):
+    # Backfill/repair: recomputes whole days from the transaction tables with
+    # two GROUP BY queries and replaces the summary rows for those days.
+    # Archived days keep the summaries written while they were live, since the
+    # transaction tables no longer hold their rows.
+    boundary = archive_boundary()
+    if boundary is not None:
+        first_live_day = timezone.localdate(boundary) + timedelta(days=1)
+        from_date = max(from_date or first_live_day, first_live_day)
+        if to_date is not None and to_date < from_date:
+            return 0, 0
+    tzinfo = timezone.get_current_timezone()
+    invoice_days = (
+        _date_range(Invoice.objects.all(), "PRCSDATE", from_date, to_date)
+        .annotate(day=TruncDate("PRCSDATE", tzinfo=tzinfo))
+        .values("day")
+        .annotate(
+            invoice_count=Count("INVOICEID"),
+            gross=Sum("GROSSAMT"),
+            tax=Sum("TAXAMT"),
+            net=Sum("NETAMT"),
+        )
+        .order_by("day")
+    )
+    product_days = (
+        _date_range(InvoiceItem.objects.all(), "INVOICE__PRCSDATE", from_date, to_date)
+        .annotate(day=TruncDate("INVOICE__PRCSDATE", tzinfo=tzinfo))
+        .values("day", "PRODUCT_id")
+        .annotate(
+            invoice_count=Count("INVOICE_id", distinct=True),
+            qty=Sum("QTY"),
+            gross=Sum("LINESUBTOTAL"),
+            tax=Sum("LINETAX"),
+            net=Sum("LINETOTAL"),
+        )
+        .order_by("day", "PRODUCT_id")
+    )
+
+    qty_by_day = {}
+    product_rows = []
+    for row in product_days.iterator():
+        qty_by_day[row["day"]] = qty_by_day.get(row["day"], 0) + row["qty"]
+        product_rows.append(
+            DailyProductSales(
+                SALESDATE=row["day"],
+                PRODUCT_id=row["PRODUCT_id"],
+                INVOICECOUNT=row["invoice_count"],
+                QTYSOLD=row["qty"],
+                GROSSAMT=row["gross"],
+                TAXAMT=row["tax"],
+                NETAMT=row["net"],
+            )
+        )
+    day_rows = [
+        DailySalesSummary(
+            SALESDATE=row["day"],
+            INVOICECOUNT=row["invoice_count"],
+            QTYSOLD=qty_by_day.get(row["day"], 0),
+            GROSSAMT=row["gross"],
+            TAXAMT=row["tax"],
+            NETAMT=row["net"],
+        )
+        for row in invoice_days.iterator()
+    ]
+
+    with transaction.atomic():
+        _summary_range(DailySalesSummary.objects.all(), from_date, to_date).delete()
+        _summary_range(DailyProductSales.objects.all(), from_date, to_date).delete()
+        DailySalesSummary.objects.bulk_create(day_rows, batch_size=REBUILD_BATCH_SIZE)
+        DailyProductSales.objects.bulk_create(product_rows, batch_size=REBUILD_BATCH_SIZE)
+    return len(day_rows), len(product_rows)
+
+
+def sales_report(from_date, to_date, top_products=10):
+    # Reads only the summary tables: a year is at most 366 day rows plus one
+    # grouped scan of the per-product rows.
+    days = list(
+        _summary_range(DailySalesSummary.objects.all(), from_date, to_date).order_by("SALESDATE")
+    )
+    totals = {field: sum((getattr(day, field) for day in days), 0) for field in SUMMARY_FIELDS}
+    products = list(
+        _summary_range(DailyProductSales.objects.all(), from_date, to_date)
+        .values("PRODUCT_id", "PRODUCT__PRODNAME", "PRODUCT__PRODCODE")
+        .annotate(
+            invoice_count=Sum("INVOICECOUNT"),
+            qty=Sum("QTYSOLD"),
+            gross=Sum("GROSSAMT"),
+            tax=Sum("TAXAMT"),
+            net=Sum("NETAMT"),
+        )
+        .order_by("-net", "PRODUCT_id")[:top_products]
+    )
+    return {"days": days, "totals": totals, "products": products}
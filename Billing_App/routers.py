@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Reads go to the primary unless the current request (or a command) opted in
+# with replica_reads(). Writes always go to the primary.
+_replica_allowed = ContextVar("billing_replica_allowed", default=False)
+
+
+def replica_alias():
+    return settings.BILLING_REPLICA_DATABASE
+
+
+def current_read_alias():
+    alias = replica_alias()
+    if not alias or not _replica_allowed.get():
+        return DEFAULT_DB_ALIAS
+    # Inside a transaction on the primary, read what that transaction sees.
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    token = _replica_allowed.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_allowed.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return current_read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return True
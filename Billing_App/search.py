@@ -0,0 +1,177 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# SQLite keeps an FTS5 index per searchable table, filled by triggers on the base
+# table so bulk inserts, queryset updates and raw deletes stay in sync.
+# PostgreSQL uses trigram GIN indexes that serve the existing icontains lookups.
+SEARCH_TABLES = {
+    "INVOICE_SEARCH": ("TRANSACTION_MASTER", "INVOICEID"),
+    "CUSTOMER_SEARCH": ("CUSTOMER_MASTER", "CUSTID"),
+}
+SEARCH_COLUMNS = ("CUSTNAME", "CUSTEMAIL")
+TRIGRAM_INDEXES = {
+    "TXNMASTER_NAME_TRGM_IDX": ("TRANSACTION_MASTER", "CUSTNAME"),
+    "TXNMASTER_EMAIL_TRGM_IDX": ("TRANSACTION_MASTER", "CUSTEMAIL"),
+    "CUSTMASTER_NAME_TRGM_IDX": ("CUSTOMER_MASTER", "CUSTNAME"),
+    "CUSTMASTER_EMAIL_TRGM_IDX": ("CUSTOMER_MASTER", "CUSTEMAIL"),
+}
+
+_TOKEN_RE = re.compile(r"[^\W_]+")
+_fts_ready = {}
+
+
+def _sqlite_schema(search_table):
+    base_table, pk = SEARCH_TABLES[search_table]
+    columns = ", ".join(SEARCH_COLUMNS)
+    new_values = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+    old_values = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+    delete_old = (
+        f"INSERT INTO {search_table}({search_table}, rowid, {columns}) "
+        f"VALUES ('delete', old.{pk}, {old_values});"
+    )
+    insert_new = f"INSERT INTO {search_table}(rowid, {columns}) VALUES (new.{pk}, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {search_table} USING fts5("
+        f"{columns}, content='{base_table}', content_rowid='{pk}', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {search_table}_AI AFTER INSERT ON {base_table} "
+        f"BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {search_table}_AD AFTER DELETE ON {base_table} "
+        f"BEGIN {delete_old} END",
+        f"CREATE TRIGGER IF NOT EXISTS {search_table}_AU AFTER UPDATE OF {columns} "
+        f"ON {base_table} BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def _missing_sqlite_objects(cursor):
+    expected = set()
+    for search_table in SEARCH_TABLES:
+        expected.update(
+            [search_table, f"{search_table}_AI", f"{search_table}_AD", f"{search_table}_AU"]
+        )
+    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+    return expected - {row[0] for row in cursor.fetchall()}
+
+
+def install_search(connection):
+    # Idempotent. Table rebuilds in SQLite migrations drop triggers, so this also
+    # runs after every migrate and re-indexes when anything had to be recreated.
+    _fts_ready.clear()
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            if not _missing_sqlite_objects(cursor):
+                return False
+            for search_table in SEARCH_TABLES:
+                for statement in _sqlite_schema(search_table):
+                    cursor.execute(statement)
+        rebuild_search_index(connection)
+        return True
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for index_name, (table, column) in TRIGRAM_INDEXES.items():
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" '
+                    f'USING gin (UPPER("{column}"::text) gin_trgm_ops)'
+                )
+        return True
+    return False
+
+
+def uninstall_search(connection):
+    _fts_ready.clear()
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            for search_table in SEARCH_TABLES:
+                for suffix in ("AI", "AD", "AU"):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {search_table}_{suffix}")
+                cursor.execute(f"DROP TABLE IF EXISTS {search_table}")
+        elif connection.vendor == "postgresql":
+            for index_name in TRIGRAM_INDEXES:
+                cursor.execute(f'DROP INDEX IF EXISTS "{index_name}"')
+
+
+def rebuild_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            for search_table in SEARCH_TABLES:
+                cursor.execute(f"INSERT INTO {search_table}({search_table}) VALUES ('rebuild')")
+        elif connection.vendor == "postgresql":
+            for index_name in TRIGRAM_INDEXES:
+                cursor.execute(f'REINDEX INDEX "{index_name}"')
+
+
+def fts_enabled(connection):
+    if connection.vendor != "sqlite":
+        return False
+    key = (connection.alias, str(connection.settings_dict["NAME"]))
+    ready = _fts_ready.get(key)
+    if ready is None:
+        with connection.cursor() as cursor:
+            ready = not _missing_sqlite_objects(cursor)
+        _fts_ready[key] = ready
+    return ready
+
+
+def search_tokens(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _all_tokens(column, tokens):
+    return " AND ".join(f'{column}"{token}"*' for token in tokens)
+
+
+def _phrase(column, tokens):
+    # Email parts must stay adjacent ("bob@exa" -> "bob exa"*), names need not.
+    return f'{column}"{" ".join(tokens)}" *'
+
+
+def _match(search_table, expression):
+    return RawSQL(
+        f"SELECT rowid FROM {search_table} WHERE {search_table} MATCH %s", [expression]
+    )
+
+
+def search_invoices(queryset, customer_name="", customer_email=""):
+    # The FTS index only covers the live table; archived invoices use icontains.
+    use_fts = (
+        bool(customer_name or customer_email)
+        and queryset.model._meta.db_table == SEARCH_TABLES["INVOICE_SEARCH"][0]
+        and fts_enabled(connections[queryset.db])
+    )
+    parts = []
+    if customer_name:
+        tokens = search_tokens(customer_name)
+        if use_fts and tokens:
+            parts.append(_all_tokens("CUSTNAME : ", tokens))
+        else:
+            queryset = queryset.filter(CUSTNAME__icontains=customer_name)
+    if customer_email:
+        tokens = search_tokens(customer_email)
+        if use_fts and tokens:
+            parts.append(_phrase("CUSTEMAIL : ", tokens))
+        else:
+            queryset = queryset.filter(CUSTEMAIL__icontains=customer_email)
+    if parts:
+        queryset = queryset.filter(INVOICEID__in=_match("INVOICE_SEARCH", " AND ".join(parts)))
+    return queryset
+
+
+def search_customers(queryset, text):
+    tokens = search_tokens(text)
+    if not fts_enabled(connections[queryset.db]) or not tokens:
+        return queryset.filter(Q(CUSTNAME__icontains=text) | Q(CUSTEMAIL__icontains=text))
+
+    expression = _all_tokens("", tokens)
+    rank = RawSQL(
+        "SELECT rank FROM CUSTOMER_SEARCH WHERE CUSTOMER_SEARCH MATCH %s "
+        'AND rowid = "CUSTOMER_MASTER"."CUSTID"',
+        [expression],
+    )
+    return (
+        queryset.filter(CUSTID__in=_match("CUSTOMER_SEARCH", expression))
+        .annotate(search_rank=rank)
+        .order_by("search_rank", "CUSTNAME")
+    )
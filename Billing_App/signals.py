@@ -0,0 +1,41 @@
+from django.db import connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalog import bump_catalog_version
+from .change import bump_denomination_version
+from .models import Customer, Denomination, Product
+from .search import install_search
+
+
+def _bump_now_and_on_commit(bump):
+    bump()
+    # A reader that saw the first bump before this transaction committed may have
+    # cached the old rows under the new version; the second bump retires them.
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=Denomination)
+@receiver(post_delete, sender=Denomination)
+def denomination_changed(sender, **kwargs):
+    _bump_now_and_on_commit(bump_denomination_version)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Denomination)
+@receiver(post_delete, sender=Denomination)
+def catalog_changed(sender, **kwargs):
+    _bump_now_and_on_commit(bump_catalog_version)
+
+
+def ensure_search_index(sender, using, **kwargs):
+    # Connected to post_migrate in apps.py: SQLite table rebuilds drop the FTS
+    # triggers, so put them back whenever the search migration is applied.
+    connection = connections[using]
+    applied = MigrationRecorder(connection).applied_migrations()
+    if ("Billing_App", "0009_search_index") in applied:
+        install_search(connection)
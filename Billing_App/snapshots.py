@@ -0,0 +1,289 @@
+import glob
+import json
+import os
+import shutil
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import groupby
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Invoice, InvoiceItem
+
+# Append-only Parquet snapshots, partitioned by local invoice month:
+#   <output>/invoices/month=YYYY-MM/part-<start key>.parquet
+#   <output>/items/month=YYYY-MM/...
+#   <output>/denominations/month=YYYY-MM/...
+# _watermark.json records the (PRCSDATE, INVOICEID) of the last exported
+# invoice; each run reads invoices after it in that order. IDs are not handed
+# out in commit order, so a run stops BILLING_SNAPSHOT_LAG_SECONDS short of now
+# and an invoice still committing (or not yet on the replica) is picked up by a
+# later run. pyarrow is optional and only imported when writing.
+WATERMARK_FILE = "_watermark.json"
+WATERMARK_KEYS = {"last_prcsdate", "last_invoice_id"}
+SNAPSHOT_CHUNK_SIZE = 10000
+DATASETS = ("invoices", "items", "denominations")
+
+INVOICE_FIELDS = (
+    "INVOICEID",
+    "PRCSDATE",
+    "CUSTNAME",
+    "CUSTEMAIL",
+    "GROSSAMT",
+    "TAXAMT",
+    "NETAMT",
+    "ROUNDEDPAYABLE",
+    "PAIDAMT",
+    "BALANCEAMT",
+    "EMAILSENT",
+    "RECEIVED_DENOMS",
+    "CHANGE_DENOMS",
+)
+ITEM_FIELDS = (
+    "INVOICEITEMID",
+    "INVOICE_id",
+    "PRODUCT_id",
+    "PRODUCT__PRODCODE",
+    "PRODUCT__PRODNAME",
+    "QTY",
+    "UNITPRICE",
+    "TAXPERCENT",
+    "LINESUBTOTAL",
+    "LINETAX",
+    "LINETOTAL",
+)
+
+
+def arrow_schemas(pa):
+    money = pa.decimal128(12, 2)
+    timestamp = pa.timestamp("us", tz="UTC")
+    return {
+        "invoices": pa.schema(
+            [
+                ("INVOICEID", pa.int64()),
+                ("PRCSDATE", timestamp),
+                ("CUSTNAME", pa.string()),
+                ("CUSTEMAIL", pa.string()),
+                ("GROSSAMT", money),
+                ("TAXAMT", money),
+                ("NETAMT", money),
+                ("ROUNDEDPAYABLE", money),
+                ("PAIDAMT", money),
+                ("BALANCEAMT", money),
+                ("EMAILSENT", pa.bool_()),
+                ("CHANGE_REMAINING", pa.int64()),
+            ]
+        ),
+        "items": pa.schema(
+            [
+                ("INVOICEITEMID", pa.int64()),
+                ("INVOICEID", pa.int64()),
+                ("PRCSDATE", timestamp),
+                ("PRODID", pa.int64()),
+                ("PRODCODE", pa.string()),
+                ("PRODNAME", pa.string()),
+                ("QTY", pa.int64()),
+                ("UNITPRICE", pa.decimal128(10, 2)),
+                ("TAXPERCENT", pa.decimal128(5, 2)),
+                ("LINESUBTOTAL", money),
+                ("LINETAX", money),
+                ("LINETOTAL", money),
+            ]
+        ),
+        "denominations": pa.schema(
+            [
+                ("INVOICEID", pa.int64()),
+                ("PRCSDATE", timestamp),
+                ("KIND", pa.string()),
+                ("DENOMVALUE", pa.int64()),
+                ("NOTECOUNT", pa.int64()),
+            ]
+        ),
+    }
+
+
+class InvalidWatermark(Exception):
+    pass
+
+
+def load_watermark(output):
+    path = os.path.join(output, WATERMARK_FILE)
+    try:
+        with open(path, encoding="utf-8") as handle:
+            watermark = json.load(handle)
+    except FileNotFoundError:
+        return {"last_prcsdate": None, "last_invoice_id": 0}
+    except ValueError:
+        watermark = None
+    if not isinstance(watermark, dict) or not WATERMARK_KEYS <= set(watermark):
+        raise InvalidWatermark(f"{path} is not a snapshot watermark; run --full to start over.")
+    return watermark
+
+
+def watermark_key(watermark):
+    if watermark["last_prcsdate"] is None:
+        return None
+    return datetime.fromisoformat(watermark["last_prcsdate"]), watermark["last_invoice_id"]
+
+
+def save_watermark(output, watermark):
+    # Written to a temp file and renamed, so a crash never leaves a torn file.
+    path = os.path.join(output, WATERMARK_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as handle:
+        json.dump(watermark, handle)
+    os.replace(f"{path}.tmp", path)
+
+
+def flatten_denominations(invoice_id, prcsdate, received, change):
+    # {"500": 2} -> one row per note value. The non-numeric "remaining" change
+    # entry becomes the invoice's CHANGE_REMAINING column instead.
+    rows = []
+    for kind, counts in (("received", received or {}), ("change", change or {})):
+        for value, count in counts.items():
+            if str(value).isdigit() and count:
+                rows.append(
+                    {
+                        "INVOICEID": invoice_id,
+                        "PRCSDATE": prcsdate,
+                        "KIND": kind,
+                        "DENOMVALUE": int(value),
+                        "NOTECOUNT": int(count),
+                    }
+                )
+    return rows
+
+
+def _month(prcsdate):
+    return f"{timezone.localtime(prcsdate):%Y-%m}"
+
+
+def _utc(prcsdate):
+    return prcsdate.astimezone(dt_timezone.utc)
+
+
+def snapshot_chunks(after=None, until=None, chunk_size=None):
+    # Yields ((PRCSDATE, INVOICEID) of the last invoice, {dataset: {month: [row
+    # dicts]}}) per chunk of invoices after the `after` key and created before
+    # `until`, in TXNMASTER_DATE_ID_IDX order. Invoices come from one chunked
+    # values_list cursor and items from one query per chunk.
+    chunk_size = chunk_size or SNAPSHOT_CHUNK_SIZE
+    invoices = Invoice.objects.all()
+    if after is not None:
+        prcsdate, invoice_id = after
+        invoices = invoices.filter(
+            Q(PRCSDATE__gt=prcsdate) | Q(PRCSDATE=prcsdate, INVOICEID__gt=invoice_id)
+        )
+    if until is not None:
+        invoices = invoices.filter(PRCSDATE__lt=until)
+    invoices = (
+        invoices.order_by("PRCSDATE", "INVOICEID")
+        .values_list(*INVOICE_FIELDS)
+        .iterator(chunk_size=chunk_size)
+    )
+    chunk = []
+    for invoice in invoices:
+        chunk.append(invoice)
+        if len(chunk) == chunk_size:
+            yield (chunk[-1][1], chunk[-1][0]), _chunk_rows(chunk)
+            chunk = []
+    if chunk:
+        yield (chunk[-1][1], chunk[-1][0]), _chunk_rows(chunk)
+
+
+def _chunk_rows(chunk):
+    tables = {dataset: {} for dataset in DATASETS}
+    dates = {}
+    for invoice in chunk:
+        row = dict(zip(INVOICE_FIELDS, invoice))
+        received = row.pop("RECEIVED_DENOMS")
+        change = row.pop("CHANGE_DENOMS")
+        month = _month(row["PRCSDATE"])
+        row["PRCSDATE"] = _utc(row["PRCSDATE"])
+        row["CHANGE_REMAINING"] = int((change or {}).get("remaining", 0))
+        dates[row["INVOICEID"]] = (month, row["PRCSDATE"])
+        tables["invoices"].setdefault(month, []).append(row)
+        tables["denominations"].setdefault(month, []).extend(
+            flatten_denominations(row["INVOICEID"], row["PRCSDATE"], received, change)
+        )
+
+    items = (
+        InvoiceItem.objects.filter(INVOICE_id__in=list(dates))
+        .order_by("INVOICE_id", "INVOICEITEMID")
+        .values_list(*ITEM_FIELDS)
+    )
+    for invoice_id, group in groupby(items, key=lambda item: item[1]):
+        month, prcsdate = dates[invoice_id]
+        for item in group:
+            row = dict(zip(ITEM_FIELDS, item))
+            tables["items"].setdefault(month, []).append(
+                {
+                    "INVOICEITEMID": row["INVOICEITEMID"],
+                    "INVOICEID": invoice_id,
+                    "PRCSDATE": prcsdate,
+                    "PRODID": row["PRODUCT_id"],
+                    "PRODCODE": row["PRODUCT__PRODCODE"],
+                    "PRODNAME": row["PRODUCT__PRODNAME"],
+                    "QTY": row["QTY"],
+                    "UNITPRICE": row["UNITPRICE"],
+                    "TAXPERCENT": row["TAXPERCENT"],
+                    "LINESUBTOTAL": row["LINESUBTOTAL"],
+                    "LINETAX": row["LINETAX"],
+                    "LINETOTAL": row["LINETOTAL"],
+                }
+            )
+    return tables
+
+
+def _part_name(after):
+    # Named after the key the chunk starts from: a re-run after a crash between
+    # the write and the watermark update starts from the same key again.
+    if after is None:
+        return "part-start.parquet"
+    prcsdate, invoice_id = after
+    return f"part-{_utc(prcsdate):%Y%m%dT%H%M%S%f}-{invoice_id:010d}.parquet"
+
+
+def write_snapshot(output, chunk_size=None, full=False):
+    # Raises ImportError when pyarrow is not installed.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schemas = arrow_schemas(pa)
+    os.makedirs(output, exist_ok=True)
+    if full:
+        # The watermark goes with the files even when no invoice is past the
+        # lag yet, or the next incremental run would skip everything before it.
+        for dataset in DATASETS:
+            shutil.rmtree(os.path.join(output, dataset), ignore_errors=True)
+        try:
+            os.remove(os.path.join(output, WATERMARK_FILE))
+        except FileNotFoundError:
+            pass
+    after = None if full else watermark_key(load_watermark(output))
+    until = timezone.now() - timedelta(seconds=settings.BILLING_SNAPSHOT_LAG_SECONDS)
+    totals = {dataset: 0 for dataset in DATASETS}
+
+    for last, tables in snapshot_chunks(after, until, chunk_size):
+        part = _part_name(after)
+        for stale in glob.glob(os.path.join(output, "*", "month=*", part)):
+            os.remove(stale)
+        for dataset, months in tables.items():
+            for month, rows in months.items():
+                if not rows:
+                    continue
+                directory = os.path.join(output, dataset, f"month={month}")
+                os.makedirs(directory, exist_ok=True)
+                table = pa.Table.from_pylist(rows, schema=schemas[dataset])
+                pq.write_table(table, os.path.join(directory, part), compression="zstd")
+                totals[dataset] += len(rows)
+        after = last
+        save_watermark(
+            output,
+            {
+                "last_prcsdate": last[0].isoformat(),
+                "last_invoice_id": last[1],
+                "updated": timezone.now().isoformat(),
+            },
+        )
+    return totals
@@ -0,0 +1,47 @@
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+
+from .models import Product
+
+
+class InsufficientStockError(Exception):
+    def __init__(self, product_qty_map):
+        super().__init__("Insufficient stock for one or more products.")
+        self.product_qty_map = product_qty_map
+
+
+def decrement_stock(product_qty_map):
+    # One guarded UPDATE for the whole cart. A row is only touched when it still
+    # has enough stock, so a short affected-row count means another checkout won
+    # the race; the caller's transaction must be rolled back.
+    if not product_qty_map:
+        return 0
+
+    guard = Q()
+    whens = []
+    for pid, qty in product_qty_map.items():
+        guard |= Q(PRODID=pid, PROAVASTOCK__gte=qty)
+        whens.append(When(PRODID=pid, then=qty))
+
+    updated = Product.objects.filter(guard).update(
+        PROAVASTOCK=F("PROAVASTOCK") - Case(*whens, output_field=PositiveIntegerField())
+    )
+    if updated != len(product_qty_map):
+        raise InsufficientStockError(product_qty_map)
+    return updated
+
+
+def restore_stock(product_qty_map):
+    # Puts quantities back on the shelf with one UPDATE for all the products.
+    if not product_qty_map:
+        return 0
+    whens = [When(PRODID=pid, then=qty) for pid, qty in sorted(product_qty_map.items())]
+    return Product.objects.filter(PRODID__in=product_qty_map.keys()).update(
+        PROAVASTOCK=F("PROAVASTOCK") + Case(*whens, output_field=PositiveIntegerField())
+    )
+
+
+def find_stock_shortfalls(product_qty_map):
+    products = Product.objects.filter(PRODID__in=product_qty_map.keys())
+    return [
+        product for product in products if product.PROAVASTOCK < product_qty_map[product.PRODID]
+    ]
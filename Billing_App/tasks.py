@@ -1,14 +1,22 @@
 import logging
+import uuid
+from datetime import timedelta
 
 from celery import shared_task
+from celery.signals import task_postrun
 from django.conf import settings
-from django.core.mail import send_mail
-from django.db.models import F
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Prefetch, Q
+from django.utils import timezone
 
-from .models import Invoice
+from . import metrics
+from .models import Invoice, InvoiceItem
+from .receipts import receipt_document
 
 logger = logging.getLogger(__name__)
 
+EMAIL_CLAIM_TIMEOUT = 300
+
 
 def _build_invoice_email_body(invoice):
     lines = [
@@ -19,7 +27,9 @@ def _build_invoice_email_body(invoice):
         "Purchased Items:",
     ]
 
-    for item in invoice.items.select_related("PRODUCT").all():
+    # Callers load invoices through _invoice_email_queryset(), so this reads the
+    # prefetched items instead of issuing a query per invoice.
+    for item in invoice.items.all():
         lines.append(
             f"- {item.PRODUCT.PRODNAME} ({item.PRODUCT.PRODCODE}) | Qty: {item.QTY} | "
             f"Unit: {item.UNITPRICE} | Tax: {item.LINETAX} | Total: {item.LINETOTAL}"
@@ -41,30 +51,184 @@ def _build_invoice_email_body(invoice):
     return "\n".join(lines)
 
 
-@shared_task(bind=True, max_retries=5, retry_backoff=True, retry_jitter=True)
-def send_invoice_email_task(self, invoice_id):
+def _invoice_email_queryset():
+    return Invoice.objects.prefetch_related(
+        Prefetch("items", queryset=InvoiceItem.objects.select_related("PRODUCT"))
+    )
+
+
+def _build_invoice_email(invoice, connection):
+    message = EmailMessage(
+        subject=f"Invoice #{invoice.INVOICEID}",
+        body=_build_invoice_email_body(invoice),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[invoice.CUSTEMAIL],
+        connection=connection,
+    )
+    # Same cached receipt as the detail page. Delivery normally comes first, so
+    # this is where the receipt is rendered and stored for later views.
+    message.attach(
+        f"receipt-{invoice.INVOICEID}.html",
+        receipt_document(invoice, invoice.items.all()),
+        "text/html",
+    )
+    return message
+
+
+def _claim(invoice_ids):
+    # Several workers can pick up the same pending invoice. One conditional
+    # UPDATE stamps the unclaimed (or abandoned) rows with a fresh token; only
+    # the rows carrying this worker's token are sent by it.
+    token = uuid.uuid4()
+    now = timezone.now()
+    Invoice.objects.filter(pk__in=invoice_ids, EMAILSENT=False).filter(
+        Q(EMAILCLAIM__isnull=True)
+        | Q(EMAILCLAIMEDAT__lt=now - timedelta(seconds=EMAIL_CLAIM_TIMEOUT))
+    ).update(EMAILCLAIM=token, EMAILCLAIMEDAT=now)
+    return token
+
+
+def _release(token, keep=()):
+    Invoice.objects.filter(EMAILCLAIM=token).exclude(pk__in=keep).update(
+        EMAILCLAIM=None, EMAILCLAIMEDAT=None
+    )
+
+
+def send_invoice_emails(invoice_ids):
+    # Renders every unsent invoice in one prefetch query, delivers them over a
+    # single mail connection and records the outcome with two bulk UPDATEs.
+    token = _claim(invoice_ids)
+    sent = []
+    failed = []
     try:
-        invoice = Invoice.objects.get(pk=invoice_id)
-        subject = f"Invoice #{invoice.INVOICEID}"
-        body = _build_invoice_email_body(invoice)
-
-        send_mail(
-            subject=subject,
-            message=body,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[invoice.CUSTEMAIL],
-            fail_silently=False,
+        invoices = list(_invoice_email_queryset().filter(EMAILCLAIM=token))
+        if invoices:
+            connection = get_connection(fail_silently=False)
+            try:
+                connection.open()
+            except Exception as exc:
+                logger.exception("Could not open mail connection for %s invoices", len(invoices))
+                failed = [(invoice, exc) for invoice in invoices]
+            else:
+                try:
+                    for invoice in invoices:
+                        try:
+                            connection.send_messages([_build_invoice_email(invoice, connection)])
+                        except Exception as exc:
+                            logger.exception(
+                                "Invoice email failed for invoice_id=%s", invoice.INVOICEID
+                            )
+                            failed.append((invoice, exc))
+                        else:
+                            sent.append(invoice)
+                finally:
+                    connection.close()
+
+        if sent:
+            Invoice.objects.filter(pk__in=[invoice.pk for invoice in sent]).update(
+                EMAILSENT=True, EMAILLASTERROR="", EMAILCLAIM=None, EMAILCLAIMEDAT=None
+            )
+            sent_at = timezone.now()
+            for invoice in sent:
+                metrics.observe(
+                    "billing_email_lag_seconds", (sent_at - invoice.PRCSDATE).total_seconds()
+                )
+        if failed:
+            for invoice, exc in failed:
+                invoice.EMAILFAILCOUNT = F("EMAILFAILCOUNT") + 1
+                invoice.EMAILLASTERROR = str(exc)[:1000]
+                invoice.EMAILSENT = False
+                invoice.EMAILCLAIM = None
+                invoice.EMAILCLAIMEDAT = None
+            Invoice.objects.bulk_update(
+                [invoice for invoice, _ in failed],
+                ["EMAILFAILCOUNT", "EMAILLASTERROR", "EMAILSENT", "EMAILCLAIM", "EMAILCLAIMEDAT"],
+            )
+    except BaseException:
+        # Anything not delivered can be claimed again at once; delivered rows
+        # that were not recorded keep their claim rather than go out twice.
+        _release(token, keep=[invoice.pk for invoice in sent])
+        raise
+
+    return {
+        "sent": [invoice.INVOICEID for invoice in sent],
+        "failed": [invoice.INVOICEID for invoice, _ in failed],
+        "errors": {invoice.INVOICEID: str(exc)[:1000] for invoice, exc in failed},
+    }
+
+
+def pending_invoice_email_ids(limit, after_id=0):
+    # Served by the partial TXNMASTER_EMAIL_PENDING_IDX index. Invoices with a
+    # pending or relayed outbox row are the relay's to deliver.
+    return list(
+        Invoice.objects.filter(
+            EMAILSENT=False,
+            EMAILFAILCOUNT__lt=settings.BILLING_EMAIL_MAX_FAILURES,
+            INVOICEID__gt=after_id,
         )
+        .exclude(email_outbox__STATUS__in=(0, 1))
+        .order_by("INVOICEID")
+        .values_list("INVOICEID", flat=True)[:limit]
+    )
 
-        invoice.EMAILSENT = True
-        invoice.EMAILLASTERROR = ""
-        invoice.save(update_fields=["EMAILSENT", "EMAILLASTERROR"])
+
+@shared_task(bind=True, max_retries=5, retry_backoff=True, retry_jitter=True)
+def send_invoice_email_task(self, invoice_id):
+    with metrics.timed("billing_email_send_seconds"):
+        result = send_invoice_emails([invoice_id])
+    if result["failed"]:
+        metrics.inc("billing_email_task_retries_total")
+        raise self.retry(exc=RuntimeError(result["errors"][invoice_id]))
+    if result["sent"]:
         return {"status": "sent", "invoice_id": invoice_id}
-    except Exception as exc:
-        Invoice.objects.filter(pk=invoice_id).update(
-            EMAILFAILCOUNT=F("EMAILFAILCOUNT") + 1,
-            EMAILLASTERROR=str(exc)[:1000],
-            EMAILSENT=False,
+    return {"status": "skipped", "invoice_id": invoice_id}
+
+
+@shared_task(bind=True, max_retries=5, retry_backoff=True, retry_jitter=True)
+def send_invoice_email_batch_task(self, invoice_ids):
+    result = send_invoice_emails(invoice_ids)
+    if result["failed"] and self.request.retries >= self.max_retries:
+        # Out of retries: hand the rows back to the outbox instead of leaving
+        # them relayed and unsent, where nothing would pick them up again.
+        from .outbox import requeue_relayed
+
+        requeue_relayed(result["failed"], result["errors"][result["failed"][0]])
+        return result
+    if result["failed"]:
+        raise self.retry(
+            args=[result["failed"]],
+            exc=RuntimeError(f"{len(result['failed'])} invoice emails failed"),
         )
-        logger.exception("Invoice email failed for invoice_id=%s", invoice_id)
-        raise self.retry(exc=exc)
+    return result
+
+
+@shared_task
+def dispatch_pending_invoice_emails(batch_size=None):
+    # Not scheduled: the outbox relay delivers invoice email. Run by hand to
+    # sweep invoices that never got an outbox row or whose row gave up.
+    batch_size = batch_size or settings.BILLING_EMAIL_BATCH_SIZE
+    totals = {"sent": 0, "failed": 0}
+    last_id = 0
+    while True:
+        invoice_ids = pending_invoice_email_ids(batch_size, after_id=last_id)
+        if not invoice_ids:
+            break
+        last_id = invoice_ids[-1]
+        result = send_invoice_emails(invoice_ids)
+        totals["sent"] += len(result["sent"])
+        totals["failed"] += len(result["failed"])
+    return totals
+
+
+@shared_task
+def relay_email_outbox_task(batch_size=None):
+    from .outbox import relay_outbox
+
+    return relay_outbox(batch_size)
+
+
+@task_postrun.connect
+def flush_task_metrics(**kwargs):
+    # Worker processes can sit idle for long stretches; write their totals as
+    # soon as a task finishes rather than on the next observation.
+    metrics.flush(force=True)
@@ -1,30 +1,109 @@
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import closing
 from datetime import timedelta
 from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
 from unittest.mock import patch
 
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core import mail
+from django.core.management import call_command
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management.base import CommandError
+from django.http import Http404
+from django.db import connection, transaction
+from django.test import (
+    AsyncRequestFactory,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from .models import Customer, Denomination, Invoice, Product
-from .views import _queue_invoice_email
+from .billing import ChangeTable, balance_due, greedy_change, price_cart, price_carts, tendered_amount
+from .catalog import catalog_stats, clear_local_catalog, get_catalog, get_catalog_version
+from .change import get_change_table
+from .checkout import place_order
+from .conditional import invoice_version, receipt_fragment_key
+from .datagen import tender, zipf_cum_weights
+from .exports import iter_export
+from .filters import filter_invoices, invoice_filter_params
+from .models import (
+    ArchivedInvoice,
+    ArchivedInvoiceItem,
+    Customer,
+    DailyProductSales,
+    DailySalesSummary,
+    Denomination,
+    EmailOutbox,
+    IdempotencyKey,
+    Invoice,
+    InvoiceItem,
+    Product,
+)
+from .outbox import relay_outbox, replay_outbox
+from .querystats import record_queries
+from . import async_views, metrics, receipts
+from .management.commands.bench_sqlite_concurrency import run_profile
+from .management.commands.generate_data import bounded_imap
+from .management.commands.sync_replica import copy_sqlite_database
+from .middleware import PRIMARY_PIN_COOKIE, ProfilingMiddleware, QueryStatsMiddleware, use_replica
+from .reports import rebuild_sales_summaries
+from .routers import PrimaryReplicaRouter, current_read_alias, replica_reads
+from .snapshots import InvalidWatermark, load_watermark, snapshot_chunks
+from .stock import InsufficientStockError, decrement_stock
+from .tasks import (
+    dispatch_pending_invoice_emails,
+    send_invoice_email_batch_task,
+    send_invoice_emails,
+)
 
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
+TEST_RECEIPT_DIR = tempfile.TemporaryDirectory()
+receipt_settings = override_settings(BILLING_RECEIPT_DIR=TEST_RECEIPT_DIR.name)
+
+
+def create_milk(stock=10, code="P001"):
+    # The product most test cases bill: 20.00 plus 5% tax.
+    return Product.objects.create(
+        PRODNAME="Milk",
+        PRODCODE=code,
+        PRODPRI=Decimal("20.00"),
+        PRODTAXPRE=Decimal("5.00"),
+        PROAVASTOCK=stock,
+        DISPSTATUS=0,
+    )
+
+
+@receipt_settings
 class InvoiceFlowTests(TestCase):
     def setUp(self):
-        self.product = Product.objects.create(
-            PRODNAME="Milk",
-            PRODCODE="P001",
-            PRODPRI=Decimal("20.00"),
-            PRODTAXPRE=Decimal("5.00"),
-            PROAVASTOCK=10,
-            DISPSTATUS=0,
-        )
+        self.product = create_milk()
         self.denom_100 = Denomination.objects.create(DENOMVALUE=1000, DISPSTATUS=0)
         self.denom_10 = Denomination.objects.create(DENOMVALUE=30, DISPSTATUS=0)
 
-    @patch("Billing_App.views._queue_invoice_email")
-    def test_invoice_create_success_and_customer_auto_create(self, mock_queue):
+    def test_invoice_create_success_and_customer_auto_create(self):
         payload = {
             "customer_name": "New Customer",
             "customer_email": "newcustomer@example.com",
@@ -49,10 +128,14 @@ class InvoiceFlowTests(TestCase):
         self.product.refresh_from_db()
         self.assertEqual(self.product.PROAVASTOCK, 8)
 
-        mock_queue.assert_called_once_with(invoice.INVOICEID)
+        self.assertEqual(
+            list(EmailOutbox.objects.values_list("INVOICE_id", "STATUS")), [(invoice.INVOICEID, 0)]
+        )
+        # Delivering the email renders the receipt once for every later view.
+        self.assertEqual(relay_outbox(direct=True), 1)
+        self.assertTrue(receipts.receipt_path(invoice).exists())
 
-    @patch("Billing_App.views._queue_invoice_email")
-    def test_invoice_create_fails_on_insufficient_stock(self, mock_queue):
+    def test_invoice_create_fails_on_insufficient_stock(self):
         payload = {
             "customer_name": "Stock User",
             "customer_email": "stock@example.com",
@@ -64,7 +147,31 @@ class InvoiceFlowTests(TestCase):
         response = self.client.post(reverse("invoice_add"), data=payload)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(Invoice.objects.count(), 0)
-        mock_queue.assert_not_called()
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_invoice_create_rolls_back_when_stock_taken_concurrently(self):
+        payload = {
+            "customer_name": "Race User",
+            "customer_email": "race@example.com",
+            "product_id[]": [str(self.product.PRODID)],
+            "quantity[]": ["8"],
+            f"denom_{self.denom_100.DENOMID}": "1",
+            f"denom_{self.denom_10.DENOMID}": "0",
+        }
+
+        def sell_elsewhere(product_qty_map):
+            Product.objects.filter(pk=self.product.pk).update(PROAVASTOCK=5)
+            return decrement_stock(product_qty_map)
+
+        with patch("Billing_App.checkout.decrement_stock", side_effect=sell_elsewhere):
+            response = self.client.post(reverse("invoice_add"), data=payload)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Invoice.objects.count(), 0)
+        self.assertFalse(Customer.objects.filter(CUSTEMAIL="race@example.com").exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.PROAVASTOCK, 10)
+        self.assertFalse(EmailOutbox.objects.exists())
 
     def test_invoice_index_filters_name_email_date(self):
         now = timezone.now()
@@ -90,8 +197,8 @@ class InvoiceFlowTests(TestCase):
             data={
                 "customer_name": "Bob",
                 "customer_email": "bob@",
-                "from_date": (now - timedelta(days=1)).date().isoformat(),
-                "to_date": now.date().isoformat(),
+                "from_date": timezone.localdate(now - timedelta(days=1)).isoformat(),
+                "to_date": timezone.localdate(now).isoformat(),
             },
         )
         self.assertEqual(response.status_code, 200)
@@ -100,20 +207,1773 @@ class InvoiceFlowTests(TestCase):
         self.assertEqual(invoices[0].CUSTNAME, "Bob")
 
 
-class EmailQueueFallbackTests(TestCase):
-    def test_queue_failure_updates_invoice_tracking_fields(self):
-        invoice = Invoice.objects.create(
+class BillingEngineTests(TestCase):
+    def setUp(self):
+        self.milk = Product(PRODID=1, PRODPRI=Decimal("20.00"), PRODTAXPRE=Decimal("5.00"))
+        self.soap = Product(PRODID=2, PRODPRI=Decimal("33.33"), PRODTAXPRE=Decimal("18.00"))
+
+    def test_price_cart_quantizes_each_line_and_rounds_payable_down(self):
+        cart = price_cart([(self.milk, 2), (self.soap, 3)])
+
+        self.assertEqual(cart["items"][1]["line_subtotal"], Decimal("99.99"))
+        self.assertEqual(cart["items"][1]["line_tax"], Decimal("18.00"))
+        self.assertEqual(cart["gross_amount"], Decimal("139.99"))
+        self.assertEqual(cart["tax_amount"], Decimal("20.00"))
+        self.assertEqual(cart["net_amount"], Decimal("159.99"))
+        self.assertEqual(cart["rounded_payable"], Decimal("159.00"))
+
+    def test_price_carts_matches_single_cart_pricing(self):
+        carts = [[(self.milk, 1)], [(self.soap, 4), (self.milk, 3)]]
+        batch = price_carts(carts)
+        self.assertEqual(
+            [cart["net_amount"] for cart in batch],
+            [price_cart(lines)["net_amount"] for lines in carts],
+        )
+
+    def test_tender_balance_and_change(self):
+        paid = tendered_amount({"500": 1, "100": 2, "5": 1})
+        self.assertEqual(paid, Decimal("705.00"))
+        balance = balance_due(paid, Decimal("159.00"))
+        self.assertEqual(balance, Decimal("546.00"))
+        self.assertEqual(
+            greedy_change(balance, [500, 200, 100, 50, 20, 10, 5, 2, 1]),
+            {"500": 1, "20": 2, "5": 1, "1": 1},
+        )
+
+
+class ChangeMakingTests(TestCase):
+    def test_non_canonical_set_gets_minimal_notes(self):
+        table = ChangeTable([1, 3, 4])
+        self.assertFalse(table.canonical)
+        self.assertEqual(table.make_change(6), {"3": 2})
+        self.assertEqual(greedy_change(6, [1, 3, 4]), {"4": 1, "1": 2})
+
+    def test_greedy_remaining_is_avoided_when_exact_change_exists(self):
+        table = ChangeTable([1000, 30, 20])
+        self.assertEqual(table.make_change(40), {"20": 2})
+        self.assertEqual(table.make_change(2060), {"1000": 2, "30": 2})
+        self.assertEqual(table.make_change(10), {"remaining": 10})
+
+    def test_large_amounts_match_full_dp(self):
+        table = ChangeTable([7, 13, 50])
+        for amount in (637, 638, 1000, 12345):
+            change = table.make_change(amount)
+            paid = sum(int(value) * count for value, count in change.items())
+            self.assertEqual(paid, amount)
+
+    def test_active_table_is_cached_until_denominations_change(self):
+        Denomination.objects.update(DISPSTATUS=1)
+        Denomination.objects.create(DENOMVALUE=4, DISPSTATUS=0)
+        Denomination.objects.create(DENOMVALUE=3, DISPSTATUS=0)
+        one = Denomination.objects.get(DENOMVALUE=1)
+        one.DISPSTATUS = 0
+        one.save()
+
+        table = get_change_table()
+        with self.assertNumQueries(0):
+            self.assertIs(get_change_table(), table)
+        self.assertEqual(table.make_change(6), {"3": 2})
+
+        Denomination.objects.create(DENOMVALUE=6, DISPSTATUS=0)
+        self.assertEqual(get_change_table().make_change(6), {"6": 1})
+
+    @override_settings(BILLING_CHANGE_TABLE_TIMEOUT=0)
+    def test_table_is_reloaded_after_timeout_without_version_bump(self):
+        self.assertEqual(get_change_table().make_change(500), {"500": 1})
+        # update() sends no signals, like an edit made in another worker process.
+        Denomination.objects.filter(DENOMVALUE=500).update(DISPSTATUS=1)
+        self.assertEqual(get_change_table().make_change(500), {"200": 2, "100": 1})
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_local_catalog()
+        self.product = create_milk()
+
+    def test_invoice_entry_page_serves_catalog_from_cache(self):
+        self.client.get(reverse("invoice_add"))
+        before = catalog_stats()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("invoice_add"))
+
+        self.assertContains(response, "P001 - Milk")
+        self.assertEqual(catalog_stats()["local_hits"], before["local_hits"] + 1)
+
+    def test_shared_cache_is_used_when_local_entry_is_missing(self):
+        get_catalog()
+        clear_local_catalog()
+        before = catalog_stats()
+
+        with self.assertNumQueries(0):
+            get_catalog()
+        self.assertEqual(catalog_stats()["shared_hits"], before["shared_hits"] + 1)
+
+    def test_model_changes_invalidate_catalog(self):
+        self.assertEqual([p.PRODCODE for p in get_catalog()["products"]], ["P001"])
+
+        Product.objects.create(
+            PRODNAME="Bread",
+            PRODCODE="P002",
+            PRODPRI=Decimal("30.00"),
+            PRODTAXPRE=Decimal("0.00"),
+            PROAVASTOCK=5,
+            DISPSTATUS=0,
+        )
+        self.product.DISPSTATUS = 1
+        self.product.save()
+
+        self.assertEqual([p.PRODCODE for p in get_catalog()["products"]], ["P002"])
+
+    @receipt_settings
+    def test_checkout_customer_upserts_keep_catalog_version(self):
+        denom = Denomination.objects.create(DENOMVALUE=2000, DISPSTATUS=0)
+        version = get_catalog_version()
+
+        for name in ("Walk In", "Walk In Renamed"):
+            with self.captureOnCommitCallbacks(execute=True):
+                place_order(
+                    name, "walkin@example.com", [(self.product.PRODID, 1)], [denom], {"2000": "1"}
+                )
+
+        self.assertEqual(get_catalog_version(), version)
+        self.assertEqual(
+            Customer.objects.get(CUSTEMAIL="walkin@example.com").CUSTNAME, "Walk In Renamed"
+        )
+
+    @receipt_settings
+    def test_returning_customer_with_same_name_is_not_rewritten(self):
+        denom = Denomination.objects.create(DENOMVALUE=2000, DISPSTATUS=0)
+        Customer.objects.create(CUSTNAME="Regular", CUSTEMAIL="regular@example.com", DISPSTATUS=0)
+
+        with CaptureQueriesContext(connection) as queries:
+            place_order(
+                "Regular", "regular@example.com", [(self.product.PRODID, 1)], [denom], {"2000": "1"}
+            )
+
+        customer_writes = [
+            query["sql"]
+            for query in queries.captured_queries
+            if '"CUSTOMER_MASTER"' in query["sql"] and not query["sql"].startswith("SELECT")
+        ]
+        self.assertEqual(customer_writes, [])
+
+
+class StockDecrementTests(TestCase):
+    def setUp(self):
+        self.milk = create_milk()
+        self.bread = Product.objects.create(
+            PRODNAME="Bread",
+            PRODCODE="P002",
+            PRODPRI=Decimal("30.00"),
+            PRODTAXPRE=Decimal("0.00"),
+            PROAVASTOCK=3,
+            DISPSTATUS=0,
+        )
+
+    def test_decrement_is_single_statement(self):
+        with self.assertNumQueries(1):
+            decrement_stock({self.milk.PRODID: 4, self.bread.PRODID: 3})
+
+        self.milk.refresh_from_db()
+        self.bread.refresh_from_db()
+        self.assertEqual(self.milk.PROAVASTOCK, 6)
+        self.assertEqual(self.bread.PROAVASTOCK, 0)
+
+    def test_shortfall_rolls_back_every_line(self):
+        with self.assertRaises(InsufficientStockError):
+            with transaction.atomic():
+                decrement_stock({self.milk.PRODID: 4, self.bread.PRODID: 5})
+
+        self.milk.refresh_from_db()
+        self.bread.refresh_from_db()
+        self.assertEqual(self.milk.PROAVASTOCK, 10)
+        self.assertEqual(self.bread.PROAVASTOCK, 3)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        for index in range(25):
+            invoice = Invoice.objects.create(
+                CUSTNAME=f"Customer {index}",
+                CUSTEMAIL=f"customer{index}@example.com",
+            )
+            # Pairs of invoices share a timestamp to exercise the INVOICEID tie-break.
+            Invoice.objects.filter(pk=invoice.pk).update(PRCSDATE=now - timedelta(hours=index // 2))
+        self.expected = list(
+            Invoice.objects.order_by("-PRCSDATE", "-INVOICEID").values_list("INVOICEID", flat=True)
+        )
+
+    def _get(self, **params):
+        params.setdefault("per_page", 10)
+        with self.settings(BILLING_INVOICE_PAGINATION="cursor"):
+            return self.client.get(reverse("invoice_index"), data=params)
+
+    def test_cursor_walk_forward_and_back_visits_every_invoice_once(self):
+        seen = []
+        pages = []
+        response = self._get()
+        while True:
+            page = response.context["invoices"]
+            pages.append([invoice.INVOICEID for invoice in page])
+            seen.extend(pages[-1])
+            if not page.has_next:
+                break
+            response = self._get(cursor=page.next_cursor)
+
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(ids) for ids in pages], [10, 10, 5])
+
+        response = self._get(cursor=response.context["invoices"].previous_cursor)
+        self.assertEqual([invoice.INVOICEID for invoice in response.context["invoices"]], pages[1])
+
+    def test_cursor_pages_respect_filters_and_cache_total(self):
+        response = self._get(customer_email="customer1")
+        page = response.context["invoices"]
+        self.assertEqual(page.total_count, 11)
+        self.assertFalse(page.approximate)
+        self.assertTrue(all("customer1" in invoice.CUSTEMAIL for invoice in page))
+
+        response = self._get(customer_email="customer1", cursor=page.next_cursor)
+        self.assertEqual(len(response.context["invoices"]), 1)
+        self.assertTrue(response.context["invoices"].approximate)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self._get(cursor="not-a-cursor")
+        self.assertEqual(
+            [invoice.INVOICEID for invoice in response.context["invoices"]], self.expected[:10]
+        )
+
+
+class InvoiceFilterQueryPlanTests(TestCase):
+    # Each filter combination the invoice list can send must seek into an index,
+    # not scan TRANSACTION_MASTER. The plans are taken without ORDER BY/LIMIT:
+    # ordering on (PRCSDATE, INVOICEID) alone already walks the date index, so
+    # it would hide a filter that cannot use it. Every fragment listed must be
+    # in the plan.
+    sqlite_plans = [
+        (
+            {"from_date": "2026-01-01", "to_date": "2026-01-31"},
+            [
+                "SEARCH TRANSACTION_MASTER USING INDEX TXNMASTER_DATE_ID_IDX "
+                "(PRCSDATE>? AND PRCSDATE<?)"
+            ],
+        ),
+        (
+            {"from_date": "2026-01-01"},
+            ["SEARCH TRANSACTION_MASTER USING INDEX TXNMASTER_DATE_ID_IDX (PRCSDATE>?)"],
+        ),
+        (
+            {"to_date": "2026-01-31"},
+            ["SEARCH TRANSACTION_MASTER USING INDEX TXNMASTER_DATE_ID_IDX (PRCSDATE<?)"],
+        ),
+        (
+            {"customer_email": "bob@example.com"},
+            ["SEARCH TRANSACTION_MASTER USING INDEX TXNMASTER_EMAIL_DATE_IDX (CUSTEMAIL=?)"],
+        ),
+        (
+            {"customer_email": "Bob@Example.com", "from_date": "2026-01-01", "to_date": "2026-01-31"},
+            [
+                "SEARCH TRANSACTION_MASTER USING INDEX TXNMASTER_EMAIL_DATE_IDX "
+                "(CUSTEMAIL=? AND PRCSDATE>? AND PRCSDATE<?)"
+            ],
+        ),
+    ] + [
+        # Text matches go through the FTS table, then fetch each matching row
+        # by rowid; the date bounds are checked on those rows only.
+        (
+            filters,
+            [
+                "SCAN INVOICE_SEARCH VIRTUAL TABLE INDEX",
+                "SEARCH TRANSACTION_MASTER USING INTEGER PRIMARY KEY (rowid=?)",
+            ],
+        )
+        for filters in (
+            {"customer_name": "Bob"},
+            {"customer_email": "bob@"},
+            {"customer_name": "Bob", "from_date": "2026-01-01"},
+            {"customer_email": "bob", "to_date": "2026-01-31"},
+        )
+    ]
+    postgresql_plans = [
+        ({"from_date": "2026-01-01", "to_date": "2026-01-31"}, ["TXNMASTER_DATE_ID_IDX"]),
+        ({"from_date": "2026-01-01"}, ["TXNMASTER_DATE_ID_IDX"]),
+        ({"to_date": "2026-01-31"}, ["TXNMASTER_DATE_ID_IDX"]),
+        ({"customer_email": "bob@example.com"}, ["TXNMASTER_EMAIL_DATE_IDX"]),
+        (
+            {"customer_email": "Bob@Example.com", "from_date": "2026-01-01", "to_date": "2026-01-31"},
+            ["TXNMASTER_EMAIL_DATE_IDX"],
+        ),
+        ({"customer_name": "Bob"}, ["TXNMASTER_NAME_TRGM_IDX"]),
+        ({"customer_email": "bob@"}, ["TXNMASTER_EMAIL_TRGM_IDX"]),
+        ({"customer_name": "Bob", "from_date": "2026-01-01"}, ["TXNMASTER_NAME_TRGM_IDX"]),
+        ({"customer_email": "bob", "to_date": "2026-01-31"}, ["TXNMASTER_EMAIL_TRGM_IDX"]),
+    ]
+
+    def explain(self, queryset):
+        if connection.vendor == "postgresql":
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+                return queryset.explain()
+        return queryset.explain()
+
+    def test_filter_combinations_use_indexes(self):
+        if connection.vendor == "postgresql":
+            plans, full_scan = self.postgresql_plans, "Seq Scan"
+        else:
+            plans, full_scan = self.sqlite_plans, "SCAN TRANSACTION_MASTER"
+        for filters, fragments in plans:
+            with self.subTest(filters=filters):
+                plan = self.explain(filter_invoices(Invoice.objects.all(), filters))
+                self.assertNotIn(full_scan, plan)
+                for fragment in fragments:
+                    self.assertIn(fragment, plan)
+
+    def test_date_filters_are_half_open_local_days(self):
+        queryset = filter_invoices(
+            Invoice.objects.all(), {"from_date": "2026-01-01", "to_date": "2026-01-31"}
+        )
+        sql = str(queryset.query)
+        self.assertNotIn("django_datetime_cast_date", sql)
+        self.assertNotIn("::date", sql)
+
+        inside = Invoice.objects.create(CUSTNAME="Late", CUSTEMAIL="late@example.com")
+        outside = Invoice.objects.create(CUSTNAME="Next", CUSTEMAIL="next@example.com")
+        last_minute = timezone.make_aware(timezone.datetime(2026, 1, 31, 23, 59, 59))
+        Invoice.objects.filter(pk=inside.pk).update(PRCSDATE=last_minute)
+        Invoice.objects.filter(pk=outside.pk).update(PRCSDATE=last_minute + timedelta(seconds=1))
+        self.assertEqual(list(queryset.values_list("pk", flat=True)), [inside.pk])
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.bob = Customer.objects.create(CUSTNAME="Bob Stone", CUSTEMAIL="bob@example.com", DISPSTATUS=0)
+        self.rob = Customer.objects.create(CUSTNAME="Robert Bobbins", CUSTEMAIL="rob@bob.org", DISPSTATUS=0)
+        Customer.objects.create(CUSTNAME="Alice", CUSTEMAIL="alice@example.com", DISPSTATUS=0)
+        self.invoice = Invoice.objects.create(CUSTNAME="Bob Stone", CUSTEMAIL="bob@example.com")
+        Invoice.objects.create(CUSTNAME="Alice", CUSTEMAIL="alice@example.com")
+
+    def test_customer_search_is_ranked_prefix_match(self):
+        response = self.client.get(reverse("customer_index"), data={"search": "bob"})
+        names = [customer.CUSTNAME for customer in response.context["customers"]]
+        self.assertEqual(names, ["Bob Stone", "Robert Bobbins"])
+
+        response = self.client.get(reverse("customer_index"), data={"search": "sto"})
+        self.assertEqual([c.CUSTNAME for c in response.context["customers"]], ["Bob Stone"])
+
+    def test_invoice_search_tracks_updates_and_deletes(self):
+        filters = {"customer_name": "bob"}
+        self.assertEqual(list(filter_invoices(Invoice.objects.all(), filters)), [self.invoice])
+
+        Invoice.objects.filter(pk=self.invoice.pk).update(CUSTNAME="Carol")
+        self.assertEqual(list(filter_invoices(Invoice.objects.all(), filters)), [])
+        self.assertEqual(
+            list(filter_invoices(Invoice.objects.all(), {"customer_name": "car"})), [self.invoice]
+        )
+
+        Invoice.objects.filter(pk=self.invoice.pk).delete()
+        self.assertEqual(list(filter_invoices(Invoice.objects.all(), {"customer_name": "car"})), [])
+
+    def test_email_search_keeps_parts_adjacent(self):
+        results = filter_invoices(Invoice.objects.all(), {"customer_email": "bob@exa"})
+        self.assertEqual(list(results), [self.invoice])
+        # Text without any word characters falls back to a contains match.
+        self.assertEqual(filter_invoices(Invoice.objects.all(), {"customer_email": "@"}).count(), 2)
+
+    def test_rebuild_command(self):
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(
+            list(filter_invoices(Invoice.objects.all(), {"customer_name": "stone"})), [self.invoice]
+        )
+
+
+@receipt_settings
+class BatchedInvoiceEmailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_milk()
+        self.invoices = []
+        for index in range(3):
+            invoice = Invoice.objects.create(
+                CUSTNAME=f"Customer {index}", CUSTEMAIL=f"customer{index}@example.com"
+            )
+            InvoiceItem.objects.create(
+                INVOICE=invoice,
+                PRODUCT=self.product,
+                UNITPRICE=Decimal("20.00"),
+                TAXPERCENT=Decimal("5.00"),
+                QTY=1,
+                LINESUBTOTAL=Decimal("20.00"),
+                LINETAX=Decimal("1.00"),
+                LINETOTAL=Decimal("21.00"),
+            )
+            self.invoices.append(invoice)
+        self.invoice_ids = [invoice.INVOICEID for invoice in self.invoices]
+
+    def test_batch_uses_one_connection_and_bulk_queries(self):
+        from django.core.mail import get_connection as real_get_connection
+
+        with patch("Billing_App.tasks.get_connection", side_effect=real_get_connection) as factory:
+            # Claim UPDATE, invoices, prefetched items, one UPDATE for the sent rows.
+            with self.assertNumQueries(4):
+                result = send_invoice_emails(self.invoice_ids)
+
+        factory.assert_called_once()
+        self.assertEqual(sorted(result["sent"]), self.invoice_ids)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn("Milk (P001)", mail.outbox[0].body)
+        (message,) = [message for message in mail.outbox if message.to == ["customer0@example.com"]]
+        filename, content, mimetype = message.attachments[0]
+        self.assertEqual((filename, mimetype), (f"receipt-{self.invoice_ids[0]}.html", "text/html"))
+        self.assertIn("Customer 0", content)
+        self.assertEqual(Invoice.objects.filter(EMAILSENT=True).count(), 3)
+
+    def test_failed_messages_are_recorded_per_invoice(self):
+        class FlakyConnection:
+            def open(self):
+                return True
+
+            def close(self):
+                pass
+
+            def send_messages(self, messages):
+                if messages[0].to == ["customer1@example.com"]:
+                    raise OSError("mailbox unavailable")
+                return 1
+
+        with patch("Billing_App.tasks.get_connection", return_value=FlakyConnection()):
+            result = send_invoice_emails(self.invoice_ids)
+
+        self.assertEqual(result["failed"], [self.invoices[1].INVOICEID])
+        failed = Invoice.objects.get(pk=self.invoices[1].pk)
+        self.assertFalse(failed.EMAILSENT)
+        self.assertEqual(failed.EMAILFAILCOUNT, 1)
+        self.assertEqual(failed.EMAILLASTERROR, "mailbox unavailable")
+        self.assertEqual(Invoice.objects.filter(EMAILSENT=True).count(), 2)
+
+    def test_invoices_claimed_by_another_worker_are_skipped(self):
+        now = timezone.now()
+        Invoice.objects.filter(pk=self.invoices[0].pk).update(
+            EMAILCLAIM=uuid.uuid4(), EMAILCLAIMEDAT=now
+        )
+        Invoice.objects.filter(pk=self.invoices[1].pk).update(
+            EMAILCLAIM=uuid.uuid4(), EMAILCLAIMEDAT=now - timedelta(hours=1)
+        )
+
+        result = send_invoice_emails(self.invoice_ids)
+
+        self.assertEqual(sorted(result["sent"]), self.invoice_ids[1:])
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(
+            Invoice.objects.filter(pk__in=self.invoice_ids[1:], EMAILCLAIM__isnull=False).exists()
+        )
+
+    def test_claim_is_released_when_delivery_breaks(self):
+        with patch("Billing_App.tasks._invoice_email_queryset", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                send_invoice_emails(self.invoice_ids)
+
+        self.assertFalse(Invoice.objects.filter(EMAILCLAIM__isnull=False).exists())
+        self.assertEqual(len(send_invoice_emails(self.invoice_ids)["sent"]), 3)
+
+    def test_dispatcher_skips_sent_and_exhausted_invoices(self):
+        Invoice.objects.filter(pk=self.invoices[0].pk).update(EMAILSENT=True)
+        Invoice.objects.filter(pk=self.invoices[1].pk).update(EMAILFAILCOUNT=99)
+
+        with self.settings(BILLING_EMAIL_BATCH_SIZE=1):
+            totals = dispatch_pending_invoice_emails()
+
+        self.assertEqual(totals, {"sent": 1, "failed": 0})
+        self.assertEqual([message.to for message in mail.outbox], [["customer2@example.com"]])
+
+    def test_dispatcher_leaves_outbox_invoices_to_the_relay(self):
+        EmailOutbox.objects.create(INVOICE=self.invoices[0], STATUS=0)
+        EmailOutbox.objects.create(INVOICE=self.invoices[1], STATUS=1)
+        EmailOutbox.objects.create(INVOICE=self.invoices[2], STATUS=2)
+
+        totals = dispatch_pending_invoice_emails()
+
+        self.assertEqual(totals, {"sent": 1, "failed": 0})
+        self.assertEqual([message.to for message in mail.outbox], [["customer2@example.com"]])
+
+
+@receipt_settings
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.invoice = Invoice.objects.create(
             CUSTNAME="Queue Test",
             CUSTEMAIL="queue@example.com",
             NETAMT=Decimal("10.00"),
             PAIDAMT=Decimal("20.00"),
             BALANCEAMT=Decimal("10.00"),
         )
+        self.outbox = EmailOutbox.objects.create(INVOICE=self.invoice)
+
+    def test_queue_failure_updates_invoice_tracking_fields(self):
+        with patch(
+            "Billing_App.outbox.send_invoice_email_batch_task.delay",
+            side_effect=Exception("broker down"),
+        ):
+            self.assertEqual(relay_outbox(), 0)
+
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.EMAILSENT, False)
+        self.assertEqual(self.invoice.EMAILFAILCOUNT, 1)
+        self.assertIn("Queue error:", self.invoice.EMAILLASTERROR)
+        self.outbox.refresh_from_db()
+        self.assertEqual((self.outbox.STATUS, self.outbox.ATTEMPTS), (0, 1))
+
+    def test_relay_hands_pending_rows_to_broker_once(self):
+        with patch("Billing_App.outbox.send_invoice_email_batch_task.delay") as delay:
+            self.assertEqual(relay_outbox(), 1)
+            self.assertEqual(relay_outbox(), 0)
+
+        delay.assert_called_once_with([self.invoice.INVOICEID])
+        self.outbox.refresh_from_db()
+        self.assertEqual(self.outbox.STATUS, 1)
+        self.assertIsNotNone(self.outbox.RELAYEDDATE)
+
+    def test_exhausted_task_retries_put_the_row_back_to_pending(self):
+        with patch("Billing_App.outbox.send_invoice_email_batch_task.delay"):
+            relay_outbox()
+        failure = {
+            "sent": [],
+            "failed": [self.invoice.INVOICEID],
+            "errors": {self.invoice.INVOICEID: "mailbox unavailable"},
+        }
+        with patch("Billing_App.tasks.send_invoice_emails", return_value=failure) as send:
+            # Eager retries run one after another until max_retries is spent.
+            result = send_invoice_email_batch_task.apply(args=[[self.invoice.INVOICEID]])
+        self.assertEqual(send.call_count, send_invoice_email_batch_task.max_retries + 1)
+        self.assertEqual(result.get(), failure)
+
+        self.outbox.refresh_from_db()
+        self.assertEqual((self.outbox.STATUS, self.outbox.ATTEMPTS), (0, 1))
+        self.assertEqual(self.outbox.LASTERROR, "mailbox unavailable")
+        self.assertEqual(relay_outbox(direct=True), 1)
+        self.invoice.refresh_from_db()
+        self.assertTrue(self.invoice.EMAILSENT)
+
+    def test_direct_relay_and_replay(self):
+        self.assertEqual(relay_outbox(direct=True), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.invoice.refresh_from_db()
+        self.assertTrue(self.invoice.EMAILSENT)
+
+        self.assertEqual(replay_outbox(invoice_ids=[self.invoice.INVOICEID]), 0)
+        self.assertEqual(
+            replay_outbox(invoice_ids=[self.invoice.INVOICEID], include_sent=True), 1
+        )
+        self.assertEqual(relay_outbox(direct=True), 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+@receipt_settings
+class DailySalesSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.milk = create_milk(stock=100)
+        self.bread = Product.objects.create(
+            PRODNAME="Bread",
+            PRODCODE="P002",
+            PRODPRI=Decimal("40.00"),
+            PRODTAXPRE=Decimal("10.00"),
+            PROAVASTOCK=100,
+            DISPSTATUS=0,
+        )
+        self.denom = Denomination.objects.get(DENOMVALUE=500)
+
+    def _checkout(self, email, lines):
+        payload = {
+            "customer_name": "Report User",
+            "customer_email": email,
+            "product_id[]": [str(product.PRODID) for product, _ in lines],
+            "quantity[]": [str(qty) for _, qty in lines],
+            f"denom_{self.denom.DENOMID}": "1",
+        }
+        response = self.client.post(reverse("invoice_add"), data=payload)
+        self.assertEqual(response.status_code, 302)
+        return Invoice.objects.get(pk=response.url.rstrip("/").split("/")[-1])
+
+    def _snapshot(self):
+        days = list(
+            DailySalesSummary.objects.values_list(
+                "SALESDATE", "INVOICECOUNT", "QTYSOLD", "GROSSAMT", "TAXAMT", "NETAMT"
+            ).order_by("SALESDATE")
+        )
+        products = list(
+            DailyProductSales.objects.values_list(
+                "SALESDATE", "PRODUCT_id", "INVOICECOUNT", "QTYSOLD", "NETAMT"
+            ).order_by("SALESDATE", "PRODUCT_id")
+        )
+        return days, products
+
+    def test_checkout_and_delete_maintain_summaries(self):
+        first = self._checkout("one@example.com", [(self.milk, 2), (self.bread, 1)])
+        self._checkout("two@example.com", [(self.milk, 1)])
+
+        today = timezone.localdate()
+        day = DailySalesSummary.objects.get(SALESDATE=today)
+        self.assertEqual((day.INVOICECOUNT, day.QTYSOLD), (2, 4))
+        self.assertEqual(day.NETAMT, Decimal("107.00"))
+        milk = DailyProductSales.objects.get(SALESDATE=today, PRODUCT=self.milk)
+        self.assertEqual((milk.INVOICECOUNT, milk.QTYSOLD, milk.NETAMT), (2, 3, Decimal("63.00")))
+
+        self.client.post(reverse("invoice_delete", args=[first.pk]))
+
+        day.refresh_from_db()
+        self.assertEqual((day.INVOICECOUNT, day.QTYSOLD, day.NETAMT), (1, 1, Decimal("21.00")))
+        self.assertFalse(DailyProductSales.objects.filter(PRODUCT=self.bread).exists())
+
+    def test_rebuild_matches_incremental_totals(self):
+        self._checkout("one@example.com", [(self.milk, 2), (self.bread, 1)])
+        self._checkout("two@example.com", [(self.bread, 3)])
+        incremental = self._snapshot()
+
+        DailySalesSummary.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        self.assertEqual(rebuild_sales_summaries(), (1, 2))
+
+        self.assertEqual(self._snapshot(), incremental)
+
+    def test_report_reads_only_summary_tables(self):
+        self._checkout("one@example.com", [(self.milk, 2)])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("sales_report"))
+
+        self.assertContains(response, "Milk (P001)")
+        self.assertEqual(response.context["totals"]["INVOICECOUNT"], 1)
+        sql = " ".join(query["sql"] for query in queries)
+        self.assertNotIn("TRANSACTION_MASTER", sql)
+        self.assertNotIn("TRANSACTION_DETAILS", sql)
+
+
+class InvoiceExportTests(TestCase):
+    def setUp(self):
+        self.product = create_milk()
+        self.invoices = []
+        for index in range(5):
+            invoice = Invoice.objects.create(
+                CUSTNAME="Alice" if index % 2 else "Bob",
+                CUSTEMAIL=f"customer{index}@example.com",
+                NETAMT=Decimal("21.00"),
+            )
+            for _ in range(index % 3):
+                InvoiceItem.objects.create(
+                    INVOICE=invoice,
+                    PRODUCT=self.product,
+                    UNITPRICE=Decimal("20.00"),
+                    TAXPERCENT=Decimal("5.00"),
+                    QTY=1,
+                    LINESUBTOTAL=Decimal("20.00"),
+                    LINETAX=Decimal("1.00"),
+                    LINETOTAL=Decimal("21.00"),
+                )
+            self.invoices.append(invoice)
+
+    def test_csv_export_streams_filtered_rows_with_items(self):
+        response = self.client.get(reverse("invoice_export"), {"customer_name": "alice"})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(lines[0].split(",")[:2], ["INVOICEID", "PRCSDATE"])
+        # Alice has invoices 1 (one item) and 3 (no items).
+        invoice_ids = [int(line.split(",")[0]) for line in lines[1:]]
+        self.assertEqual(invoice_ids, [self.invoices[1].pk, self.invoices[3].pk])
+        self.assertIn("P001,Milk,1,20.00", lines[1])
+
+    def test_jsonl_export_fetches_items_once_per_chunk(self):
+        with self.assertNumQueries(3):
+            rows = [
+                json.loads(line)
+                for line in iter_export(invoice_filter_params({}), "jsonl", chunk_size=3)
+            ]
+
+        self.assertEqual(
+            [row["INVOICEID"] for row in rows], [invoice.pk for invoice in self.invoices]
+        )
+        self.assertEqual([len(row["ITEMS"]) for row in rows], [0, 1, 2, 0, 1])
+        self.assertEqual(rows[2]["ITEMS"][0]["LINETOTAL"], "21.00")
+
+    def test_export_command_writes_stdout(self):
+        out = StringIO()
+        call_command("export_invoices", "--format", "jsonl", "--customer-name", "bob", stdout=out)
+
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+
+class InvoiceSnapshotTests(TestCase):
+    def setUp(self):
+        self.product = create_milk()
+        self.invoices = []
+        for index in range(3):
+            invoice = Invoice.objects.create(
+                CUSTNAME=f"Customer {index}",
+                CUSTEMAIL=f"customer{index}@example.com",
+                RECEIVED_DENOMS={"500": 1, "100": 0},
+                CHANGE_DENOMS={"200": 2, "remaining": 3},
+            )
+            InvoiceItem.objects.create(
+                INVOICE=invoice,
+                PRODUCT=self.product,
+                UNITPRICE=Decimal("20.00"),
+                TAXPERCENT=Decimal("5.00"),
+                QTY=2,
+                LINESUBTOTAL=Decimal("40.00"),
+                LINETAX=Decimal("2.00"),
+                LINETOTAL=Decimal("42.00"),
+            )
+            self.invoices.append(invoice)
+
+    def test_chunks_flatten_denominations_and_start_after_watermark(self):
+        after = (self.invoices[0].PRCSDATE, self.invoices[0].pk)
+        with self.assertNumQueries(2):
+            chunks = list(snapshot_chunks(after=after, chunk_size=5))
+
+        self.assertEqual(len(chunks), 1)
+        last, tables = chunks[0]
+        self.assertEqual(last, (self.invoices[2].PRCSDATE, self.invoices[2].pk))
+        (month,) = tables["invoices"]
+        self.assertEqual(month, f"{timezone.localtime(self.invoices[0].PRCSDATE):%Y-%m}")
+        invoices = tables["invoices"][month]
+        self.assertEqual(
+            [row["INVOICEID"] for row in invoices], [invoice.pk for invoice in self.invoices[1:]]
+        )
+        self.assertEqual(invoices[0]["CHANGE_REMAINING"], 3)
+        self.assertEqual(len(tables["items"][month]), 2)
+        denominations = tables["denominations"][month]
+        self.assertEqual(
+            sorted((row["KIND"], row["DENOMVALUE"], row["NOTECOUNT"]) for row in denominations),
+            [("change", 200, 2), ("change", 200, 2), ("received", 500, 1), ("received", 500, 1)],
+        )
+
+    @skipUnless(pq, "pyarrow is not installed")
+    def test_snapshot_command_is_incremental(self):
+        with tempfile.TemporaryDirectory() as output, self.settings(BILLING_SNAPSHOT_LAG_SECONDS=0):
+            call_command("snapshot_invoices", output, stdout=StringIO())
+            Invoice.objects.create(CUSTNAME="Late", CUSTEMAIL="late@example.com")
+            call_command("snapshot_invoices", output, stdout=StringIO())
+
+            table = pq.read_table(os.path.join(output, "invoices"))
+            self.assertEqual(table.num_rows, 4)
+            self.assertEqual(
+                load_watermark(output)["last_invoice_id"], Invoice.objects.latest("pk").pk
+            )
+
+    @skipUnless(pq, "pyarrow is not installed")
+    def test_partitions_read_back_with_their_schema(self):
+        month = f"{timezone.localtime(self.invoices[0].PRCSDATE):%Y-%m}"
+        with tempfile.TemporaryDirectory() as output, self.settings(BILLING_SNAPSHOT_LAG_SECONDS=0):
+            call_command("snapshot_invoices", output, stdout=StringIO())
+            partition = os.path.join(output, "invoices", f"month={month}")
+            (part,) = os.listdir(partition)
+            invoices = pq.read_table(os.path.join(partition, part))
+            items = pq.read_table(os.path.join(output, "items", f"month={month}", part))
+            denominations = pq.read_table(
+                os.path.join(output, "denominations", f"month={month}", part)
+            )
+
+        self.assertEqual(invoices.schema.field("NETAMT").type, pa.decimal128(12, 2))
+        rows = invoices.to_pylist()
+        self.assertEqual(
+            [row["INVOICEID"] for row in rows], [invoice.pk for invoice in self.invoices]
+        )
+        self.assertEqual(rows[0]["CUSTEMAIL"], "customer0@example.com")
+        self.assertEqual(rows[0]["CHANGE_REMAINING"], 3)
+        self.assertEqual(rows[0]["PRCSDATE"], self.invoices[0].PRCSDATE)
+        self.assertEqual(items.column("LINETOTAL").to_pylist(), [Decimal("42.00")] * 3)
+        notes = {
+            (row["KIND"], row["DENOMVALUE"], row["NOTECOUNT"]) for row in denominations.to_pylist()
+        }
+        self.assertEqual(notes, {("change", 200, 2), ("received", 500, 1)})
+
+    @skipUnless(pq, "pyarrow is not installed")
+    def test_full_run_resets_watermark_even_when_nothing_is_written(self):
+        with tempfile.TemporaryDirectory() as output:
+            with self.settings(BILLING_SNAPSHOT_LAG_SECONDS=0):
+                call_command("snapshot_invoices", output, stdout=StringIO())
+            # Every invoice is now inside the lag window.
+            call_command("snapshot_invoices", output, "--full", stdout=StringIO())
+            self.assertEqual(load_watermark(output)["last_prcsdate"], None)
+
+            with self.settings(BILLING_SNAPSHOT_LAG_SECONDS=0):
+                call_command("snapshot_invoices", output, stdout=StringIO())
+            self.assertEqual(pq.read_table(os.path.join(output, "invoices")).num_rows, 3)
+
+    def test_snapshot_command_needs_pyarrow(self):
+        with patch.dict(sys.modules, {"pyarrow": None}):
+            with self.assertRaises(CommandError):
+                call_command("snapshot_invoices", "unused", stdout=StringIO())
+
+    def test_lower_id_committed_late_is_not_skipped(self):
+        # A PostgreSQL sequence can hand out a lower INVOICEID to a transaction
+        # that commits after a higher one; the watermark follows PRCSDATE.
+        now = timezone.now()
+        Invoice.objects.exclude(pk=self.invoices[0].pk).update(PRCSDATE=now - timedelta(hours=1))
+        ((last, _),) = snapshot_chunks(until=now - timedelta(minutes=5))
+        self.assertEqual(last[1], self.invoices[2].pk)
+
+        ((_, tables),) = snapshot_chunks(after=last, until=now + timedelta(minutes=5))
+
+        (rows,) = tables["invoices"].values()
+        self.assertEqual([row["INVOICEID"] for row in rows], [self.invoices[0].pk])
+
+    def test_watermark_without_prcsdate_is_rejected(self):
+        with tempfile.TemporaryDirectory() as output:
+            with open(os.path.join(output, "_watermark.json"), "w") as handle:
+                json.dump({"last_invoice_id": self.invoices[1].pk}, handle)
+            with self.assertRaises(InvalidWatermark):
+                load_watermark(output)
+
+    def test_recent_invoices_wait_for_the_safety_lag(self):
+        until = timezone.now() - timedelta(seconds=300)
+        self.assertEqual(list(snapshot_chunks(until=until)), [])
+
+
+@receipt_settings
+class ReceiptCacheTests(TestCase):
+    def setUp(self):
+        # Invoice ids are reused between tests, so each test gets its own cache.
+        receipt_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(receipt_dir.cleanup)
+        override = self.settings(BILLING_RECEIPT_DIR=receipt_dir.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.product = create_milk()
+        self.invoice = Invoice.objects.create(
+            CUSTNAME="Receipt User",
+            CUSTEMAIL="receipt@example.com",
+            CHANGE_DENOMS={"10": 1},
+        )
+        InvoiceItem.objects.create(
+            INVOICE=self.invoice,
+            PRODUCT=self.product,
+            UNITPRICE=Decimal("20.00"),
+            TAXPERCENT=Decimal("5.00"),
+            QTY=1,
+            LINESUBTOTAL=Decimal("20.00"),
+            LINETAX=Decimal("1.00"),
+            LINETOTAL=Decimal("21.00"),
+        )
+
+    def _path(self):
+        return receipts.receipt_path(self.invoice)
+
+    def test_detail_and_reprint_reuse_cached_receipt(self):
+        response = self.client.get(reverse("invoice_detail", args=[self.invoice.pk]))
+        self.assertContains(response, "Milk")
+        self.assertTrue(self._path().exists())
+
+        with patch("Billing_App.receipts.render_receipt_file") as render_file:
+            self.client.get(reverse("invoice_detail", args=[self.invoice.pk]))
+            response = self.client.get(
+                reverse("invoice_receipt", args=[self.invoice.pk]), {"download": "1"}
+            )
+        render_file.assert_not_called()
+        self.assertIn("attachment;", response["Content-Disposition"])
+        self.assertContains(response, "Receipt User")
+
+    def test_cache_hit_loads_no_items(self):
+        receipts.get_receipt(self.invoice, self.invoice.items.select_related("PRODUCT"))
+
+        with self.assertNumQueries(0):
+            receipt = receipts.get_receipt(
+                self.invoice, self.invoice.items.select_related("PRODUCT")
+            )
+        self.assertIn("Receipt User", receipt)
+
+    def test_receipt_version_bump_renders_again(self):
+        original = self._path()
+        receipts.get_receipt(self.invoice, self.invoice.items.select_related("PRODUCT"))
+
+        self.invoice.RECEIPTVERSION += 1
+        self.assertNotEqual(self._path(), original)
+        receipts.get_receipt(self.invoice, self.invoice.items.select_related("PRODUCT"))
+        self.assertTrue(self._path().exists())
+
+    def test_edited_template_renders_again_and_replaces_old_file(self):
+        original = self._path()
+        receipts.get_receipt(self.invoice, self.invoice.items.select_related("PRODUCT"))
+        detail_version = invoice_version(self.invoice)
+
+        template_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(template_dir.cleanup)
+        os.makedirs(os.path.join(template_dir.name, "Invoice"))
+        with open(os.path.join(template_dir.name, receipts.RECEIPT_TEMPLATE), "w") as handle:
+            handle.write("Edited receipt for {{ invoice.CUSTNAME }}")
+        templates = [dict(settings.TEMPLATES[0], DIRS=[template_dir.name])]
+        # Digests are kept per process; a restart is what picks up an edit.
+        receipts.template_digest.cache_clear()
+        self.addCleanup(receipts.template_digest.cache_clear)
+        with self.settings(TEMPLATES=templates):
+            self.assertNotEqual(self._path(), original)
+            self.assertNotEqual(invoice_version(self.invoice), detail_version)
+            receipt = receipts.get_receipt(
+                self.invoice, self.invoice.items.select_related("PRODUCT")
+            )
+        self.assertEqual(receipt, "Edited receipt for Receipt User")
+        self.assertFalse(original.exists())
+
+
+@receipt_settings
+class CheckoutApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = create_milk()
+        self.body = {
+            "customer_name": "Till Customer",
+            "customer_email": "Till@Example.com",
+            "items": [{"product_id": self.product.PRODID, "qty": 2}],
+            "denominations": {"500": 1},
+        }
+
+    def _post(self, body, key="till-1-0001"):
+        headers = {"Idempotency-Key": key} if key else {}
+        return self.client.post(
+            reverse("api_checkout"),
+            data=json.dumps(body),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_checkout_returns_invoice_with_change(self):
+        response = self._post(self.body)
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data["customer_email"], "till@example.com")
+        self.assertEqual(data["rounded_payable"], "42.00")
+        self.assertEqual(data["change_denoms"], {"200": 2, "50": 1, "5": 1, "2": 1, "1": 1})
+        self.assertEqual(data["items"][0]["line_total"], "42.00")
+        self.assertFalse(data["replayed"])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.PROAVASTOCK, 8)
+
+    def test_retry_with_same_key_returns_original_invoice(self):
+        first = self._post(self.body).json()
+        retry = self._post(self.body)
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json()["invoice_id"], first["invoice_id"])
+        self.assertTrue(retry.json()["replayed"])
+        self.assertEqual(Invoice.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.PROAVASTOCK, 8)
+        self.assertEqual(IdempotencyKey.objects.get().INVOICE_id, first["invoice_id"])
+
+    def test_rejects_missing_key_reused_key_and_short_stock(self):
+        self.assertEqual(self._post(self.body, key="").status_code, 400)
+        self._post(self.body)
+
+        changed = dict(self.body, items=[{"product_id": self.product.PRODID, "qty": 3}])
+        self.assertEqual(self._post(changed).status_code, 422)
+
+        too_many = dict(self.body, items=[{"product_id": self.product.PRODID, "qty": 50}])
+        response = self._post(too_many, key="till-1-0002")
+        self.assertEqual(response.status_code, 409)
+        self.assertIn("Insufficient stock", response.json()["error"])
+        self.assertFalse(IdempotencyKey.objects.filter(KEY="till-1-0002").exists())
+
+
+@receipt_settings
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+        self.product = create_milk()
+        Customer.objects.create(
+            CUSTNAME="Alice Stone", CUSTEMAIL="alice@example.com", DISPSTATUS=0
+        )
+        self.invoices = [
+            Invoice.objects.create(CUSTNAME=f"Alice {index}", CUSTEMAIL="alice@example.com")
+            for index in range(12)
+        ]
+        InvoiceItem.objects.create(
+            INVOICE=self.invoices[0],
+            PRODUCT=self.product,
+            UNITPRICE=Decimal("20.00"),
+            TAXPERCENT=Decimal("5.00"),
+            QTY=1,
+            LINESUBTOTAL=Decimal("20.00"),
+            LINETAX=Decimal("1.00"),
+            LINETOTAL=Decimal("21.00"),
+        )
+
+    async def test_list_views_render_with_async_orm(self):
+        response = await async_views.invoice_index(
+            self.factory.get("/invoice/", {"customer_name": "alice", "page": "2"})
+        )
+        self.assertContains(response, "Page 2 of 2")
+
+        response = await async_views.invoice_index(self.factory.get("/invoice/", {"cursor": ""}))
+        self.assertContains(response, "Alice 11")
+
+        response = await async_views.product_index(self.factory.get("/products/"))
+        self.assertContains(response, "P001")
+
+        response = await async_views.customer_index(
+            self.factory.get("/customers/", {"search": "stone"})
+        )
+        self.assertContains(response, "alice@example.com")
+
+    async def test_invoice_detail_renders_and_404s(self):
+        response = await async_views.invoice_detail(
+            self.factory.get("/"), pk=self.invoices[0].INVOICEID
+        )
+        self.assertContains(response, "Milk")
+
+        with self.assertRaises(Http404):
+            await async_views.invoice_detail(self.factory.get("/"), pk=999999)
+
+    def test_benchmark_command_reports_async_throughput(self):
+        out = StringIO()
+        call_command(
+            "bench_read_views",
+            "--mode",
+            "asgi",
+            "--requests",
+            "4",
+            "--concurrency",
+            "2",
+            "--view",
+            "invoice_index",
+            stdout=out,
+        )
+        self.assertIn("invoice_index    asgi", out.getvalue())
+
+
+@override_settings(BILLING_REPLICA_DATABASE="replica")
+class ReplicaRoutingTests(TestCase):
+    def test_router_reads_replica_only_when_allowed_and_outside_transactions(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Invoice), "default")
+        # TestCase wraps every test in an atomic block on the primary.
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Invoice), "default")
+            with patch.object(connection, "in_atomic_block", False):
+                self.assertEqual(router.db_for_read(Invoice), "replica")
+                self.assertEqual(router.db_for_write(Invoice), "default")
+        with override_settings(BILLING_REPLICA_DATABASE=""), replica_reads():
+            self.assertEqual(current_read_alias(), "default")
+
+    def test_only_listed_safe_views_use_replica_until_pinned(self):
+        factory = RequestFactory()
+        self.assertTrue(use_replica(factory.get(reverse("invoice_index"))))
+        self.assertTrue(use_replica(factory.get(reverse("sales_report"))))
+        self.assertFalse(use_replica(factory.get(reverse("invoice_add"))))
+        self.assertFalse(use_replica(factory.post(reverse("invoice_index"))))
+
+        pinned = factory.get(reverse("invoice_index"))
+        pinned.COOKIES[PRIMARY_PIN_COOKIE] = str(time.time() + 60)
+        self.assertFalse(use_replica(pinned))
+
+    def test_writes_pin_the_client_to_primary(self):
+        response = self.client.post(reverse("customer_add"), {})
+        self.assertIn(PRIMARY_PIN_COOKIE, response.cookies)
+        response = self.client.get(reverse("customer_index"))
+        self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
+
+    def test_sqlite_replica_copy(self):
+        with tempfile.TemporaryDirectory() as directory:
+            primary = os.path.join(directory, "primary.sqlite3")
+            replica = os.path.join(directory, "replica.sqlite3")
+            with closing(sqlite3.connect(primary)) as db, db:
+                db.execute("CREATE TABLE T (ID INTEGER)")
+                db.execute("INSERT INTO T VALUES (1)")
+            copy_sqlite_database(primary, replica)
+            with closing(sqlite3.connect(replica)) as db:
+                self.assertEqual(db.execute("SELECT ID FROM T").fetchall(), [(1,)])
+
+
+class SqliteProfileTests(TestCase):
+    def test_production_profile_runs_concurrent_checkouts_without_lock_errors(self):
+        with tempfile.TemporaryDirectory() as directory:
+            summary = run_profile("production", 2, 20, 0.5, directory)
+            with closing(sqlite3.connect(os.path.join(directory, "production.sqlite3"))) as db:
+                journal_mode = db.execute("PRAGMA journal_mode").fetchone()[0]
+                invoices = db.execute("SELECT COUNT(*) FROM invoice").fetchone()[0]
+
+        self.assertEqual(journal_mode, "wal")
+        self.assertEqual(summary["errors"], 0)
+        self.assertEqual(summary["count"], 40)
+        self.assertGreater(invoices, 0)
+
+
+class LoadTestTests(SimpleTestCase):
+    # The command runs in its own process: its file-backed scratch database is
+    # what lets several clients write at once, and creating it here would swap
+    # out the in-memory test database.
+    def test_concurrent_load_reports_latency_queries_and_stock(self):
+        with tempfile.TemporaryDirectory() as directory:
+            report = os.path.join(directory, "loadtest.json")
+            subprocess.run(
+                [
+                    sys.executable,
+                    str(settings.BASE_DIR / "manage.py"),
+                    "loadtest",
+                    "--clients=3",
+                    "--requests=10",
+                    "--products=5",
+                    "--stock=4",
+                    f"--json={report}",
+                ],
+                env={**os.environ, "SQLITE_PROFILE": "production"},
+                check=True,
+                capture_output=True,
+                timeout=120,
+            )
+            with open(report, encoding="utf-8") as handle:
+                results = json.load(handle)["results"]
+
+        self.assertEqual(results["clients"], 3)
+        checkout = results["views"]["checkout"]
+        self.assertGreater(checkout["outcomes"]["ok"], 0)
+        # More units are ordered than stocked, so clients compete for the last ones.
+        self.assertGreater(checkout["outcomes"]["out_of_stock"], 0)
+        self.assertGreater(checkout["queries_per_request"], 0)
+        self.assertIn("p99_ms", checkout)
+        self.assertEqual(results["stock"], {"oversold_units": 0, "stock_mismatches": 0})
+
+
+# Most queries each view may run. Checkout's count must not grow with the
+# number of lines; raise a budget only with a reason in the commit.
+QUERY_BUDGETS = {
+    "invoice_create": 11,
+    "invoice_create_error": 1,
+    "invoice_detail": 2,
+    "invoice_index": 2,
+}
+
+
+class QueryBudgetMixin:
+    def assertQueryBudget(self, budget_name, func, *args, **kwargs):
+        budget = QUERY_BUDGETS[budget_name]
+        with record_queries() as recorder:
+            result = func(*args, **kwargs)
+        if recorder.count > budget:
+            self.fail(f"{budget_name} exceeded its budget of {budget}: {recorder.summary()}")
+        return recorder.count, result
+
+
+@receipt_settings
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(
+                PRODNAME=f"Item {index}",
+                PRODCODE=f"QB{index}",
+                PRODPRI=Decimal("10.00"),
+                PRODTAXPRE=Decimal("5.00"),
+                PROAVASTOCK=50,
+                DISPSTATUS=0,
+            )
+            for index in range(3)
+        ]
+        # An existing customer: creating one invalidates the catalog.
+        Customer.objects.create(CUSTNAME="Budget", CUSTEMAIL="budget@example.com", DISPSTATUS=0)
+        self.denom = Denomination.objects.get(DENOMVALUE=500)
+
+    def _checkout(self, products, qty="1"):
+        payload = {
+            "customer_name": "Budget",
+            "customer_email": "budget@example.com",
+            "product_id[]": [str(product.PRODID) for product in products],
+            "quantity[]": [qty] * len(products),
+            f"denom_{self.denom.DENOMID}": "1",
+        }
+        return self.client.post(reverse("invoice_add"), data=payload)
+
+    def test_invoice_create_budget_does_not_grow_with_lines(self):
+        # Warm the catalog, change table and today's summary rows first.
+        self._checkout(self.products)
+        one_line, response = self.assertQueryBudget(
+            "invoice_create", self._checkout, self.products[:1]
+        )
+        self.assertEqual(response.status_code, 302)
+        three_lines, response = self.assertQueryBudget(
+            "invoice_create", self._checkout, self.products
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(one_line, three_lines)
+
+    def test_invoice_create_error_budget(self):
+        self._checkout(self.products[:1])
+        _, response = self.assertQueryBudget(
+            "invoice_create_error", self._checkout, self.products, qty="999"
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_invoice_read_view_budgets(self):
+        for _ in range(3):
+            self._checkout(self.products)
+        invoice = Invoice.objects.first()
+        self.assertQueryBudget(
+            "invoice_detail", self.client.get, reverse("invoice_detail", args=[invoice.pk])
+        )
+        self.assertQueryBudget("invoice_index", self.client.get, reverse("invoice_index"))
+
+    def test_query_stats_headers_and_slow_request_log(self):
+        self._checkout(self.products)
+        # The middleware stack is built on a client's first request, so each
+        # setting gets a fresh client.
+        with override_settings(BILLING_QUERY_STATS=True, BILLING_QUERY_WARN_THRESHOLD=1):
+            with self.assertLogs("Billing_App.middleware", "WARNING") as logs:
+                response = self.client_class().get(reverse("invoice_index"))
+        self.assertEqual(response["X-DB-Queries"], "2")
+        self.assertEqual(response["X-DB-Duplicates"], "0")
+        self.assertIn("X-DB-Time-Ms", response)
+        self.assertIn("GET /invoice/: 2 queries", logs.output[0])
+
+        with override_settings(BILLING_QUERY_STATS=False):
+            self.assertNotIn("X-DB-Queries", self.client_class().get(reverse("invoice_index")))
+            with self.assertRaises(MiddlewareNotUsed):
+                QueryStatsMiddleware(async_views.invoice_index)
+
+    async def test_query_stats_count_async_view_queries(self):
+        await sync_to_async(self._checkout)(self.products)
+        with override_settings(BILLING_QUERY_STATS=True):
+            middleware = QueryStatsMiddleware(async_views.invoice_index)
+            response = await middleware(AsyncRequestFactory().get("/invoice/"))
+        self.assertEqual(response["X-DB-Queries"], "2")
+
+
+@receipt_settings
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_metrics_endpoint_reports_views_checkouts_and_backlog(self):
+        product = Product.objects.create(
+            PRODNAME="Tea",
+            PRODCODE="MT1",
+            PRODPRI=Decimal("10.00"),
+            PRODTAXPRE=Decimal("0.00"),
+            PROAVASTOCK=5,
+            DISPSTATUS=0,
+        )
+        denom = Denomination.objects.get(DENOMVALUE=100)
+        payload = {
+            "customer_name": "Metrics",
+            "customer_email": "metrics@example.com",
+            "product_id[]": [str(product.PRODID)],
+            "quantity[]": ["1"],
+            f"denom_{denom.DENOMID}": "1",
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("invoice_add"), data=payload)
+        self.client.get(reverse("invoice_index"))
+
+        body = self.client.get(reverse("metrics")).content.decode()
+        self.assertIn("billing_invoices_created_total 1\n", body)
+        self.assertIn("billing_email_backlog 1\n", body)
+        self.assertIn(
+            'billing_view_latency_seconds_count{method="GET",view="invoice_index"} 1\n', body
+        )
+        self.assertIn(
+            'billing_view_latency_seconds_bucket{method="POST",view="invoice_add",le="+Inf"} 1',
+            body,
+        )
+
+    def test_processes_aggregate_through_the_metrics_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            other_process = [
+                ["billing_email_task_retries_total", {}, 2],
+                [
+                    "billing_email_lag_seconds",
+                    {},
+                    {"buckets": [0] * 9 + [1, 1], "sum": 7200.0, "count": 1},
+                ],
+            ]
+            with open(os.path.join(directory, "999-other.json"), "w") as handle:
+                json.dump(other_process, handle)
+
+            with override_settings(BILLING_METRICS_DIR=directory):
+                metrics.inc("billing_email_task_retries_total")
+                metrics.observe("billing_email_lag_seconds", 3)
+                body = metrics.render()
+
+        self.assertIn("billing_email_task_retries_total 3\n", body)
+        self.assertIn('billing_email_lag_seconds_bucket{le="5"} 1\n', body)
+        self.assertIn('billing_email_lag_seconds_bucket{le="14400"} 2\n', body)
+        self.assertIn("billing_email_lag_seconds_count 2\n", body)
+
+    def test_concurrent_flushes_and_write_errors_never_reach_the_caller(self):
+        with tempfile.TemporaryDirectory() as directory:
+            orphan = os.path.join(directory, "1-dead.abc.tmp")
+            open(orphan, "w").close()
+            os.utime(orphan, (0, 0))
+            with override_settings(BILLING_METRICS_DIR=directory):
+                errors = []
+
+                def record():
+                    try:
+                        for _ in range(50):
+                            metrics.inc("billing_invoices_created_total")
+                            metrics.flush(force=True)
+                    except Exception as exc:
+                        errors.append(exc)
 
-        with patch("Billing_App.views.send_invoice_email_task.delay", side_effect=Exception("broker down")):
-            _queue_invoice_email(invoice.INVOICEID)
+                threads = [threading.Thread(target=record) for _ in range(4)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(errors, [])
+                self.assertIn("billing_invoices_created_total 200\n", metrics.render())
+                self.assertEqual([name for name in os.listdir(directory) if name.endswith(".tmp")], [])
+
+            blocker = os.path.join(directory, "not-a-directory")
+            open(blocker, "w").close()
+            with override_settings(BILLING_METRICS_DIR=blocker):
+                with self.assertLogs("Billing_App.metrics", "WARNING"):
+                    metrics.observe("billing_email_lag_seconds", 3)
+                    metrics.flush(force=True)
+
+    @override_settings(BILLING_METRICS_TOKEN="secret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+
+
+@receipt_settings
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
 
+    def test_trusted_header_profiles_request_and_report_lists_hot_functions(self):
+        Invoice.objects.create(CUSTNAME="Profiled", CUSTEMAIL="profiled@example.com")
+        with override_settings(
+            BILLING_PROFILE_TOKEN="let-me-in", BILLING_PROFILE_DIR=self.profile_dir.name
+        ):
+            self.client.get(reverse("invoice_index"))
+            self.assertEqual(os.listdir(self.profile_dir.name), [])
+
+            response = self.client.get(
+                reverse("invoice_index"), HTTP_X_BILLING_PROFILE="let-me-in"
+            )
+            name = response["X-Billing-Profile-Id"]
+            with open(os.path.join(self.profile_dir.name, f"{name}.json")) as handle:
+                summary = json.load(handle)
+
+            flamegraph = os.path.join(self.profile_dir.name, "out", "stacks.txt")
+            out = StringIO()
+            call_command("profile_report", "--top", "5", "--flamegraph", flamegraph, stdout=out)
+
+        self.assertEqual(summary["view"], "invoice_index")
+        # The count runs in the view, the page query while the template
+        # iterates it.
+        self.assertEqual(summary["sql_queries"], 2)
+        self.assertGreater(summary["template_ms"], 0)
+        self.assertGreater(summary["template_sql_ms"], 0)
+        self.assertLessEqual(summary["template_sql_ms"], summary["sql_ms"])
+        self.assertIn("1 profiled requests", out.getvalue())
+        self.assertIn("function calls", out.getvalue())
+        self.assertTrue(os.path.exists(flamegraph))
+
+    def test_profiles_rotate(self):
+        with override_settings(
+            BILLING_PROFILE_SAMPLE_RATE=1.0,
+            BILLING_PROFILE_DIR=self.profile_dir.name,
+            BILLING_PROFILE_KEEP=2,
+        ):
+            for _ in range(3):
+                self.client.get(reverse("product_index"))
+        names = sorted(os.listdir(self.profile_dir.name))
+        self.assertEqual(len([name for name in names if name.endswith(".json")]), 2)
+        self.assertEqual(len(names), 6)
+
+    def test_middleware_left_out_when_profiling_is_off(self):
+        with override_settings(BILLING_PROFILE_TOKEN="", BILLING_PROFILE_SAMPLE_RATE=0.0):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(async_views.product_index)
+
+    async def test_async_requests_leave_the_event_loop_only_when_profiled(self):
+        with override_settings(
+            BILLING_PROFILE_TOKEN="let-me-in", BILLING_PROFILE_DIR=self.profile_dir.name
+        ):
+            middleware = ProfilingMiddleware(async_views.product_index)
+            with patch("Billing_App.middleware._run_in_sync_thread") as run_in_sync_thread:
+                response = await middleware(AsyncRequestFactory().get("/products/"))
+            run_in_sync_thread.assert_not_called()
+            self.assertNotIn("X-Billing-Profile-Id", response)
+
+            response = await middleware(
+                AsyncRequestFactory().get("/products/", headers={"X-Billing-Profile": "let-me-in"})
+            )
+        name = response["X-Billing-Profile-Id"]
+        self.assertTrue(os.path.exists(os.path.join(self.profile_dir.name, f"{name}.json")))
+
+
+@receipt_settings
+class InvoiceDetailCachingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        product = Product.objects.create(
+            PRODNAME="Bread",
+            PRODCODE="ET1",
+            PRODPRI=Decimal("30.00"),
+            PRODTAXPRE=Decimal("0.00"),
+            PROAVASTOCK=10,
+            DISPSTATUS=0,
+        )
+        self.invoice = Invoice.objects.create(CUSTNAME="Etag", CUSTEMAIL="etag@example.com")
+        InvoiceItem.objects.create(
+            INVOICE=self.invoice,
+            PRODUCT=product,
+            UNITPRICE=Decimal("30.00"),
+            TAXPERCENT=Decimal("0.00"),
+            QTY=1,
+            LINESUBTOTAL=Decimal("30.00"),
+            LINETAX=Decimal("0.00"),
+            LINETOTAL=Decimal("30.00"),
+        )
+        self.url = reverse("invoice_detail", args=[self.invoice.pk])
+
+    def test_etag_304_and_email_status_change(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+        self.assertNotIn("Last-Modified", response)
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        Invoice.objects.filter(pk=self.invoice.pk).update(EMAILSENT=True)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_receipt_fragment_is_cached_per_invoice_version(self):
+        self.assertContains(self.client.get(self.url), "Bread")
+        # Invoice only: the items and receipt come from the fragment cache.
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get(self.url), "Bread")
+
+        # A new fragment, but the receipt itself still comes from disk.
+        Invoice.objects.filter(pk=self.invoice.pk).update(EMAILFAILCOUNT=1)
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get(self.url), "Bread")
+
+    async def test_async_detail_uses_fragment_cache_and_etag(self):
+        factory = AsyncRequestFactory()
+        response = await async_views.invoice_detail(factory.get("/"), pk=self.invoice.pk)
+        self.assertContains(response, "Bread")
+        etag = response["ETag"]
+
+        with patch.object(async_views, "get_receipt", side_effect=AssertionError("not cached")):
+            response = await async_views.invoice_detail(factory.get("/"), pk=self.invoice.pk)
+            self.assertContains(response, "Bread")
+            response = await async_views.invoice_detail(
+                factory.get("/", headers={"if-none-match": etag}), pk=self.invoice.pk
+            )
+        self.assertEqual(response.status_code, 304)
+
+    async def test_async_detail_survives_fragment_expiring_before_render(self):
+        factory = AsyncRequestFactory()
+        await async_views.invoice_detail(factory.get("/"), pk=self.invoice.pk)
+        fragment = await cache.aget(receipt_fragment_key(self.invoice))
+        # The view sees the fragment, then it expires before the template tag runs.
+        await cache.aclear()
+        with patch.object(async_views.cache, "aget", return_value=fragment):
+            response = await async_views.invoice_detail(factory.get("/"), pk=self.invoice.pk)
+        self.assertContains(response, "Bread")
+        self.assertIn("Bread", await cache.aget(receipt_fragment_key(self.invoice)))
+
+    def test_deploy_version_changes_etag(self):
+        etag = self.client.get(self.url)["ETag"]
+        with override_settings(BILLING_DEPLOY_VERSION="next-release"):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+@receipt_settings
+class InvoiceArchiveTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            PRODNAME="Rice",
+            PRODCODE="AR1",
+            PRODPRI=Decimal("50.00"),
+            PRODTAXPRE=Decimal("0.00"),
+            PROAVASTOCK=10,
+            DISPSTATUS=0,
+        )
+        old = timezone.now() - timedelta(days=400)
+        self.settled = self._invoice("Old Settled", old, EMAILSENT=True)
+        self.retrying = self._invoice("Old Retrying", old, EMAILSENT=False)
+        self.recent = self._invoice("Recent", timezone.now(), EMAILSENT=True)
+        EmailOutbox.objects.create(INVOICE=self.settled, STATUS=1)
+
+    def _invoice(self, name, created, **fields):
+        invoice = Invoice.objects.create(
+            CUSTNAME=name, CUSTEMAIL="archive@example.com", NETAMT=Decimal("50.00"), **fields
+        )
+        InvoiceItem.objects.create(
+            INVOICE=invoice,
+            PRODUCT=self.product,
+            UNITPRICE=Decimal("50.00"),
+            TAXPERCENT=Decimal("0.00"),
+            QTY=1,
+            LINESUBTOTAL=Decimal("50.00"),
+            LINETAX=Decimal("0.00"),
+            LINETOTAL=Decimal("50.00"),
+        )
+        Invoice.objects.filter(pk=invoice.pk).update(PRCSDATE=created)
         invoice.refresh_from_db()
-        self.assertEqual(invoice.EMAILSENT, False)
-        self.assertEqual(invoice.EMAILFAILCOUNT, 1)
-        self.assertIn("Queue error:", invoice.EMAILLASTERROR)
+        return invoice
+
+    def test_archive_moves_settled_invoices_and_reads_fall_through(self):
+        out = StringIO()
+        call_command("archive_invoices", "--days", "365", "--batch-size", "1", stdout=out)
+        self.assertIn("Archived 1 invoices and 1 items", out.getvalue())
+
+        self.assertEqual(
+            set(Invoice.objects.values_list("pk", flat=True)), {self.retrying.pk, self.recent.pk}
+        )
+        archived = ArchivedInvoice.objects.get()
+        self.assertEqual(archived.pk, self.settled.pk)
+        self.assertEqual(archived.PRCSDATE, self.settled.PRCSDATE)
+        self.assertEqual(ArchivedInvoiceItem.objects.get().INVOICE_id, self.settled.pk)
+        self.assertFalse(EmailOutbox.objects.exists())
+
+        detail = self.client.get(reverse("invoice_detail", args=[self.settled.pk]))
+        self.assertContains(detail, "Rice")
+        receipt = self.client.get(reverse("invoice_receipt", args=[self.settled.pk]))
+        self.assertContains(receipt, "Old Settled")
+
+        self.assertNotContains(self.client.get(reverse("invoice_index")), "Old Settled")
+        from_date = timezone.localdate(self.settled.PRCSDATE).isoformat()
+        listing = self.client.get(
+            reverse("invoice_index"), {"from_date": from_date, "customer_name": "old"}
+        )
+        self.assertContains(listing, "Old Settled")
+        self.assertContains(listing, "Old Retrying")
+        self.assertContains(listing, "Archived")
+        self.assertNotContains(listing, "Recent")
+
+    async def test_async_views_fall_through_to_archive(self):
+        await sync_to_async(call_command)("archive_invoices", "--days", "365", stdout=StringIO())
+        factory = AsyncRequestFactory()
+        response = await async_views.invoice_detail(factory.get("/"), pk=self.settled.pk)
+        self.assertContains(response, "Rice")
+        from_date = timezone.localdate(self.settled.PRCSDATE).isoformat()
+        response = await async_views.invoice_index(
+            factory.get("/invoice/", {"from_date": from_date})
+        )
+        self.assertContains(response, "Old Settled")
+
+    def test_rebuild_keeps_summaries_of_archived_days(self):
+        rebuild_sales_summaries()
+        archived_day = timezone.localdate(self.settled.PRCSDATE)
+        call_command("archive_invoices", "--days", "365", stdout=StringIO())
+
+        rebuild_sales_summaries()
+        summary = DailySalesSummary.objects.get(SALESDATE=archived_day)
+        self.assertEqual(summary.INVOICECOUNT, 2)
+
+
+@receipt_settings
+class InvoicePurgeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.milk = create_milk(stock=100, code="PG1")
+        self.bread = Product.objects.create(
+            PRODNAME="Bread",
+            PRODCODE="PG2",
+            PRODPRI=Decimal("40.00"),
+            PRODTAXPRE=Decimal("10.00"),
+            PROAVASTOCK=100,
+            DISPSTATUS=0,
+        )
+        self.denom = Denomination.objects.get(DENOMVALUE=500)
+
+    def _checkout(self, email, lines):
+        payload = {
+            "customer_name": "Purge User",
+            "customer_email": email,
+            "product_id[]": [str(product.PRODID) for product, _ in lines],
+            "quantity[]": [str(qty) for _, qty in lines],
+            f"denom_{self.denom.DENOMID}": "1",
+        }
+        response = self.client.post(reverse("invoice_add"), data=payload)
+        self.assertEqual(response.status_code, 302)
+        return Invoice.objects.get(pk=response.url.rstrip("/").split("/")[-1])
+
+    def _summaries(self):
+        return (
+            list(DailySalesSummary.objects.values_list("SALESDATE", "INVOICECOUNT", "NETAMT")),
+            list(
+                DailyProductSales.objects.values_list(
+                    "PRODUCT_id", "INVOICECOUNT", "QTYSOLD", "NETAMT"
+                ).order_by("PRODUCT_id")
+            ),
+        )
+
+    def test_command_purges_in_batches_and_keeps_summaries_and_stock(self):
+        self._checkout("gone@example.com", [(self.milk, 2), (self.bread, 1)])
+        self._checkout("gone@example.com", [(self.bread, 3)])
+        kept = self._checkout("kept@example.com", [(self.milk, 1)])
+        self.assertTrue(EmailOutbox.objects.exists())
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command(
+                "purge_invoices",
+                "--customer-email",
+                "gone@example.com",
+                "--batch-size",
+                "1",
+                "--restore-stock",
+                stdout=out,
+            )
+
+        self.assertIn("Purged 2 invoices and 3 items in 2 batches", out.getvalue())
+        # No item row is loaded into Python: items are only aggregated and deleted.
+        self.assertFalse(any('"INVOICEITEMID"' in query["sql"] for query in queries))
+        self.assertEqual(list(Invoice.objects.values_list("pk", flat=True)), [kept.pk])
+        self.assertEqual(InvoiceItem.objects.count(), 1)
+        self.assertEqual(list(EmailOutbox.objects.values_list("INVOICE_id", flat=True)), [kept.pk])
+
+        self.milk.refresh_from_db()
+        self.bread.refresh_from_db()
+        self.assertEqual((self.milk.PROAVASTOCK, self.bread.PROAVASTOCK), (99, 100))
+
+        summaries = self._summaries()
+        self.assertEqual(summaries[0][0][1:], (1, Decimal("21.00")))
+        rebuild_sales_summaries()
+        self.assertEqual(self._summaries(), summaries)
+
+    def test_command_needs_a_filter_or_all(self):
+        self._checkout("kept@example.com", [(self.milk, 1)])
+        with self.assertRaises(CommandError):
+            call_command("purge_invoices", stdout=StringIO())
+
+        call_command("purge_invoices", "--all", stdout=StringIO())
+        self.assertFalse(Invoice.objects.exists())
+        self.assertFalse(DailySalesSummary.objects.exists())
+        self.milk.refresh_from_db()
+        self.assertEqual(self.milk.PROAVASTOCK, 99)
+
+    def test_admin_action_purges_selection(self):
+        gone = self._checkout("gone@example.com", [(self.bread, 2)])
+        kept = self._checkout("kept@example.com", [(self.milk, 1)])
+        admin_user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pw")
+        self.client.force_login(admin_user)
+
+        response = self.client.post(
+            reverse("admin:Billing_App_invoice_changelist"),
+            {"action": "purge_selected_restore_stock", "_selected_action": [gone.pk]},
+        )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(Invoice.objects.values_list("pk", flat=True)), [kept.pk])
+        self.bread.refresh_from_db()
+        self.assertEqual(self.bread.PROAVASTOCK, 100)
+
+
+class GenerateDataTests(TestCase):
+    def test_generated_invoices_are_consistent_and_searchable(self):
+        hours = ["0"] * 24
+        hours[10] = "1"
+        out = StringIO()
+        call_command(
+            "generate_data",
+            "--customers",
+            "20",
+            "--products",
+            "15",
+            "--invoices",
+            "120",
+            "--days",
+            "3",
+            "--hour-weights",
+            ",".join(hours),
+            "--batch-size",
+            "50",
+            stdout=out,
+        )
+
+        self.assertIn("Generated 20 customers, 15 products, 120 invoices", out.getvalue())
+        invoices = list(Invoice.objects.order_by("INVOICEID").prefetch_related("items"))
+        self.assertEqual(len(invoices), 120)
+        first_day = timezone.localdate() - timedelta(days=2)
+        for invoice in invoices:
+            items = list(invoice.items.all())
+            self.assertTrue(items)
+            self.assertEqual(sum(item.LINETOTAL for item in items), invoice.NETAMT)
+            self.assertEqual(tendered_amount(invoice.RECEIVED_DENOMS), invoice.PAIDAMT)
+            self.assertEqual(invoice.PAIDAMT - invoice.ROUNDEDPAYABLE, invoice.BALANCEAMT)
+            self.assertGreaterEqual(invoice.BALANCEAMT, 0)
+            self.assertTrue(invoice.EMAILSENT)
+            created = timezone.localtime(invoice.PRCSDATE)
+            self.assertEqual(created.hour, 10)
+            self.assertGreaterEqual(created.date(), first_day)
+            self.assertEqual(items[0].PRCSDATE, invoice.PRCSDATE)
+        # IDs follow creation time, as they would for real checkouts.
+        self.assertEqual(invoices, sorted(invoices, key=lambda invoice: invoice.PRCSDATE))
+
+        summaries = DailySalesSummary.objects.all()
+        self.assertEqual(sum(summary.INVOICECOUNT for summary in summaries), 120)
+        name = invoices[0].CUSTNAME.split()[0]
+        matches = filter_invoices(Invoice.objects.all(), {"customer_name": name})
+        self.assertIn(invoices[0], matches)
+
+    def test_distributions(self):
+        weights = zipf_cum_weights(4, 1.0)
+        self.assertAlmostEqual(weights[-1], 1 + 1 / 2 + 1 / 3 + 1 / 4)
+        self.assertEqual(zipf_cum_weights(3, 0), [1.0, 2.0, 3.0])
+
+        rng = random.Random(1)
+        values = (500, 200, 100, 50, 20, 10, 5, 2, 1)
+        for payable in (Decimal("1.00"), Decimal("187.00"), Decimal("499.00"), Decimal("1234.00")):
+            received = tender(payable, values, rng)
+            self.assertGreaterEqual(tendered_amount(received), payable)
+
+    def test_search_index_is_only_paused_on_request(self):
+        args = ["--customers", "2", "--products", "2", "--invoices", "3", "--skip-summaries"]
+        with patch("Billing_App.management.commands.generate_data.uninstall_search") as uninstall:
+            call_command("generate_data", *args, stdout=StringIO())
+            uninstall.assert_not_called()
+            call_command("generate_data", *args, "--pause-search", stdout=StringIO())
+            uninstall.assert_called_once()
+
+    def test_bounded_imap_limits_days_in_flight(self):
+        class Pool:
+            submitted = 0
+            consumed = 0
+            most_ahead = 0
+
+            def apply_async(self, func, args):
+                self.submitted += 1
+                self.most_ahead = max(self.most_ahead, self.submitted - self.consumed)
+                result = func(*args)
+                pool = self
+
+                class Result:
+                    def get(self):
+                        pool.consumed += 1
+                        return result
+
+                return Result()
+
+        pool = Pool()
+        results = list(bounded_imap(pool, lambda day: day * 2, range(10), 3))
+        self.assertEqual(results, [day * 2 for day in range(10)])
+        self.assertEqual(pool.most_ahead, 3)
+
+    def test_rejects_bad_hour_weights(self):
+        with self.assertRaises(CommandError):
+            call_command("generate_data", "--invoices", "1", "--hour-weights", "1,2,3")
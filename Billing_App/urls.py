@@ -1,18 +1,32 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
+
+# Under ASGI the read-only list/detail pages can use the async ORM instead of
+# holding a worker thread per request.
+read_views = async_views if settings.BILLING_ASYNC_VIEWS else views
 
 urlpatterns = [
     path("", views.home, name="home"),
 
     # Invoice URLs
-    path("invoice/", views.invoice_index, name="invoice_index"),
+    path("invoice/", read_views.invoice_index, name="invoice_index"),
     path("invoice/add/", views.invoice_create, name="invoice_add"),
-    path("invoice/<int:pk>/", views.invoice_detail, name="invoice_detail"),
+    path("invoice/export/", views.invoice_export, name="invoice_export"),
+    path("invoice/<int:pk>/", read_views.invoice_detail, name="invoice_detail"),
+    path("invoice/<int:pk>/receipt/", views.invoice_receipt, name="invoice_receipt"),
     path("invoice/<int:pk>/delete/", views.invoice_delete, name="invoice_delete"),
 
+    # POS API URLs
+    path("api/checkout/", views.api_checkout, name="api_checkout"),
+
+    # Report URLs
+    path("reports/sales/", views.sales_report_view, name="sales_report"),
+    path("metrics/", views.metrics_view, name="metrics"),
+
     # Product Master URLs
-    path("products/", views.product_index, name="product_index"),
+    path("products/", read_views.product_index, name="product_index"),
     path("products/add/", views.product_add, name="product_add"),
     path("products/<int:pk>/edit/", views.product_edit, name="product_edit"),
     path("products/<int:pk>/delete/", views.product_delete, name="product_delete"),
@@ -24,7 +38,7 @@ urlpatterns = [
     path("denominations/<int:pk>/delete/", views.denomination_delete, name="denomination_delete"),
 
     # Customer Master URLs
-    path("customers/", views.customer_index, name="customer_index"),
+    path("customers/", read_views.customer_index, name="customer_index"),
     path("customers/add/", views.customer_add, name="customer_add"),
     path("customers/<int:pk>/edit/", views.customer_edit, name="customer_edit"),
     path("customers/<int:pk>/delete/", views.customer_delete, name="customer_delete"),
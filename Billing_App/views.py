@@ -1,28 +1,30 @@
-from decimal import Decimal, ROUND_DOWN
-import logging
+import json
+from datetime import timedelta
 
+from django.conf import settings
 from django.contrib import messages
 from django.core.paginator import Paginator
 from django.db import transaction
-from django.db.models import F, Q
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from . import metrics
+from .archive import archive_boundary, get_invoice, invoice_list_queryset
+from .catalog import get_catalog
+from .checkout import CheckoutError, invoice_payload, place_order
+from .conditional import add_validators, detail_context, not_modified
+from .exports import EXPORT_FORMATS, iter_export
+from .filters import invoice_filter_params, parse_date
 from .forms import CustomerForm, DenominationForm, ProductForm
-from .models import Customer, Denomination, Invoice, InvoiceItem, Product
-from .tasks import send_invoice_email_task
-
-logger = logging.getLogger(__name__)
-
-
-def _queue_invoice_email(invoice_id):
-    try:
-        send_invoice_email_task.delay(invoice_id)
-    except Exception as exc:
-        logger.exception("Failed to queue invoice email task for invoice_id=%s", invoice_id)
-        Invoice.objects.filter(pk=invoice_id).update(
-            EMAILFAILCOUNT=F("EMAILFAILCOUNT") + 1,
-            EMAILLASTERROR=f"Queue error: {str(exc)[:1000]}",
-            EMAILSENT=False,
-        )
+from .models import Customer, Denomination, Invoice, Product
+from .pagination import invoice_total_count, keyset_invoice_page
+from .receipts import get_receipt, receipt_document
+from .reports import remove_invoice, sales_report
+from .routers import current_read_alias
+from .search import search_customers
 
 
 def home(request):
@@ -30,39 +32,54 @@ def home(request):
 
 
 def invoice_index(request):
-    customer_name = request.GET.get("customer_name", "").strip()
-    customer_email = request.GET.get("customer_email", "").strip()
-    from_date = request.GET.get("from_date", "").strip()
-    to_date = request.GET.get("to_date", "").strip()
+    filters = invoice_filter_params(request.GET)
     per_page = _get_per_page(request)
-    invoice_qs = Invoice.objects.all()
-
-    if customer_name:
-        invoice_qs = invoice_qs.filter(CUSTNAME__icontains=customer_name)
-    if customer_email:
-        invoice_qs = invoice_qs.filter(CUSTEMAIL__icontains=customer_email)
-    if from_date:
-        invoice_qs = invoice_qs.filter(PRCSDATE__date__gte=from_date)
-    if to_date:
-        invoice_qs = invoice_qs.filter(PRCSDATE__date__lte=to_date)
-
-    paginator = Paginator(invoice_qs, per_page)
-    page_obj = paginator.get_page(request.GET.get("page"))
-    context = {
-        "invoices": page_obj,
-        "customer_name": customer_name,
-        "customer_email": customer_email,
-        "from_date": from_date,
-        "to_date": to_date,
-        "per_page": per_page,
-    }
+    boundary = archive_boundary() if filters["from_date"] else None
+    invoice_qs, with_archive = invoice_list_queryset(filters, boundary)
+
+    context = dict(filters, per_page=per_page)
+    cursor = request.GET.get("cursor", "").strip()
+    # Keyset pages need a plain queryset; a search reaching the archive pages
+    # by offset.
+    if not with_archive and (cursor or settings.BILLING_INVOICE_PAGINATION == "cursor"):
+        page_obj = keyset_invoice_page(invoice_qs, cursor, per_page)
+        page_obj.total_count, page_obj.approximate = invoice_total_count(invoice_qs, filters)
+        context["keyset"] = True
+    else:
+        paginator = Paginator(invoice_qs, per_page)
+        page_obj = paginator.get_page(request.GET.get("page"))
+    context["invoices"] = page_obj
     return render(request, "Invoice/Invoice_Index.html", context)
 
 
+def metrics_view(request):
+    token = settings.BILLING_METRICS_TOKEN
+    if token and request.headers.get("Authorization", "") != f"Bearer {token}":
+        return HttpResponse(status=401)
+    return HttpResponse(
+        metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def invoice_export(request):
+    filters = invoice_filter_params(request.GET)
+    export_format = request.GET.get("format", "csv")
+    if export_format not in EXPORT_FORMATS:
+        export_format = "csv"
+    response = StreamingHttpResponse(
+        iter_export(filters, export_format, using=current_read_alias()),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    filename = f"invoices-{timezone.localdate():%Y%m%d}.{export_format}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
 def invoice_create(request):
-    customers = Customer.objects.filter(DISPSTATUS=0).order_by("CUSTNAME")
-    products = Product.objects.filter(DISPSTATUS=0).order_by("PRODNAME")
-    denominations = Denomination.objects.filter(DISPSTATUS=0).order_by("-DENOMVALUE")
+    catalog = get_catalog()
+    customers = catalog["customers"]
+    products = catalog["products"]
+    denominations = catalog["denominations"]
 
     if request.method == "GET":
         context = {
@@ -74,281 +91,110 @@ def invoice_create(request):
 
     customer_name = request.POST.get("customer_name", "").strip()
     customer_email = request.POST.get("customer_email", "").strip().lower()
+    line_inputs = zip(request.POST.getlist("product_id[]"), request.POST.getlist("quantity[]"))
+    raw_denom_counts = {
+        str(denom.DENOMVALUE): request.POST.get(f"denom_{denom.DENOMID}", "0")
+        for denom in denominations
+    }
 
-    if not customer_name:
-        messages.error(request, "Customer name is required.")
-        return render(
-            request,
-            "Invoice/Invoice_Add.html",
-            {"customers": customers, "products": products, "denominations": denominations},
-        )
-
-    if not customer_email:
-        messages.error(request, "Customer email is required.")
-        return render(
-            request,
-            "Invoice/Invoice_Add.html",
-            {"customers": customers, "products": products, "denominations": denominations},
+    try:
+        invoice, _, _ = place_order(
+            customer_name, customer_email, line_inputs, denominations, raw_denom_counts
         )
-
-    product_ids = request.POST.getlist("product_id[]")
-    quantities = request.POST.getlist("quantity[]")
-    line_inputs = []
-    for product_id, quantity in zip(product_ids, quantities):
-        product_id = product_id.strip()
-        quantity = quantity.strip()
-        if not product_id and not quantity:
-            continue
-        line_inputs.append((product_id, quantity))
-
-    if not line_inputs:
-        messages.error(request, "Add at least one product line.")
+    except CheckoutError as exc:
+        messages.error(request, str(exc))
         return render(
             request,
             "Invoice/Invoice_Add.html",
             {"customers": customers, "products": products, "denominations": denominations},
         )
 
-    product_qty_map = {}
-    for product_id, quantity in line_inputs:
-        if not product_id or not quantity:
-            messages.error(request, "Each bill row needs product and quantity.")
-            return render(
-                request,
-                "Invoice/Invoice_Add.html",
-                {
-                    "customers": customers,
-                    "products": products,
-                    "denominations": denominations,
-                },
-            )
-        try:
-            pid = int(product_id)
-            qty = int(quantity)
-        except ValueError:
-            messages.error(request, "Invalid product or quantity value.")
-            return render(
-                request,
-                "Invoice/Invoice_Add.html",
-                {
-                    "customers": customers,
-                    "products": products,
-                    "denominations": denominations,
-                },
-            )
-        if qty <= 0:
-            messages.error(request, "Quantity must be greater than zero.")
-            return render(
-                request,
-                "Invoice/Invoice_Add.html",
-                {
-                    "customers": customers,
-                    "products": products,
-                    "denominations": denominations,
-                },
-            )
-        product_qty_map[pid] = product_qty_map.get(pid, 0) + qty
-
-    product_map = {
-        item.PRODID: item for item in Product.objects.filter(PRODID__in=product_qty_map.keys())
-    }
-    if len(product_map) != len(product_qty_map):
-        messages.error(request, "One or more selected products do not exist.")
-        return render(
-            request,
-            "Invoice/Invoice_Add.html",
-            {"customers": customers, "products": products, "denominations": denominations},
-        )
+    messages.success(
+        request,
+        "Invoice generated successfully. Email will be sent in background.",
+    )
+    return redirect("invoice_detail", pk=invoice.INVOICEID)
 
-    for pid, qty in product_qty_map.items():
-        product = product_map[pid]
-        if product.DISPSTATUS != 0:
-            messages.error(request, f"{product.PRODNAME} is disabled.")
-            return render(
-                request,
-                "Invoice/Invoice_Add.html",
-                {
-                    "customers": customers,
-                    "products": products,
-                    "denominations": denominations,
-                },
-            )
-        if qty > product.PROAVASTOCK:
-            messages.error(
-                request,
-                f"Insufficient stock for {product.PRODNAME}. Available stock is {product.PROAVASTOCK}.",
-            )
-            return render(
-                request,
-                "Invoice/Invoice_Add.html",
-                {
-                    "customers": customers,
-                    "products": products,
-                    "denominations": denominations,
-                },
-            )
-
-    received_denoms = {}
-    paid_amount = Decimal("0.00")
-    for denom in denominations:
-        field_name = f"denom_{denom.DENOMID}"
-        raw_count = request.POST.get(field_name, "0").strip() or "0"
-        try:
-            count = int(raw_count)
-        except ValueError:
-            messages.error(request, f"Invalid denomination count for {denom.DENOMVALUE}.")
-            return render(
-                request,
-                "Invoice/Invoice_Add.html",
-                {
-                    "customers": customers,
-                    "products": products,
-                    "denominations": denominations,
-                },
-            )
-        if count < 0:
-            messages.error(request, "Denomination count cannot be negative.")
-            return render(
-                request,
-                "Invoice/Invoice_Add.html",
-                {
-                    "customers": customers,
-                    "products": products,
-                    "denominations": denominations,
-                },
-            )
-        received_denoms[str(denom.DENOMVALUE)] = count
-        paid_amount += Decimal(denom.DENOMVALUE) * Decimal(count)
-
-    paid_amount = paid_amount.quantize(Decimal("0.00"))
-
-    gross_amount = Decimal("0.00")
-    tax_amount = Decimal("0.00")
-    item_payload = []
-
-    for pid, qty in product_qty_map.items():
-        product = product_map[pid]
-        unit_price = product.PRODPRI.quantize(Decimal("0.00"))
-        tax_percent = product.PRODTAXPRE.quantize(Decimal("0.00"))
-        line_subtotal = (unit_price * qty).quantize(Decimal("0.00"))
-        line_tax = (line_subtotal * tax_percent / Decimal("100")).quantize(Decimal("0.00"))
-        line_total = (line_subtotal + line_tax).quantize(Decimal("0.00"))
-
-        gross_amount += line_subtotal
-        tax_amount += line_tax
-        item_payload.append(
-            {
-                "product": product,
-                "qty": qty,
-                "unit_price": unit_price,
-                "tax_percent": tax_percent,
-                "line_subtotal": line_subtotal,
-                "line_tax": line_tax,
-                "line_total": line_total,
-            }
-        )
 
-    gross_amount = gross_amount.quantize(Decimal("0.00"))
-    tax_amount = tax_amount.quantize(Decimal("0.00"))
-    net_amount = (gross_amount + tax_amount).quantize(Decimal("0.00"))
-    rounded_payable = net_amount.to_integral_value(rounding=ROUND_DOWN).quantize(
-        Decimal("0.00")
-    )
-    balance_amount = (paid_amount - rounded_payable).quantize(Decimal("0.00"))
+@csrf_exempt
+@require_POST
+def api_checkout(request):
+    # JSON checkout for POS terminals. Body:
+    #   {"customer_name": "...", "customer_email": "...",
+    #    "items": [{"product_id": 1, "qty": 2}], "denominations": {"500": 1}}
+    # The Idempotency-Key header is required; retrying with the same key and
+    # body returns the original invoice (200) instead of billing again (201).
+    idempotency_key = request.headers.get("Idempotency-Key", "").strip()
+    if not idempotency_key or len(idempotency_key) > 100:
+        return JsonResponse({"error": "Idempotency-Key header is required."}, status=400)
+    try:
+        data = json.loads(request.body)
+        lines = [
+            (line.get("product_id", ""), line.get("qty", "")) for line in data.get("items", [])
+        ]
+        raw_denom_counts = {
+            str(value): count for value, count in (data.get("denominations") or {}).items()
+        }
+        customer_name = str(data.get("customer_name", "")).strip()
+        customer_email = str(data.get("customer_email", "")).strip().lower()
+    except (ValueError, AttributeError, TypeError):
+        return JsonResponse({"error": "Invalid JSON body."}, status=400)
 
-    if balance_amount < 0:
-        messages.error(
-            request,
-            "Cash paid by customer is less than rounded payable amount.",
-        )
-        return render(
-            request,
-            "Invoice/Invoice_Add.html",
-            {"customers": customers, "products": products, "denominations": denominations},
+    try:
+        invoice, items, replayed = place_order(
+            customer_name,
+            customer_email,
+            lines,
+            get_catalog()["denominations"],
+            raw_denom_counts,
+            idempotency_key=idempotency_key,
         )
+    except CheckoutError as exc:
+        return JsonResponse({"error": str(exc)}, status=exc.status)
+    return JsonResponse(invoice_payload(invoice, items, replayed), status=200 if replayed else 201)
 
-    change_denoms = {}
-    remaining = int(balance_amount)
-    for denom in denominations:
-        value = int(denom.DENOMVALUE)
-        if value <= 0:
-            continue
-        count = remaining // value
-        if count > 0:
-            change_denoms[str(value)] = count
-            remaining -= count * value
-
-    if remaining > 0:
-        change_denoms["remaining"] = remaining
-
-    with transaction.atomic():
-        customer, created = Customer.objects.get_or_create(
-            CUSTEMAIL=customer_email,
-            defaults={"CUSTNAME": customer_name, "DISPSTATUS": 0},
-        )
-        if not created and customer.CUSTNAME != customer_name:
-            customer.CUSTNAME = customer_name
-            customer.save(update_fields=["CUSTNAME"])
-
-        invoice = Invoice.objects.create(
-            CUSTNAME=customer_name,
-            CUSTEMAIL=customer_email,
-            GROSSAMT=gross_amount,
-            TAXAMT=tax_amount,
-            NETAMT=net_amount,
-            ROUNDEDPAYABLE=rounded_payable,
-            PAIDAMT=paid_amount,
-            BALANCEAMT=balance_amount,
-            RECEIVED_DENOMS=received_denoms,
-            CHANGE_DENOMS=change_denoms,
-            EMAILSENT=False,
-        )
 
-        items = []
-        for row in item_payload:
-            items.append(
-                InvoiceItem(
-                    INVOICE=invoice,
-                    PRODUCT=row["product"],
-                    UNITPRICE=row["unit_price"],
-                    TAXPERCENT=row["tax_percent"],
-                    QTY=row["qty"],
-                    LINESUBTOTAL=row["line_subtotal"],
-                    LINETAX=row["line_tax"],
-                    LINETOTAL=row["line_total"],
-                )
-            )
-        InvoiceItem.objects.bulk_create(items)
-
-        for row in item_payload:
-            product = row["product"]
-            product.PROAVASTOCK -= row["qty"]
-            product.save(update_fields=["PROAVASTOCK"])
-
-        transaction.on_commit(lambda: _queue_invoice_email(invoice.INVOICEID))
+def invoice_detail(request, pk):
+    invoice = get_invoice(pk)
+    response = not_modified(request, invoice)
+    if response is not None:
+        return response
 
-    messages.success(
-        request,
-        "Invoice generated successfully. Email queue triggered in background.",
-    )
-    return redirect("invoice_detail", pk=invoice.INVOICEID)
+    def receipt():
+        return get_receipt(invoice, invoice.items.select_related("PRODUCT"))
 
+    response = render(request, "Invoice/Invoice_Detail.html", detail_context(invoice, receipt))
+    return add_validators(response, invoice)
 
-def invoice_detail(request, pk):
-    invoice = get_object_or_404(Invoice, pk=pk)
+
+def invoice_receipt(request, pk):
+    invoice = get_invoice(pk)
     items = invoice.items.select_related("PRODUCT").all()
-    context = {"invoice": invoice, "items": items}
-    return render(request, "Invoice/Invoice_Detail.html", context)
+    response = HttpResponse(receipt_document(invoice, items))
+    if request.GET.get("download"):
+        response["Content-Disposition"] = f'attachment; filename="receipt-{pk}.html"'
+    return response
 
 
 def invoice_delete(request, pk):
     invoice = get_object_or_404(Invoice, pk=pk)
     if request.method == "POST":
-        invoice.delete()
+        with transaction.atomic():
+            remove_invoice(invoice)
+            invoice.delete()
         messages.success(request, "Invoice deleted successfully.")
     return redirect("invoice_index")
 
 
+def sales_report_view(request):
+    today = timezone.localdate()
+    from_date = parse_date(request.GET.get("from_date", "").strip()) or today - timedelta(days=29)
+    to_date = parse_date(request.GET.get("to_date", "").strip()) or today
+    context = sales_report(from_date, to_date)
+    context.update(from_date=from_date.isoformat(), to_date=to_date.isoformat())
+    return render(request, "Reports/Sales_Report.html", context)
+
+
 def _get_per_page(request):
     try:
         per_page = int(request.GET.get("per_page", 10))
@@ -462,9 +308,7 @@ def customer_index(request):
     customer_qs = Customer.objects.all()
 
     if search_query:
-        customer_qs = customer_qs.filter(
-            Q(CUSTNAME__icontains=search_query) | Q(CUSTEMAIL__icontains=search_query)
-        )
+        customer_qs = search_customers(customer_qs, search_query)
 
     paginator = Paginator(customer_qs, per_page)
     page_obj = paginator.get_page(request.GET.get("page"))
@@ -45,6 +45,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "Billing_App.middleware.MetricsMiddleware",
+    "Billing_App.middleware.QueryStatsMiddleware",
+    "Billing_App.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -52,8 +55,35 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "Billing_App.middleware.ReplicaRoutingMiddleware",
 ]
 
+# Per-request SQL counts as X-DB-Queries/X-DB-Time-Ms/X-DB-Duplicates headers;
+# requests running more than the threshold are logged with their repeats.
+BILLING_QUERY_STATS = os.getenv("BILLING_QUERY_STATS", "false").lower() == "true"
+BILLING_QUERY_WARN_THRESHOLD = int(os.getenv("BILLING_QUERY_WARN_THRESHOLD", "30"))
+
+# /metrics in the Prometheus text format (Billing_App/metrics.py). With several
+# worker processes, point BILLING_METRICS_DIR at a directory they all share so
+# a scrape sums every process; each one rewrites its file at most every
+# BILLING_METRICS_FLUSH_SECONDS. Empty it when the whole service restarts. A
+# non-empty BILLING_METRICS_TOKEN must be sent as "Authorization: Bearer <token>".
+BILLING_METRICS_DIR = os.getenv("BILLING_METRICS_DIR", "")
+BILLING_METRICS_FLUSH_SECONDS = float(os.getenv("BILLING_METRICS_FLUSH_SECONDS", "5"))
+BILLING_METRICS_TOKEN = os.getenv("BILLING_METRICS_TOKEN", "")
+
+# Per-request profiles (Billing_App/profiling.py): requests sending
+# "X-Billing-Profile: <BILLING_PROFILE_TOKEN>", plus a random
+# BILLING_PROFILE_SAMPLE_RATE share of all requests, leave cProfile data and
+# flamegraph stacks in BILLING_PROFILE_DIR; only the newest BILLING_PROFILE_KEEP
+# are kept. Summarise them with `manage.py profile_report`.
+BILLING_PROFILE_TOKEN = os.getenv("BILLING_PROFILE_TOKEN", "")
+BILLING_PROFILE_SAMPLE_RATE = float(os.getenv("BILLING_PROFILE_SAMPLE_RATE", "0"))
+BILLING_PROFILE_DIR = os.getenv("BILLING_PROFILE_DIR", str(BASE_DIR / "profiles"))
+BILLING_PROFILE_KEEP = int(os.getenv("BILLING_PROFILE_KEEP", "200"))
+# Seconds between stack samples for the flamegraph.
+BILLING_PROFILE_INTERVAL = float(os.getenv("BILLING_PROFILE_INTERVAL", "0.001"))
+
 ROOT_URLCONF = "Billing_System.urls"
 
 TEMPLATES = [
@@ -80,10 +110,127 @@ WSGI_APPLICATION = "Billing_System.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        # DATABASE_NAME points at another file, e.g. one filled by generate_data.
+        "NAME": os.getenv("DATABASE_NAME", "") or BASE_DIR / "db.sqlite3",
     }
 }
 
+# Production SQLite profile (SQLITE_PROFILE=production) for several gunicorn
+# workers on one database file:
+# - WAL lets readers run while a checkout writes, and synchronous=NORMAL
+#   fsyncs at checkpoints instead of on every commit.
+# - Every atomic block starts with BEGIN IMMEDIATE, so a checkout takes the
+#   write lock up front and waits on busy_timeout. Deferred transactions fail
+#   with "database is locked" when they upgrade from a read.
+# - Connections are kept for CONN_MAX_AGE seconds, so the pragmas run once
+#   per connection rather than once per request.
+SQLITE_PRODUCTION_OPTIONS = {
+    "init_command": (
+        "PRAGMA journal_mode=WAL;"
+        "PRAGMA synchronous=NORMAL;"
+        "PRAGMA busy_timeout=20000;"
+        "PRAGMA mmap_size=268435456;"
+        "PRAGMA cache_size=-65536;"
+        "PRAGMA temp_store=MEMORY;"
+    ),
+    "transaction_mode": "IMMEDIATE",
+    "timeout": 20,
+}
+if os.getenv("SQLITE_PROFILE", "") == "production":
+    DATABASES["default"]["OPTIONS"] = SQLITE_PRODUCTION_OPTIONS
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("DATABASE_CONN_MAX_AGE", "600"))
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Optional read replica. List/report/export pages read from it; checkout and
+# every other write stay on "default". Locally it can be a second SQLite file
+# refreshed with `manage.py sync_replica`.
+DATABASE_REPLICA_NAME = os.getenv("DATABASE_REPLICA_NAME", "")
+if DATABASE_REPLICA_NAME:
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": DATABASE_REPLICA_NAME,
+        "TEST": {"MIRROR": "default"},
+    }
+BILLING_REPLICA_DATABASE = "replica" if DATABASE_REPLICA_NAME else ""
+DATABASE_ROUTERS = ["Billing_App.routers.PrimaryReplicaRouter"]
+# Seconds a client reads from the primary after its own write.
+BILLING_REPLICA_PIN_SECONDS = int(os.getenv("BILLING_REPLICA_PIN_SECONDS", "10"))
+# URL names whose GET requests may read from the replica.
+BILLING_REPLICA_VIEWS = (
+    "invoice_index",
+    "invoice_detail",
+    "invoice_receipt",
+    "invoice_export",
+    "sales_report",
+    "product_index",
+    "customer_index",
+)
+
+
+# Cache
+# Local memory by default; point CACHE_REDIS_URL at Redis to share cached data
+# (catalog, change tables) between worker processes.
+
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "")
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Seconds the invoice entry catalog may be served from cache between changes.
+BILLING_CATALOG_CACHE_TIMEOUT = int(os.getenv("BILLING_CATALOG_CACHE_TIMEOUT", "60"))
+
+# Seconds a process reuses its change-making table before re-reading the active
+# denominations, so processes without a shared cache pick up other workers' edits.
+BILLING_CHANGE_TABLE_TIMEOUT = int(os.getenv("BILLING_CHANGE_TABLE_TIMEOUT", "30"))
+
+# Invoice list pagination: "offset" (numbered pages) or "cursor" (keyset pages
+# with a cached total, for very large TRANSACTION_MASTER tables).
+BILLING_INVOICE_PAGINATION = os.getenv("BILLING_INVOICE_PAGINATION", "offset")
+BILLING_INVOICE_COUNT_CACHE_TIMEOUT = int(os.getenv("BILLING_INVOICE_COUNT_CACHE_TIMEOUT", "300"))
+
+# Invoice archiving (`manage.py archive_invoices`): settled invoices older than
+# BILLING_ARCHIVE_AFTER_DAYS move to the archive tables, BILLING_ARCHIVE_BATCH_SIZE
+# invoices per transaction.
+BILLING_ARCHIVE_AFTER_DAYS = int(os.getenv("BILLING_ARCHIVE_AFTER_DAYS", "365"))
+BILLING_ARCHIVE_BATCH_SIZE = int(os.getenv("BILLING_ARCHIVE_BATCH_SIZE", "500"))
+
+# Invoices deleted per transaction by `manage.py purge_invoices` and the admin
+# "Purge selected invoices" action.
+BILLING_PURGE_BATCH_SIZE = int(os.getenv("BILLING_PURGE_BATCH_SIZE", "1000"))
+
+# Seconds the receipt fragment of the invoice detail page stays in the cache.
+# Keys include the invoice's email status, so a status change is seen at once.
+BILLING_INVOICE_FRAGMENT_TIMEOUT = int(os.getenv("BILLING_INVOICE_FRAGMENT_TIMEOUT", "86400"))
+
+# Any string that changes with each release (a git SHA, say). It is part of the
+# invoice detail ETag and fragment key, so view changes reach clients at once.
+BILLING_DEPLOY_VERSION = os.getenv("BILLING_DEPLOY_VERSION", "")
+
+# Serve the invoice/product/customer list and invoice detail pages with the
+# async views in Billing_App/async_views.py. Only worth enabling under ASGI.
+BILLING_ASYNC_VIEWS = os.getenv("BILLING_ASYNC_VIEWS", "false").lower() == "true"
+
+# Rendered receipts are cached here. Share it between the web and Celery hosts
+# so the render done for the invoice email also serves the detail page.
+BILLING_RECEIPT_DIR = os.getenv("BILLING_RECEIPT_DIR", str(BASE_DIR / "receipts"))
+
+# Invoices fetched per round trip by the CSV/JSONL export.
+BILLING_EXPORT_CHUNK_SIZE = int(os.getenv("BILLING_EXPORT_CHUNK_SIZE", "2000"))
+
+# Parquet snapshots leave out invoices created in the last N seconds, so
+# transactions still committing and replica lag cannot make a run skip them.
+BILLING_SNAPSHOT_LAG_SECONDS = int(os.getenv("BILLING_SNAPSHOT_LAG_SECONDS", "300"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -135,3 +282,17 @@ CELERY_ACCEPT_CONTENT = ["json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_BEAT_SCHEDULE = {
+    "relay-email-outbox": {
+        "task": "Billing_App.tasks.relay_email_outbox_task",
+        "schedule": float(os.getenv("BILLING_OUTBOX_RELAY_INTERVAL", "5")),
+    },
+}
+
+# Invoice email batching
+BILLING_EMAIL_BATCH_SIZE = int(os.getenv("BILLING_EMAIL_BATCH_SIZE", "100"))
+BILLING_EMAIL_MAX_FAILURES = int(os.getenv("BILLING_EMAIL_MAX_FAILURES", "5"))
+
+# Transactional email outbox
+BILLING_OUTBOX_BATCH_SIZE = int(os.getenv("BILLING_OUTBOX_BATCH_SIZE", "200"))
+BILLING_OUTBOX_MAX_ATTEMPTS = int(os.getenv("BILLING_OUTBOX_MAX_ATTEMPTS", "10"))